@@ -1,10 +1,11 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, Response
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, Response, abort
 from flask_login import LoginManager
 from functools import wraps
 import yaml
 from file_watcher import Watcher
 import threading
 import logging
+import copy
 import sys
 import flask.cli
 flask.cli.show_server_banner = lambda *args: None
@@ -17,11 +18,18 @@ from auth import *
 from titles import *
 from utils import *
 from library import *
-from automation import AutomationManager, JackettClient
+from file_server import get_game_filepath, send_game_file
+from automation import AutomationManager, JackettClient, SearchResultsMerger, get_qbittorrent_client
+from multiworker import FileLock, SharedChangeLog
+from jobs import JobManager, get_job, get_jobs, fail_interrupted_jobs
+from events import EventBroker, format_active_download
+from planner import SEARCH_TYPES, PLANNER_SEARCH_LIMIT, PLANNER_SEARCH_WORKERS, score_search_result, plan_missing_downloads
+from functools import partial
 import titledb
+import time
 import os
 
-def init():
+def start_watcher():
     global watcher
     global watcher_thread
     # Create and start the file watcher
@@ -31,6 +39,13 @@ def init():
     watcher_thread.daemon = True
     watcher_thread.start()
 
+def init():
+    with app.app_context():
+        with db.engine.begin() as connection:
+            fail_interrupted_jobs(connection)
+
+    start_watcher()
+
     # load initial configuration
     logger.info('Loading initial configuration...')
     reload_conf()
@@ -39,6 +54,42 @@ def init():
     titledb.update_titledb(app_settings)
     load_titledb(app_settings)
 
+def init_worker():
+    """Initialize a worker process of a production server, see wsgi.py.
+
+    Every worker serves requests with its own library model, titledb
+    is updated by the server before starting them. The file watcher runs
+    in the single worker holding the primary lock, another one takes over
+    if it exits. The title IDs touched by library changes are published
+    to the other workers through a shared change log.
+    """
+    library_model.shared_changes = SharedChangeLog(LIBRARY_CHANGES_FILE)
+    logger.info('Loading initial configuration...')
+    reload_conf()
+    load_titledb(app_settings)
+    primary_thread = threading.Thread(target=run_primary_worker)
+    primary_thread.daemon = True
+    primary_thread.start()
+
+def run_primary_worker(sync_interval=5):
+    # blocks until no other worker holds the lock
+    primary_lock.acquire()
+    logger.info(f'Worker {os.getpid()} is now the primary worker, running the file watcher.')
+    start_watcher()
+    sync_watcher()
+    while True:
+        time.sleep(sync_interval)
+        # pick up library paths changed from other workers
+        sync_worker_state()
+
+def sync_worker_state():
+    """Reload what other worker processes changed, no-op with a single process."""
+    if library_model.shared_changes is None:
+        return
+    reload_conf()
+    if library_model.sync():
+        load_titledb(app_settings)
+
 os.makedirs(CONFIG_DIR, exist_ok=True)
 os.makedirs(DATA_DIR, exist_ok=True)
 
@@ -49,11 +100,13 @@ app.config['SECRET_KEY'] = '8accb915665f11dfa15c2db1a4e8026905f57716'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 ## Global variables
-titles_library = []
 app_settings = {}
-# Create a global variable and lock
-scan_in_progress = False
-scan_lock = threading.Lock()
+watcher = None
+watcher_thread = None
+# Files found on disk by scans since the last library update
+scanned_files = set()
+scanned_files_lock = threading.Lock()
+primary_lock = FileLock(PRIMARY_LOCK_FILE)
 
 # Configure logging
 formatter = ColoredFormatter(
@@ -78,6 +131,8 @@ log_werkzeug.addFilter(FilterRemoveDateFromWerkzeugLogs())
 
 
 db.init_app(app)
+job_manager = JobManager(app)
+event_broker = EventBroker(app)
 
 login_manager.init_app(app)
 
@@ -87,9 +142,11 @@ def load_user(user_id):
     return User.query.filter_by(id=user_id).first()
 
 app.register_blueprint(auth_blueprint)
+app.before_request(sync_worker_state)
 
 with app.app_context():
     db.create_all()
+    run_migrations()
     # init users from ENV
     if os.environ.get('USER_ADMIN_NAME') is not None:
         init_user_from_environment(environment_name="USER_ADMIN", admin=True)
@@ -129,7 +186,7 @@ def tinfoil_access(f):
                 # Try authentication, if an admin user is logging in then set the hauth
                 auth_success, auth_error, auth_is_admin =  basic_auth(request)
                 if auth_success and auth_is_admin:
-                    shop_settings = app_settings['shop']
+                    shop_settings = dict(app_settings['shop'])
                     shop_settings['hauth'] = request_hauth
                     set_shop_settings(shop_settings)
                     logger.info(f"Successfully set Hauth value for host {request_host}.")
@@ -180,12 +237,12 @@ def index():
             # enforce client side host verification
             shop["referrer"] = f"https://{request.verified_host}"
             
-        shop["files"] = gen_shop_files(db)
-
-        if app_settings['shop']['encrypt']:
-            return Response(encrypt_shop(shop), mimetype='application/octet-stream')
-
-        return jsonify(shop)
+        encrypt = app_settings['shop']['encrypt']
+        payload, etag = get_shop_payload(db, library_model.generation, shop, encrypt)
+        response = Response(payload, mimetype='application/octet-stream' if encrypt else 'application/json')
+        response.set_etag(etag)
+        # 304 Not Modified for clients sending the ETag of the current shop
+        return response.make_conditional(request)
     
     if all(header in request.headers for header in TINFOIL_HEADERS):
     # if True:
@@ -250,7 +307,7 @@ def settings_page():
 @access_required('admin')
 def get_settings_api():
     reload_conf()
-    settings = app_settings
+    settings = copy.deepcopy(app_settings)
     if settings['shop'].get('hauth'):
         settings['shop']['hauth'] = True
     else:
@@ -260,7 +317,6 @@ def get_settings_api():
 @app.post('/api/settings/titles')
 @access_required('admin')
 def set_titles_api():
-    global titles_library
     settings = request.json
     region = settings['region']
     language = settings['language']
@@ -282,7 +338,8 @@ def set_titles_api():
     reload_conf()
     titledb.update_titledb(app_settings)
     load_titledb(app_settings)
-    titles_library = generate_library()
+    library_model.invalidate()
+    library_model.refresh()
     resp = {
         'success': True,
         'errors': []
@@ -303,7 +360,6 @@ def set_shop_settings_api():
 @app.route('/api/settings/library/paths', methods=['GET', 'POST', 'DELETE'])
 @access_required('admin')
 def library_paths_api():
-    global titles_library
     global watcher
     if request.method == 'POST':
         data = request.json
@@ -322,12 +378,14 @@ def library_paths_api():
         }    
     elif request.method == 'DELETE':
         data = request.json
-        watcher.remove_directory(data['path'])
+        if watcher is not None:
+            watcher.remove_directory(data['path'])
         success, errors = delete_library_path_from_settings(data['path'])
         if success:
             reload_conf()
             success, errors = delete_files_by_library(data['path'])
-            titles_library = generate_library()
+            library_model.invalidate()
+            library_model.refresh()
         resp = {
             'success': success,
             'errors': errors
@@ -394,7 +452,7 @@ def test_automation_connection():
     
     # If config is provided, use it for testing instead of saved settings
     if config:
-        test_settings = app_settings.copy()
+        test_settings = copy.deepcopy(app_settings)
         if 'automation' not in test_settings:
             test_settings['automation'] = {}
         
@@ -422,30 +480,28 @@ def test_automation_connection():
         'message': message
     })
 
-@app.post('/api/jackett/search')
-@access_required('admin')
-def jackett_search():
-    """Search for torrents using Jackett API"""
+def get_search_request():
+    """Search parameters and Jackett client of a search request, or an error response"""
     data = request.json
     query = data.get('query', '')
     search_type = data.get('type', 'base')  # base, update, dlc
     title_id = data.get('title_id', '')
     
     if not query:
-        return jsonify({
+        return None, (jsonify({
             'success': False,
             'message': 'Search query is required'
-        }), 400
+        }), 400)
         
     reload_conf()
     automation_config = app_settings.get('automation', {})
     jackett_config = automation_config.get('jackett', {})
     
     if not jackett_config.get('url'):
-        return jsonify({
+        return None, (jsonify({
             'success': False,
             'message': 'Jackett not configured'
-        }), 400
+        }), 400)
         
     # Create Jackett client
     jackett_client = JackettClient(
@@ -455,9 +511,27 @@ def jackett_search():
     
     # Log the search query for debugging
     logger.info(f"Jackett search: query='{query}', type={search_type}, title_id={title_id}")
+    return (jackett_client, jackett_config, query, search_type, title_id), None
+
+
+def search_jackett(jackett_client, jackett_config, query, limit=150):
+    """Search with the configured search mode"""
+    # Use category 1000 for console games, results are cached for all search types
+    if jackett_config.get('search_mode') == 'indexers':
+        return jackett_client.search_all_indexers(query, category='1000', limit=limit)
+    return jackett_client.search_cached(query, category='1000', limit=limit)
+
+
+@app.post('/api/jackett/search')
+@access_required('admin')
+def jackett_search():
+    """Search for torrents using Jackett API"""
+    search, error_response = get_search_request()
+    if error_response is not None:
+        return error_response
+    jackett_client, jackett_config, query, search_type, title_id = search
     
-    # Use category 1000 for console games
-    success, results = jackett_client.search_api(query, category='1000', limit=150)
+    success, results = search_jackett(jackett_client, jackett_config, query)
     
     if not success:
         logger.error(f"Jackett search failed: {results}")
@@ -467,39 +541,7 @@ def jackett_search():
         }), 500
         
     # Process all results without heavy filtering
-    filtered_results = []
-    for result in results:
-        title = result['title'].lower()
-        
-        # Don't filter out results, just add relevance scoring
-        result['relevance'] = 1.0
-        
-        # Boost relevance for Nintendo Switch content
-        if any(keyword in title for keyword in ['nsw', 'switch', 'nsp', 'nsz', 'xci', 'xcz']):
-            result['relevance'] *= 1.2
-            
-        # Relevance scoring based on search type (but don't exclude)
-        if search_type == 'update':
-            if 'update' in title or 'patch' in title:
-                result['relevance'] *= 1.5
-        elif search_type == 'dlc':
-            if 'dlc' in title:
-                result['relevance'] *= 1.5
-                
-        # Check if title contains the Title ID - big relevance boost
-        if title_id and title_id.lower() in title:
-            result['has_title_id'] = True
-            result['relevance'] *= 2.0
-        else:
-            result['has_title_id'] = False
-            
-        # Format file size
-        if result['size'] > 0:
-            result['size_formatted'] = format_bytes(result['size'])
-        else:
-            result['size_formatted'] = 'Unknown'
-            
-        filtered_results.append(result)
+    filtered_results = [score_search_result(result, search_type, title_id) for result in results]
         
     # Sort by seeders first (most important), then by relevance
     filtered_results.sort(key=lambda x: (x['seeders'], x.get('relevance', 1.0)), reverse=True)
@@ -510,6 +552,47 @@ def jackett_search():
         'total': len(filtered_results)
     })
 
+@app.post('/api/jackett/search/stream')
+@access_required('admin')
+def jackett_search_stream():
+    """Search every Jackett indexer concurrently, streaming results as they come
+
+    The response has one JSON object per line: the new or better results
+    of each indexer as it answers, indexer errors, and a last line once
+    every indexer answered or timed out.
+    """
+    search, error_response = get_search_request()
+    if error_response is not None:
+        return error_response
+    jackett_client, _, query, search_type, title_id = search
+    
+    def generate():
+        merger = SearchResultsMerger()
+        failed = []
+        for indexer, success, results in jackett_client.search_indexers(query, category='1000', limit=150):
+            indexer_title = indexer['title'] if indexer else None
+            if not success:
+                failed.append(indexer_title)
+                yield json.dumps({'type': 'error', 'indexer': indexer_title, 'message': results}) + '\n'
+                continue
+            changed = [score_search_result(result, search_type, title_id) for result in merger.add(results)]
+            yield json.dumps({'type': 'results', 'indexer': indexer_title, 'results': changed}) + '\n'
+        yield json.dumps({'type': 'done', 'total': len(merger.results), 'failed': failed}) + '\n'
+        
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        # let reverse proxies send each indexer results right away
+        'X-Accel-Buffering': 'no',
+    })
+
+def get_qbit_client(qbit_config):
+    """qBittorrent client shared by the requests of this process"""
+    return get_qbittorrent_client(
+        qbit_config['url'],
+        qbit_config.get('username', ''),
+        qbit_config.get('password', '')
+    )
+
 @app.post('/api/automation/download')
 @access_required('admin')
 def download_torrent():
@@ -534,13 +617,7 @@ def download_torrent():
             'message': 'qBittorrent not configured'
         }), 400
         
-    # Create qBittorrent client
-    from automation import QBittorrentClient
-    qbit_client = QBittorrentClient(
-        qbit_config['url'],
-        qbit_config.get('username', ''),
-        qbit_config.get('password', '')
-    )
+    qbit_client = get_qbit_client(qbit_config)
     
     # Use magnet link if provided, otherwise use torrent URL
     url_to_add = magnet_link if magnet_link else torrent_url
@@ -584,13 +661,7 @@ def get_download_progress(info_hash):
             'message': 'qBittorrent not configured'
         }), 400
         
-    # Create qBittorrent client
-    from automation import QBittorrentClient
-    qbit_client = QBittorrentClient(
-        qbit_config['url'],
-        qbit_config.get('username', ''),
-        qbit_config.get('password', '')
-    )
+    qbit_client = get_qbit_client(qbit_config)
     
     # Get torrent progress
     progress_info = qbit_client.get_torrent_progress(info_hash)
@@ -620,35 +691,19 @@ def get_active_downloads():
             'message': 'qBittorrent not configured'
         }), 400
         
-    # Create qBittorrent client
-    from automation import QBittorrentClient
-    qbit_client = QBittorrentClient(
-        qbit_config['url'],
-        qbit_config.get('username', ''),
-        qbit_config.get('password', '')
-    )
+    qbit_client = get_qbit_client(qbit_config)
     
     # Get torrents in our category
     category = qbit_config.get('category', 'nintendo-switch')
-    success, torrents = qbit_client.get_torrents(category=category)
+    success, torrents = qbit_client.sync_torrents(category=category)
     
     if success:
         # Filter to only active downloads
-        active_downloads = []
-        for torrent in torrents:
-            if torrent.get('progress', 0) < 1.0:  # Not complete
-                active_downloads.append({
-                    'hash': torrent.get('hash', ''),
-                    'name': torrent.get('name', ''),
-                    'progress': torrent.get('progress', 0) * 100,
-                    'state': torrent.get('state', 'unknown'),
-                    'eta': torrent.get('eta', 8640000),
-                    'dlspeed': torrent.get('dlspeed', 0),
-                    'size': torrent.get('size', 0),
-                    'downloaded': torrent.get('downloaded', 0),
-                    'num_seeds': torrent.get('num_seeds', 0),
-                    'num_leechs': torrent.get('num_leechs', 0)
-                })
+        active_downloads = [
+            format_active_download(torrent)
+            for torrent in torrents
+            if torrent.get('progress', 0) < 1.0  # Not complete
+        ]
                 
         return jsonify({
             'success': True,
@@ -660,6 +715,17 @@ def get_active_downloads():
             'message': 'Failed to get downloads'
         }), 500
 
+@app.get('/api/events')
+@access_required('admin')
+def events_api():
+    """Stream of active downloads and job progress events"""
+    subscriber = event_broker.subscribe()
+    return Response(event_broker.stream(subscriber), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # let reverse proxies send each event right away
+        'X-Accel-Buffering': 'no',
+    })
+
 @app.post('/api/automation/process-download')
 @access_required('admin')
 def process_download():
@@ -697,7 +763,9 @@ def process_download():
     
     # Create processor instance
     processor = SwitchGameProcessor({
-        'extract_passwords': processing_config.get('extract_passwords', ['', 'switch', 'nintendo'])
+        'extract_passwords': processing_config.get('extract_passwords', ['', 'switch', 'nintendo']),
+        'extract_workers': processing_config.get('extract_workers'),
+        'extract_workers_per_device': processing_config.get('extract_workers_per_device')
     })
     
     # Use processing options from request if provided, otherwise use configured defaults
@@ -718,7 +786,8 @@ def process_download():
         )
         
         # Trigger library scan for the target directory
-        watcher.add_directory(target_library_path)
+        if watcher is not None:
+            watcher.add_directory(target_library_path, get_watcher_backend(target_library_path))
         
         # Build response message
         message_parts = []
@@ -821,7 +890,9 @@ def qbittorrent_webhook():
     
     # Create processor instance
     processor = SwitchGameProcessor({
-        'extract_passwords': processing_config.get('extract_passwords', ['', 'switch', 'nintendo'])
+        'extract_passwords': processing_config.get('extract_passwords', ['', 'switch', 'nintendo']),
+        'extract_workers': processing_config.get('extract_workers'),
+        'extract_workers_per_device': processing_config.get('extract_workers_per_device')
     })
     
     # Process the download
@@ -901,9 +972,7 @@ def upload_file():
 @app.route('/api/titles', methods=['GET'])
 @access_required('shop')
 def get_all_titles():
-    global titles_library
-    if not titles_library:
-        titles_library = generate_library()
+    titles_library = library_model.get_library()
 
     return jsonify({
         'total': len(titles_library),
@@ -923,6 +992,58 @@ def get_missing_content_endpoint():
     return jsonify(missing)
 
 
+@app.post('/api/missing/fetch')
+@access_required('admin')
+def fetch_missing_content_endpoint():
+    """Start a job searching Jackett for all the missing content and queueing the best torrents"""
+    data = request.json or {}
+    dry_run = data.get('dry_run', False)
+    
+    reload_conf()
+    automation_config = app_settings.get('automation', {})
+    jackett_config = automation_config.get('jackett', {})
+    qbit_config = automation_config.get('qbittorrent', {})
+    if not jackett_config.get('url'):
+        return jsonify({'success': False, 'message': 'Jackett not configured'}), 400
+    if not dry_run and not qbit_config.get('url'):
+        return jsonify({'success': False, 'message': 'qBittorrent not configured'}), 400
+        
+    try:
+        options = {
+            'search_types': [t for t in data.get('types', SEARCH_TYPES) if t in SEARCH_TYPES],
+            'workers': int(data.get('concurrency', PLANNER_SEARCH_WORKERS)),
+            'min_seeders': int(data.get('min_seeders', 1)),
+            'require_title_id': bool(data.get('require_title_id', False)),
+        }
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid concurrency or min_seeders'}), 400
+        
+    job_id = job_manager.submit('fetch_missing', partial(
+        run_fetch_missing_job,
+        data.get('library_paths') or None,
+        jackett_config,
+        None if dry_run else qbit_config,
+        automation_config.get('processing', {}).get('download_path'),
+        options
+    ), [])
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+
+def run_fetch_missing_job(library_paths, jackett_config, qbit_config, download_path, options, job):
+    from library import get_missing_content
+    missing = get_missing_content(library_paths)
+    jackett_client = JackettClient(jackett_config['url'], jackett_config.get('api_key'))
+    return plan_missing_downloads(
+        missing,
+        lambda query: search_jackett(jackett_client, jackett_config, query, limit=PLANNER_SEARCH_LIMIT),
+        qbit_client=get_qbit_client(qbit_config) if qbit_config else None,
+        qbit_config=qbit_config,
+        download_path=download_path,
+        progress_callback=job.update,
+        **options
+    )
+
+
 @app.route('/api/titles/<title_id>', methods=['GET'])
 @access_required('shop')
 def get_title_details(title_id):
@@ -1004,7 +1125,7 @@ def preview_library_organization_endpoint():
 @app.route('/api/library/organize/apply', methods=['POST'])
 @access_required('admin')
 def apply_library_organization_endpoint():
-    """Apply library organization changes"""
+    """Start a job applying library organization changes"""
     data = request.json
     changes = data.get('changes', [])
     dry_run = data.get('dry_run', False)
@@ -1013,20 +1134,25 @@ def apply_library_organization_endpoint():
     if not changes:
         return jsonify({'error': 'No changes provided'}), 400
     
+    libraries = [c['library'] for c in changes if c.get('library')]
+    job_id = job_manager.submit('organize', partial(run_organize_job, changes, dry_run, remove_empty_folders), libraries)
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+
+def run_organize_job(changes, dry_run, remove_empty_folders, job):
     from library import apply_library_organization
-    results = apply_library_organization(changes, dry_run, remove_empty_folders)
+    results = apply_library_organization(changes, dry_run, remove_empty_folders, progress_callback=job.update)
     
-    # Regenerate library after organization
+    # Update library after organization
     if not dry_run and results['success']:
-        global titles_library
-        titles_library = generate_library()
+        library_model.refresh()
     
-    return jsonify({
+    return {
         'results': results,
         'total_success': len(results['success']),
         'total_errors': len(results['errors']),
         'total_skipped': len(results.get('skipped', []))
-    })
+    }
 
 
 @app.route('/api/library/duplicates', methods=['GET'])
@@ -1061,7 +1187,7 @@ def find_duplicate_updates_endpoint():
 @app.route('/api/library/duplicates/delete', methods=['POST'])
 @access_required('admin')
 def delete_duplicate_updates_endpoint():
-    """Delete duplicate update files"""
+    """Start a job deleting duplicate update files"""
     data = request.json
     duplicates = data.get('duplicates', [])
     dry_run = data.get('dry_run', False)
@@ -1069,109 +1195,163 @@ def delete_duplicate_updates_endpoint():
     if not duplicates:
         return jsonify({'error': 'No duplicates provided'}), 400
     
+    libraries = get_libraries_of_files(d['filepath'] for d in duplicates)
+    job_id = job_manager.submit('delete_duplicates', partial(run_delete_duplicates_job, duplicates, dry_run), libraries)
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+
+def run_delete_duplicates_job(duplicates, dry_run, job):
     from library import delete_duplicate_updates
-    results = delete_duplicate_updates(duplicates, dry_run)
+    results = delete_duplicate_updates(duplicates, dry_run, progress_callback=job.update)
     
-    # Regenerate library after deletion
+    # Update library after deletion
     if not dry_run and results['deleted']:
-        global titles_library
-        titles_library = generate_library()
+        library_model.refresh()
     
-    return jsonify({
+    return {
         'results': results,
         'total_deleted': len(results['deleted']),
         'total_errors': len(results['errors']),
         'space_freed': sum(d['size'] for d in results['deleted'])
-    })
+    }
+
+
+def get_libraries_of_files(filepaths):
+    """Configured library paths containing the files"""
+    library_paths = app_settings['library']['paths'] or []
+    libraries = set()
+    for filepath in filepaths:
+        for library_path in library_paths:
+            if filepath.startswith(library_path.rstrip(os.sep) + os.sep):
+                libraries.add(library_path)
+    return libraries
 
 
 @app.route('/api/get_game/<int:id>')
 @tinfoil_access
 def serve_game(id):
-    filepath = db.session.query(Files.filepath).filter_by(id=id).first()[0]
-    filedir, filename = os.path.split(filepath)
-    return send_from_directory(filedir, filename)
+    filepath = get_game_filepath(id, library_model.generation)
+    if filepath is None:
+        abort(404)
+    shop_settings = app_settings['shop']
+    return send_game_file(filepath, shop_settings.get('download_offload'), shop_settings.get('download_offload_prefix', ''))
 
 
 @debounce(10)
 def post_library_change():
-    global titles_library
     with app.app_context():
-        # remove missing files
-        remove_missing_files_from_db()
+        # remove missing files, files just found by a scan are not checked again
+        with scanned_files_lock:
+            existing_files = set(scanned_files)
+            scanned_files.clear()
+        library_model.invalidate(remove_missing_files_from_db(existing_files=existing_files, workers=get_walk_workers(app_settings)))
         # update library
-        titles_library = generate_library()
+        library_model.refresh()
 
 
 def scan_library():
+    """Start a scan job for every library path, returns their IDs."""
     logger.info(f'Scanning whole library ...')
     library_paths = app_settings['library']['paths']
     
     if not library_paths:
         logger.info('No library paths configured, nothing to do.')
-        return
-
-    for library_path in library_paths:
-        start_scan_library_path(library_path, update_library=False)
-    
-    post_library_change()
+        return []
 
-def start_scan_library_path(library_path, update_library=True):
-    global scan_in_progress
-    # Acquire the lock before checking and updating the scan status
-    with scan_lock:
-        if scan_in_progress:
-            logger.info('Scan already in progress')
-            return
-        # Set the scan status to in progress
-        scan_in_progress = True
+    return [start_scan_library_path(library_path) for library_path in library_paths]
 
-    scan_library_path(app_settings, library_path)
+def start_scan_library_path(library_path):
+    """Start a scan job for a library path, returns its ID.
 
-    # Ensure the scan status is reset to not in progress, even if an error occurs
-    with scan_lock:
-        scan_in_progress = False
+    A scan still queued for the same path is reused.
+    """
+    return job_manager.submit('scan', partial(run_scan_job, library_path), [library_path], unique=True)
 
-    if update_library:
-        post_library_change()
+def run_scan_job(library_path, job):
+    found_files = scan_library_path(app_settings, library_path, progress_callback=job.update)
+    with scanned_files_lock:
+        scanned_files.update(found_files)
+    post_library_change()
+    return {'library_path': library_path, 'files': len(found_files)}
 
 
 @app.post('/api/library/scan')
 @access_required('admin')
 def scan_library_api():
-    global scan_in_progress
-    # Acquire the lock before checking and updating the scan status
-    if scan_in_progress:
-        logger.info('Scan already in progress')
-        resp = {
-            'success': False,
-            'errors': []
-        } 
-        return resp
-    
     data = request.json
     path = data['path']
 
     if path is None:
-        scan_library()
+        job_ids = scan_library()
     else:
-        start_scan_library_path(path)
+        job_ids = [start_scan_library_path(path)]
 
     resp = {
         'success': True,
+        'job_ids': job_ids,
         'errors': []
     } 
-    return jsonify(resp)
+    return jsonify(resp), 202
+
+@app.get('/api/jobs')
+@access_required('admin')
+def get_jobs_api():
+    statuses = request.args.get('status')
+    jobs = get_jobs(
+        statuses.split(',') if statuses else None,
+        request.args.get('type'),
+        request.args.get('limit', 50, type=int),
+    )
+    return jsonify({'success': True, 'jobs': jobs})
+
+@app.get('/api/jobs/<job_id>')
+@access_required('admin')
+def get_job_api(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'errors': ['Job not found']}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.post('/api/jobs/<job_id>/cancel')
+@access_required('admin')
+def cancel_job_api(job_id):
+    if not job_manager.cancel(job_id):
+        return jsonify({'success': False, 'errors': ['Job is not queued or running']}), 409
+    return jsonify({'success': True, 'errors': []})
+
+@app.get('/api/watcher/metrics')
+@access_required('admin')
+def watcher_metrics_api():
+    if watcher is None:
+        # another worker process runs the watcher
+        return jsonify({'success': True, 'running': False, 'metrics': {}})
+    return jsonify({'success': True, 'running': watcher.running, 'metrics': watcher.get_metrics()})
 
 def reload_conf():
     global app_settings
     global watcher
-    app_settings = load_settings()
+    settings = load_settings()
+    if settings is app_settings:
+        # unchanged since the last reload
+        return
+    app_settings = settings
+    sync_watcher()
+
+def get_watcher_backend(library_path):
+    """Backend set for a library path in settings, None to detect it"""
+    return (app_settings['library'].get('watcher_backends') or {}).get(library_path)
+
+def sync_watcher():
+    """Watch the configured library paths, if the watcher runs in this process."""
+    if watcher is None:
+        return
     # add library paths to watchdog if necessary
-    library_paths = app_settings['library']['paths']
-    if library_paths:
-        for dir in library_paths:
-            watcher.add_directory(dir)
+    library_paths = app_settings['library']['paths'] or []
+    for dir in library_paths:
+        watcher.add_directory(dir, get_watcher_backend(dir))
+    for dir in list(watcher.directories):
+        if dir not in library_paths:
+            watcher.remove_directory(dir)
 
 
 def on_library_change(events):
@@ -1183,7 +1363,7 @@ def on_library_change(events):
             if event.type == 'moved':
                 if file_exists_in_db(event.src_path):
                     # update the path
-                    update_file_path(event.directory, event.src_path, event.dest_path)
+                    library_model.invalidate([update_file_path(event.directory, event.src_path, event.dest_path)])
                 else:
                     # add to the database
                     event.src_path = event.dest_path
@@ -1191,17 +1371,18 @@ def on_library_change(events):
 
             elif event.type == 'deleted':
                 # delete the file from library if it exists
-                delete_file_by_filepath(event.src_path)
+                library_model.invalidate([delete_file_by_filepath(event.src_path)])
 
             elif event.type == 'modified':
-                # can happen if file copy has started before the app was running
-                identify_files_and_add_to_db(event.directory, [event.src_path])
+                # can happen if file copy has started before the app was running,
+                # identified with the created files
+                created_events.append(event)
 
         if created_events:
             directories = list(set(e.directory for e in created_events))
             for library_path in directories:
                 new_files = [e.src_path for e in created_events if e.directory == library_path]
-                identify_files_and_add_to_db(library_path, new_files)
+                identify_files_and_add_to_db(library_path, new_files, workers=get_identification_workers(app_settings), cache=new_identification_cache(app_settings), batch_size=get_db_batch_size(app_settings))
 
     post_library_change()
 
@@ -1,20 +1,69 @@
 import os
 import platform
 import logging
+import re
+import base64
+import io
+import threading
+import time
 import requests
-from typing import Dict, Any, Optional, Tuple, List
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Optional, Tuple, List, Callable
 from urllib.parse import urljoin, urlparse
+from urllib3.exceptions import ReadTimeoutError
 
 logger = logging.getLogger(__name__)
 
+# seconds to wait for qBittorrent to answer
+REQUEST_TIMEOUT = 10
+# seconds Jackett search results are fresh, then returned while refreshed
+JACKETT_CACHE_TTL = 10 * 60
+JACKETT_CACHE_STALE_TTL = 60 * 60
+JACKETT_CACHE_MAX_ENTRIES = 256
+# seconds without an answer before giving up on an indexer, and indexers searched at once
+JACKETT_INDEXER_TIMEOUT = 20
+JACKETT_INDEXER_WORKERS = 8
+
+TORZNAB_ATTR = '{http://torznab.com/schemas/2015/feed}attr'
+# torznab attributes kept in search results: (result key, type)
+TORZNAB_ATTRS = {
+    'size': ('size', int),
+    'seeders': ('seeders', int),
+    'peers': ('leechers', int),
+    'indexer': ('indexer', str),
+    'magneturl': ('magnet_link', str),
+    'infohash': ('info_hash', str),
+}
+# item elements kept in search results
+TORZNAB_ITEM_FIELDS = {'title': 'title', 'link': 'link', 'pubDate': 'publish_date', 'category': 'category'}
+
 
 class ServiceConnectionError(Exception):
     """Raised when a service connection fails"""
     pass
 
 
+class TorznabParseError(Exception):
+    """Raised for a malformed or truncated Torznab feed
+    
+    `results` holds the items parsed before the error.
+    """
+    
+    def __init__(self, message: str, results: list):
+        super().__init__(message)
+        self.results = results
+
+
 class QBittorrentClient:
-    """qBittorrent Web API client with cross-platform support"""
+    """qBittorrent Web API client with cross-platform support
+    
+    A client keeps its session, and its connection, between requests: it
+    logs in on the first request and again only when qBittorrent answers
+    403. Clients shared by the whole process are given by
+    get_qbittorrent_client().
+    """
     
     def __init__(self, url: str, username: str, password: str):
         self.url = url.rstrip('/')
@@ -22,6 +71,11 @@ class QBittorrentClient:
         self.password = password
         self.session = requests.Session()
         self._sid = None
+        self._login_lock = threading.Lock()
+        # torrents by hash, kept up to date with sync/maindata
+        self._sync_lock = threading.Lock()
+        self._rid = 0
+        self._torrents = {}
         
     def _get_api_url(self, endpoint: str) -> str:
         """Build full API URL"""
@@ -29,18 +83,33 @@ class QBittorrentClient:
         
     def login(self) -> bool:
         """Authenticate with qBittorrent"""
-        try:
-            response = self.session.post(
-                self._get_api_url('auth/login'),
-                data={'username': self.username, 'password': self.password}
-            )
-            if response.text == 'Ok.':
-                self._sid = response.cookies.get('SID')
-                return True
-            return False
-        except Exception as e:
-            logger.error(f"Failed to login to qBittorrent: {e}")
-            return False
+        with self._login_lock:
+            try:
+                response = self.session.post(
+                    self._get_api_url('auth/login'),
+                    data={'username': self.username, 'password': self.password},
+                    timeout=REQUEST_TIMEOUT
+                )
+                if response.text == 'Ok.':
+                    self._sid = response.cookies.get('SID') or self.session.cookies.get('SID')
+                    return True
+                return False
+            except Exception as e:
+                logger.error(f"Failed to login to qBittorrent: {e}")
+                return False
+                
+    def _request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """Send an API request, logging in first if needed and again if the session expired"""
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        if not self._sid and not self.login():
+            raise ServiceConnectionError("Failed to authenticate with qBittorrent")
+        response = self.session.request(method, self._get_api_url(endpoint), **kwargs)
+        if response.status_code == 403:
+            # the session expired, or qBittorrent was restarted
+            if not self.login():
+                raise ServiceConnectionError("Failed to authenticate with qBittorrent")
+            response = self.session.request(method, self._get_api_url(endpoint), **kwargs)
+        return response
             
     def test_connection(self) -> Tuple[bool, str]:
         """Test connection and return status with message"""
@@ -69,32 +138,11 @@ class QBittorrentClient:
         except Exception as e:
             return False, f"Unexpected error: {str(e)}"
             
-    def get_torrents(self, category: Optional[str] = None) -> Optional[list]:
-        """Get list of torrents, optionally filtered by category"""
-        if not self._sid and not self.login():
-            return None
-            
-        try:
-            params = {'category': category} if category else {}
-            response = self.session.get(
-                self._get_api_url('torrents/info'),
-                params=params
-            )
-            if response.status_code == 200:
-                return response.json()
-            return None
-        except Exception as e:
-            logger.error(f"Failed to get torrents: {e}")
-            return None
-            
     def set_category(self, torrent_hash: str, category: str) -> bool:
         """Set category for a torrent"""
-        if not self._sid and not self.login():
-            return False
-            
         try:
-            response = self.session.post(
-                self._get_api_url('torrents/setCategory'),
+            response = self._request(
+                'POST', 'torrents/setCategory',
                 data={'hashes': torrent_hash, 'category': category}
             )
             return response.status_code == 200
@@ -115,9 +163,6 @@ class QBittorrentClient:
         Returns:
             Tuple of (success, message, info_hash)
         """
-        if not self._sid and not self.login():
-            return False, "Failed to authenticate with qBittorrent", None
-            
         try:
             data = {
                 'urls': urls,
@@ -131,16 +176,12 @@ class QBittorrentClient:
             if sequential_download:
                 data['sequentialDownload'] = 'true'
                 
-            response = self.session.post(
-                self._get_api_url('torrents/add'),
-                data=data
-            )
+            response = self._request('POST', 'torrents/add', data=data)
             
             if response.status_code == 200:
                 # Extract hash from magnet link if it's a magnet
                 info_hash = None
                 if urls.startswith('magnet:'):
-                    import re
                     hash_match = re.search(r'btih:([a-fA-F0-9]{40})', urls)
                     if hash_match:
                         info_hash = hash_match.group(1).lower()
@@ -154,6 +195,8 @@ class QBittorrentClient:
             else:
                 return False, f"Failed to add torrent: HTTP {response.status_code}", None
                 
+        except ServiceConnectionError as e:
+            return False, str(e), None
         except Exception as e:
             logger.error(f"Failed to add torrent: {e}")
             return False, f"Error adding torrent: {str(e)}", None
@@ -170,29 +213,64 @@ class QBittorrentClient:
             Tuple of (success, torrents_list/error_message)
         """
         try:
-            if not self._sid and not self.login():
-                return False, "Not authenticated"
-                
             params = {}
             if category:
                 params['category'] = category
             if hashes:
                 params['hashes'] = '|'.join(hashes)
                 
-            response = self.session.get(
-                self._get_api_url('torrents/info'),
-                params=params
-            )
+            response = self._request('GET', 'torrents/info', params=params)
             
             if response.status_code == 200:
                 return True, response.json()
             else:
                 return False, f"Failed to get torrents: {response.status_code}"
                 
+        except ServiceConnectionError:
+            return False, "Not authenticated"
         except Exception as e:
             logger.error(f"Failed to get torrents: {e}")
             return False, f"Error getting torrents: {str(e)}"
             
+    def sync_torrents(self, category: Optional[str] = None) -> Tuple[bool, Any]:
+        """Get list of torrents with the incremental sync API
+        
+        qBittorrent only sends what changed since the previous call, the
+        whole list being kept by the client.
+        
+        Args:
+            category: Filter by category
+            
+        Returns:
+            Tuple of (success, torrents_list/error_message)
+        """
+        with self._sync_lock:
+            try:
+                response = self._request('GET', 'sync/maindata', params={'rid': self._rid})
+                if response.status_code != 200:
+                    return False, f"Failed to get torrents: {response.status_code}"
+                data = response.json()
+            except ServiceConnectionError:
+                return False, "Not authenticated"
+            except Exception as e:
+                logger.error(f"Failed to sync torrents: {e}")
+                # start over with a full update
+                self._rid = 0
+                return False, f"Error getting torrents: {str(e)}"
+                
+            if data.get('full_update'):
+                self._torrents = {}
+            for torrent_hash, changes in data.get('torrents', {}).items():
+                self._torrents.setdefault(torrent_hash, {'hash': torrent_hash}).update(changes)
+            for torrent_hash in data.get('torrents_removed', []):
+                self._torrents.pop(torrent_hash, None)
+            self._rid = data.get('rid', 0)
+            
+            return True, [
+                dict(torrent) for torrent in self._torrents.values()
+                if category is None or torrent.get('category') == category
+            ]
+            
     def get_torrent_progress(self, info_hash: str) -> Dict[str, Any]:
         """Get detailed progress information for a specific torrent
         
@@ -226,6 +304,229 @@ class QBittorrentClient:
         return {}
 
 
+# qBittorrent clients shared by the whole process, by configuration
+qbittorrent_clients = {}
+qbittorrent_clients_lock = threading.Lock()
+
+
+def get_qbittorrent_client(url: str, username: str, password: str) -> QBittorrentClient:
+    """Shared client for a qBittorrent configuration
+    
+    Clients of previous configurations of the same server are closed.
+    """
+    key = (url.rstrip('/'), username, password)
+    with qbittorrent_clients_lock:
+        client = qbittorrent_clients.get(key)
+        if client is None:
+            for other_key in [k for k in qbittorrent_clients if k[0] == key[0]]:
+                qbittorrent_clients.pop(other_key).session.close()
+            client = QBittorrentClient(url, username, password)
+            qbittorrent_clients[key] = client
+        return client
+
+
+class InFlightSearch:
+    """Search sent to Jackett, whose result is awaited by identical searches"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SearchCache:
+    """Jackett search results shared by the whole process
+    
+    Results are fresh for `ttl` seconds. For `stale_ttl` more seconds, they
+    are still returned right away while a background thread refreshes them.
+    Identical searches in flight are sent to Jackett once, the other
+    callers waiting for its result. Failed searches are not cached.
+    """
+    
+    def __init__(self, ttl: float = JACKETT_CACHE_TTL, stale_ttl: float = JACKETT_CACHE_STALE_TTL,
+                 max_entries: int = JACKETT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # (results, fetch time) by key, least recently used first
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        
+    def get(self, key: tuple, fetch: Callable[[], Tuple[bool, Any]]) -> Tuple[bool, Any]:
+        """Cached result of `fetch()`, a (success, results/error_message) tuple"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                results, fetched_at = entry
+                age = time.monotonic() - fetched_at
+                if age < self.ttl + self.stale_ttl:
+                    self.entries.move_to_end(key)
+                    if age >= self.ttl and key not in self.in_flight:
+                        # refreshed in the background
+                        flight = self.in_flight[key] = InFlightSearch()
+                        thread = threading.Thread(target=self._fetch, args=(key, fetch, flight))
+                        thread.daemon = True
+                        thread.start()
+                    return True, copy_results(results)
+            flight = self.in_flight.get(key)
+            is_owner = flight is None
+            if is_owner:
+                flight = self.in_flight[key] = InFlightSearch()
+                
+        if is_owner:
+            self._fetch(key, fetch, flight)
+        else:
+            flight.done.wait()
+        success, results = flight.result
+        return success, copy_results(results) if success else results
+        
+    def _fetch(self, key: tuple, fetch: Callable[[], Tuple[bool, Any]], flight: InFlightSearch):
+        try:
+            flight.result = fetch()
+        except Exception as e:
+            logger.error(f"Jackett search error: {e}")
+            flight.result = (False, f"Search error: {str(e)}")
+        with self.lock:
+            success, results = flight.result
+            if success:
+                self.entries[key] = (results, time.monotonic())
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            del self.in_flight[key]
+        flight.done.set()
+        
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def copy_results(results: list) -> list:
+    """Copy of cached results, which callers can change"""
+    return [dict(result) for result in results]
+
+
+jackett_search_cache = SearchCache()
+
+
+def parse_torznab(source, limit: Optional[int] = None) -> list:
+    """Parse a Torznab feed into a list of results
+    
+    The feed is read incrementally, each item being discarded once its
+    fields are extracted, so large feeds are never held in memory. Reading
+    stops after `limit` results.
+    
+    Raises:
+        TorznabParseError: The feed is malformed or truncated before `limit`
+            results, with the results parsed before the error
+    """
+    if isinstance(source, str):
+        source = source.encode()
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+        
+    results = []
+    if limit is not None and limit <= 0:
+        return results
+    result = None
+    channel = None
+    enclosure_url = ''
+    try:
+        for event, element in ET.iterparse(source, events=('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if tag == 'item':
+                    result = {
+                        'title': '',
+                        'link': '',
+                        'size': 0,
+                        'seeders': 0,
+                        'leechers': 0,
+                        'publish_date': '',
+                        'category': '',
+                        'indexer': '',
+                        'magnet_link': '',
+                        'info_hash': ''
+                    }
+                    item_fields = set()
+                    enclosure_url = ''
+                elif tag == 'channel':
+                    channel = element
+                continue
+            if result is None:
+                continue
+            if tag == TORZNAB_ATTR:
+                attr = TORZNAB_ATTRS.get(element.get('name'))
+                if attr is not None:
+                    key, attr_type = attr
+                    value = element.get('value')
+                    try:
+                        result[key] = attr_type(value) if value else attr_type()
+                    except ValueError:
+                        pass
+            elif tag in TORZNAB_ITEM_FIELDS:
+                # the first of repeated elements, like categories
+                if tag not in item_fields:
+                    item_fields.add(tag)
+                    result[TORZNAB_ITEM_FIELDS[tag]] = element.text or ''
+            elif tag == 'enclosure':
+                enclosure_url = element.get('url', '')
+            elif tag == 'item':
+                # Try to get magnet from enclosure if not in attributes
+                if not result['magnet_link'] and enclosure_url.startswith('magnet:'):
+                    result['magnet_link'] = enclosure_url
+                results.append(result)
+                result = None
+                # drop the parsed items from the tree
+                element.clear()
+                if channel is not None:
+                    channel.clear()
+                if limit is not None and len(results) >= limit:
+                    break
+    except ET.ParseError as e:
+        raise TorznabParseError(str(e), results) from e
+        
+    return results
+
+
+def get_info_hash(result: Dict[str, Any]) -> str:
+    """Lowercase hex info hash of a search result, empty if unknown"""
+    info_hash = result.get('info_hash') or ''
+    if not info_hash:
+        match = re.search(r'btih:([a-zA-Z0-9]+)', result.get('magnet_link') or '')
+        info_hash = match.group(1) if match else ''
+    if len(info_hash) == 32:
+        # base32 encoded in some magnet links
+        try:
+            info_hash = base64.b32decode(info_hash.upper()).hex()
+        except ValueError:
+            pass
+    return info_hash.lower()
+
+
+class SearchResultsMerger:
+    """Results of several indexers, one per torrent
+    
+    Torrents are identified by their info hash, or by their title and size
+    when indexers do not give it. The result with the most seeders is kept.
+    """
+    
+    def __init__(self):
+        self.results = {}
+        
+    def add(self, results: list) -> list:
+        """Merge results, returns those new or replacing a previous one"""
+        changed = {}
+        for result in results:
+            key = get_info_hash(result) or f"{result.get('title', '').lower()}:{result.get('size', 0)}"
+            result['key'] = key
+            previous = self.results.get(key)
+            if previous is None or result.get('seeders', 0) > previous.get('seeders', 0):
+                self.results[key] = result
+                changed[key] = result
+        return list(changed.values())
+
+
 class JackettClient:
     """Jackett API client for torrent searching"""
     
@@ -309,11 +610,15 @@ class JackettClient:
         Returns:
             Tuple of (success, results/error_message)
         """
+        return self._search('all', query, category, limit, timeout=60)
+        
+    def _search(self, indexer_id: str, query: str, category: Optional[str],
+                limit: int, timeout: float) -> Tuple[bool, Any]:
         if not self.api_key:
             return False, "API key not configured"
             
         try:
-            api_url = f"{self.url}/api/v2.0/indexers/all/results/torznab/api"
+            api_url = f"{self.url}/api/v2.0/indexers/{indexer_id}/results/torznab/api"
             params = {
                 'apikey': self.api_key,
                 't': 'search',
@@ -324,76 +629,149 @@ class JackettClient:
             if category:
                 params['cat'] = category
                 
-            response = self.session.get(api_url, params=params, timeout=60)
-            
-            if response.status_code == 200:
-                # Parse the XML response
-                results = self._parse_torznab_response(response.text)
-                return True, results
-            elif response.status_code == 401:
-                return False, "Invalid API key"
-            else:
-                return False, f"Search failed: {response.status_code}"
-                
-        except requests.exceptions.Timeout:
+            # the feed is parsed while it is downloaded
+            with self.session.get(api_url, params=params, timeout=timeout, stream=True) as response:
+                if response.status_code == 200:
+                    response.raw.decode_content = True
+                    results = self._parse_torznab_response(response.raw, limit)
+                    return True, results
+                elif response.status_code == 401:
+                    return False, "Invalid API key"
+                else:
+                    return False, f"Search failed: {response.status_code}"
+                    
+        except (requests.exceptions.Timeout, ReadTimeoutError):
             return False, "Search timeout - request took too long"
+        except TorznabParseError as e:
+            # partial results are not cached as a complete answer
+            logger.error(f"Error parsing Torznab response of {indexer_id} after {len(e.results)} results: {e}")
+            return False, f"Invalid response: {str(e)}"
         except Exception as e:
             logger.error(f"Jackett search error: {e}")
             return False, f"Search error: {str(e)}"
             
-    def _parse_torznab_response(self, xml_content: str) -> list:
-        """Parse Torznab XML response into list of results"""
-        results = []
+    def get_indexers(self) -> Tuple[bool, Any]:
+        """List the configured indexers
         
+        Returns:
+            Tuple of (success, list of {'id', 'title'} dicts/error_message)
+        """
+        if not self.api_key:
+            return False, "API key not configured"
+            
         try:
-            import xml.etree.ElementTree as ET
-            root = ET.fromstring(xml_content)
-            
-            # Find all items in the RSS feed
-            for item in root.findall('.//item'):
-                result = {
-                    'title': item.findtext('title', ''),
-                    'link': item.findtext('link', ''),
-                    'size': 0,
-                    'seeders': 0,
-                    'leechers': 0,
-                    'publish_date': item.findtext('pubDate', ''),
-                    'category': item.findtext('category', ''),
-                    'indexer': '',
-                    'magnet_link': '',
-                    'info_hash': ''
-                }
-                
-                # Parse torznab attributes
-                for attr in item.findall('.//torznab:attr', {'torznab': 'http://torznab.com/schemas/2015/feed'}):
-                    name = attr.get('name')
-                    value = attr.get('value')
-                    
-                    if name == 'size':
-                        result['size'] = int(value) if value else 0
-                    elif name == 'seeders':
-                        result['seeders'] = int(value) if value else 0
-                    elif name == 'peers':
-                        result['leechers'] = int(value) if value else 0
-                    elif name == 'indexer':
-                        result['indexer'] = value
-                    elif name == 'magneturl':
-                        result['magnet_link'] = value
-                    elif name == 'infohash':
-                        result['info_hash'] = value
-                        
-                # Try to get magnet from enclosure if not in attributes
-                if not result['magnet_link']:
-                    enclosure = item.find('enclosure')
-                    if enclosure and enclosure.get('url', '').startswith('magnet:'):
-                        result['magnet_link'] = enclosure.get('url')
-                        
-                results.append(result)
+            response = self.session.get(
+                f"{self.url}/api/v2.0/indexers/all/results/torznab/api",
+                params={'apikey': self.api_key, 't': 'indexers', 'configured': 'true'},
+                timeout=10
+            )
+            if response.status_code == 401:
+                return False, "Invalid API key"
+            if response.status_code != 200:
+                return False, f"Failed to list indexers: {response.status_code}"
                 
+            root = ET.fromstring(response.content)
+            return True, [
+                {'id': indexer.get('id'), 'title': indexer.findtext('title') or indexer.get('id')}
+                for indexer in root.iter('indexer')
+                if indexer.get('configured', 'true') == 'true'
+            ]
         except Exception as e:
-            logger.error(f"Error parsing Torznab response: {e}")
+            logger.error(f"Failed to list Jackett indexers: {e}")
+            return False, f"Error listing indexers: {str(e)}"
+            
+    def search_indexer(self, indexer: Dict[str, str], query: str, category: Optional[str] = None,
+                       limit: int = 50, timeout: float = JACKETT_INDEXER_TIMEOUT) -> Tuple[bool, Any]:
+        """Search a single indexer, with results cached by jackett_search_cache"""
+        def search():
+            success, results = self._search(indexer['id'], query, category, limit, timeout)
+            if success:
+                for result in results:
+                    result['indexer'] = result['indexer'] or indexer['title']
+            return success, results
+            
+        key = (self.url, self.api_key, indexer['id'], ' '.join(query.lower().split()), category, limit)
+        return jackett_search_cache.get(key, search)
+        
+    def search_indexers(self, query: str, category: Optional[str] = None, limit: int = 50,
+                        timeout: float = JACKETT_INDEXER_TIMEOUT, workers: int = JACKETT_INDEXER_WORKERS):
+        """Search every configured indexer concurrently
+        
+        A slow or dead indexer only delays its own results. The whole search
+        takes at most `timeout` seconds, the indexers that have not answered
+        by then, even if they are still sending data, are reported as timed
+        out.
+        
+        Yields:
+            (indexer, success, results/error_message) as each indexer answers,
+            indexer being None if indexers could not be listed
+        """
+        success, indexers = jackett_search_cache.get((self.url, self.api_key, 'indexers'), self.get_indexers)
+        if not success:
+            yield None, False, indexers
+            return
             
-        return results
+        deadline = time.monotonic() + timeout
+        executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(indexers))))
+        try:
+            futures = {
+                executor.submit(self.search_indexer, indexer, query, category, limit, timeout): indexer
+                for indexer in indexers
+            }
+            pending = set(futures)
+            while pending:
+                # the read timeout of each request only bounds the gaps between reads
+                done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    yield (futures[future], *future.result())
+            for future in pending:
+                yield futures[future], False, f"Search timeout - no answer within {timeout}s"
+        finally:
+            # searches not started yet are dropped if the caller stops early
+            executor.shutdown(wait=False, cancel_futures=True)
+            
+    def search_all_indexers(self, query: str, category: Optional[str] = None, limit: int = 50,
+                            timeout: float = JACKETT_INDEXER_TIMEOUT) -> Tuple[bool, Any]:
+        """Search every configured indexer concurrently, merging their results
+        
+        Returns:
+            Tuple of (success, results/error_message), successful if any
+            indexer answered
+        """
+        merger = SearchResultsMerger()
+        errors = []
+        for indexer, success, results in self.search_indexers(query, category, limit, timeout):
+            if success:
+                merger.add(results)
+            else:
+                errors.append(f"{indexer['title']}: {results}" if indexer else results)
+        if errors and not merger.results:
+            return False, '; '.join(errors)
+        return True, list(merger.results.values())
+        
+    def search_cached(self, query: str, category: Optional[str] = None,
+                      limit: int = 50) -> Tuple[bool, Any]:
+        """Search using Jackett API, with results cached by jackett_search_cache
+        
+        Returns:
+            Tuple of (success, results/error_message)
+        """
+        key = (self.url, self.api_key, ' '.join(query.lower().split()), category, limit)
+        return jackett_search_cache.get(key, lambda: self.search_api(query, category, limit))
+        
+    def _parse_torznab_response(self, source, limit: Optional[int] = None) -> list:
+        """Parse a Torznab XML response into a list of results
+        
+        Args:
+            source: XML content, or a binary file-like object read incrementally
+            limit: Stop after this many results
+            
+        Raises:
+            TorznabParseError: The feed is malformed or truncated
+        """
+        return parse_torznab(source, limit)
 
 
 class AutomationManager:
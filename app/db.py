@@ -1,7 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm.exc import NoResultFound
 from flask_login import UserMixin
-import json, os
+from concurrent.futures import ThreadPoolExecutor
+import json, os, time
 import logging
 
 # Retrieve main logger
@@ -15,17 +16,45 @@ def to_dict(db_results):
 
 class Files(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    filepath = db.Column(db.String)
-    library = db.Column(db.String)
+    filepath = db.Column(db.String, unique=True, index=True)
+    library = db.Column(db.String, index=True)
     folder = db.Column(db.String)
     filename = db.Column(db.String)
-    title_id = db.Column(db.String)
-    app_id = db.Column(db.String)
+    title_id = db.Column(db.String, index=True)
+    app_id = db.Column(db.String, index=True)
     type = db.Column(db.String)
     version = db.Column(db.String)
     extension = db.Column(db.String)
     size = db.Column(db.Integer)
-    identification = db.Column(db.String)
+    identification = db.Column(db.String, index=True)
+
+class IdentificationCache(db.Model):
+    # CNMT read from a file, reused while the file size, mtime and inode match
+    id = db.Column(db.Integer, primary_key=True)
+    filepath = db.Column(db.String, index=True)
+    size = db.Column(db.Integer, index=True)
+    mtime = db.Column(db.Integer)  # nanoseconds
+    inode = db.Column(db.String)  # can overflow SQLite integers on some filesystems
+    partial_hash = db.Column(db.String)
+    app_id = db.Column(db.String)
+    version = db.Column(db.Integer)
+    type = db.Column(db.String)
+
+class Job(db.Model):
+    # background job, see jobs.py
+    id = db.Column(db.String, primary_key=True)
+    type = db.Column(db.String, index=True)
+    libraries = db.Column(db.String)  # JSON list of the library paths the job works on
+    status = db.Column(db.String, index=True)
+    progress = db.Column(db.Integer, default=0)
+    total = db.Column(db.Integer, default=0)
+    message = db.Column(db.String)
+    result = db.Column(db.String)  # JSON
+    error = db.Column(db.String)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.Float)
+    started_at = db.Column(db.Float)
+    finished_at = db.Column(db.Float)
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -57,41 +86,159 @@ class User(UserMixin, db.Model):
             return self.has_backup_access()
 
 
+def migrate_files_indexes(connection):
+    # older databases can have several rows for the same file, keep the latest one
+    connection.exec_driver_sql(
+        "DELETE FROM files WHERE id NOT IN (SELECT MAX(id) FROM files GROUP BY filepath)"
+    )
+    connection.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_files_filepath ON files (filepath)")
+    for column in ("library", "title_id", "app_id", "identification"):
+        connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_files_{column} ON files ({column})")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_identification_cache_filepath ON identification_cache (filepath)"
+    )
+
+def migrate_identification_cache_size_index(connection):
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_identification_cache_size ON identification_cache (size)"
+    )
+
+# Schema migrations, in order. The number of migrations applied to a
+# database is stored in its user_version, new migrations go at the end.
+MIGRATIONS = [
+    migrate_files_indexes,
+    migrate_identification_cache_size_index,
+]
+
+def run_migrations():
+    """Upgrade the database schema in place, to run after db.create_all()."""
+    with db.engine.begin() as connection:
+        schema_version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        for n, migration in enumerate(MIGRATIONS[schema_version:], start=schema_version + 1):
+            logger.info(f'Applying database migration {n}/{len(MIGRATIONS)}: {migration.__name__}')
+            migration(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {n}")
+
 def file_exists_in_db(filepath):
     return Files.query.filter_by(filepath=filepath).first() is not None
 
 def add_to_titles_db(library, file_info):
-    filepath = file_info["filepath"]
-    filedir = file_info["filedir"].replace(library, '')
-    if file_exists_in_db(filepath):
-        existing_entry = Files.query.filter_by(filepath=filepath).all()
-        existing_entry_data = to_dict(existing_entry[0])
-        current_identification = existing_entry_data["identification"]
-        new_identification = file_info["identification"]
-        if new_identification == current_identification:
-            return
-        else:
-            # delete old entry and replace with updated one
-            Files.query.filter_by(filepath=filepath).delete()
+    """Add an identified file, returns the title IDs whose files changed."""
+    return list(add_many_to_titles_db(library, [file_info]))
 
-    new_title = Files(
-        filepath = filepath,
-        library = library,
-        folder = filedir,
-        filename = file_info["filename"],
-        title_id = file_info["title_id"],
-        app_id = file_info["app_id"],
-        type = file_info["type"],
-        version = file_info["version"],
-        extension = file_info["extension"],
-        size = file_info["size"],
-        identification = file_info["identification"],
+def is_same_file_entry(existing_entry, file_info):
+    return existing_entry.identification == file_info["identification"] and all(
+        str(getattr(existing_entry, field)) == str(file_info[field])
+        for field in ("title_id", "app_id", "type", "version", "size")
     )
-    db.session.add(new_title)
 
-    db.session.commit()
+def add_many_to_titles_db(library, file_infos, batch_size=500):
+    """Add identified files in a single transaction, returns the title IDs whose files changed.
+
+    Existing rows are looked up with one query per batch of `batch_size`
+    files and the batch is flushed before the next one.
+    """
+    touched_title_ids = set()
+    # the last identification of a path wins
+    file_infos = list({file_info["filepath"]: file_info for file_info in file_infos}.values())
+    try:
+        for i in range(0, len(file_infos), batch_size):
+            batch = file_infos[i:i + batch_size]
+            existing_entries = {
+                f.filepath: f
+                for f in Files.query.filter(Files.filepath.in_([file_info["filepath"] for file_info in batch]))
+            }
+            for file_info in batch:
+                existing_entry = existing_entries.get(file_info["filepath"])
+                if existing_entry is not None:
+                    if is_same_file_entry(existing_entry, file_info):
+                        continue
+                    # update old entry in place, file paths are unique
+                    touched_title_ids.add(existing_entry.title_id)
+                    entry = existing_entry
+                else:
+                    entry = Files(filepath = file_info["filepath"])
+                    db.session.add(entry)
+                touched_title_ids.add(file_info["title_id"])
+                entry.library = library
+                entry.folder = file_info["filedir"].replace(library, '')
+                entry.filename = file_info["filename"]
+                entry.title_id = file_info["title_id"]
+                entry.app_id = file_info["app_id"]
+                entry.type = file_info["type"]
+                entry.version = file_info["version"]
+                entry.extension = file_info["extension"]
+                entry.size = file_info["size"]
+                entry.identification = file_info["identification"]
+            db.session.flush()
+        db.session.commit()
+    except Exception as e:
+        try:
+            db.session.rollback()
+        except Exception as rollback_error:
+            # the error of the batch is the one raised
+            logger.error(f"Rollback failed after {e}: {rollback_error}")
+        raise
+    return touched_title_ids
+
+def get_identification_cache_entries(filepaths, sizes, chunk_size=500):
+    """Cache entries of these file paths or of files of these sizes"""
+    entries = {}
+    for column, values in ((IdentificationCache.filepath, list(set(filepaths))), (IdentificationCache.size, list(set(sizes)))):
+        # chunked to stay under SQLite's bound parameters limit
+        for i in range(0, len(values), chunk_size):
+            for r in IdentificationCache.query.filter(column.in_(values[i:i + chunk_size])):
+                entries[r.id] = to_dict(r)
+    return list(entries.values())
+
+def prune_identification_cache(library_path, file_stats, kept_paths=(), chunk_size=500):
+    """Delete the cache entries of the files of a library that are gone or changed.
+
+    `file_stats` holds the stats of the files found on disk, entries under
+    `kept_paths` are kept. Returns the number of deleted entries.
+    """
+    kept_prefixes = tuple(path.rstrip(os.sep) + os.sep for path in kept_paths)
+    prefix = library_path.rstrip(os.sep) + os.sep
+    stale_ids = []
+    entries = db.session.query(IdentificationCache.id, IdentificationCache.filepath, IdentificationCache.size,
+                               IdentificationCache.mtime, IdentificationCache.inode)
+    for entry_id, filepath, size, mtime, inode in entries.filter(IdentificationCache.filepath.startswith(prefix, autoescape=True)):
+        if file_stats.get(filepath) == (size, mtime, inode) or filepath in kept_paths or filepath.startswith(kept_prefixes):
+            continue
+        stale_ids.append(entry_id)
+    try:
+        for i in range(0, len(stale_ids), chunk_size):
+            IdentificationCache.query.filter(IdentificationCache.id.in_(stale_ids[i:i + chunk_size])).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"An error occurred while pruning the identification cache: {str(e)}")
+        return 0
+    return len(stale_ids)
+
+def add_to_identification_cache(filepath, file_stat, partial_hash, cnmt):
+    """Cache the CNMT read from a file, saved with the next commit."""
+    size, mtime, inode = file_stat
+    app_id, version, app_type = cnmt
+    IdentificationCache.query.filter_by(filepath=filepath).delete()
+    db.session.add(IdentificationCache(
+        filepath = filepath,
+        size = size,
+        mtime = mtime,
+        inode = inode,
+        partial_hash = partial_hash,
+        app_id = app_id,
+        version = version,
+        type = app_type,
+    ))
+
+def move_identification_cache_entry(entry_id, filepath):
+    """Point a cache entry to the new path of a moved file, saved with the next commit."""
+    IdentificationCache.query.filter_by(filepath=filepath).filter(IdentificationCache.id != entry_id).delete()
+    IdentificationCache.query.filter_by(id=entry_id).update({'filepath': filepath})
 
 def update_file_path(library, old_path, new_path):
+    """Update the path of a moved file, returns its title ID if it was found."""
     try:
         # Find the file entry in the database using the old_path
         file_entry = Files.query.filter_by(filepath=old_path).one()
@@ -117,6 +264,7 @@ def update_file_path(library, old_path, new_path):
         db.session.commit()
 
         logger.info(f"File path updated successfully from {old_path} to {new_path}.")
+        return file_entry.title_id
     
     except NoResultFound:
         logger.warning(f"No file entry found for the path: {old_path}.")
@@ -130,6 +278,16 @@ def get_all_titles_from_db():
     results = Files.query.all()
     return [to_dict(r) for r in results]
 
+def get_files_by_title_ids(title_ids, chunk_size=500):
+    title_ids = list(title_ids)
+    files_by_title = {}
+    # chunked to stay under SQLite's bound parameters limit
+    for i in range(0, len(title_ids), chunk_size):
+        results = Files.query.filter(Files.title_id.in_(title_ids[i:i + chunk_size])).all()
+        for r in results:
+            files_by_title.setdefault(r.title_id, []).append(to_dict(r))
+    return files_by_title
+
 def get_all_title_files(title_id):
     title_id = title_id.upper()
     results = Files.query.filter_by(title_id=title_id).all()
@@ -167,9 +325,11 @@ def delete_files_by_library(library_path):
         return success, errors
 
 def delete_file_by_filepath(filepath):
+    """Remove a file from the database, returns its title ID if it was found."""
     try:
         # Find file with the given filepath
         file_to_delete = Files.query.filter_by(filepath=filepath).one()
+        title_id = file_to_delete.title_id
         
         # Delete file
         db.session.delete(file_to_delete)
@@ -178,6 +338,7 @@ def delete_file_by_filepath(filepath):
         db.session.commit()
         
         logger.info(f"File '{filepath}' removed from database.")
+        return title_id
     except NoResultFound:
         logger.info(f"File '{filepath}' not present in database.")
     except Exception as e:
@@ -185,29 +346,53 @@ def delete_file_by_filepath(filepath):
         db.session.rollback()
         logger.error(f"An error occurred while removing the file path: {str(e)}")
 
-def remove_missing_files_from_db():
+def get_library_files_state(library_path):
+    """Identification method and size of the files of a library path, by file path."""
+    results = db.session.query(Files.filepath, Files.identification, Files.size).filter_by(library=library_path).all()
+    return {filepath: (identification, size) for filepath, identification, size in results}
+
+def delete_files_by_filepaths(filepaths, chunk_size=500):
+    """Remove files from the database in chunks, returns the title IDs of the removed files."""
+    filepaths = list(filepaths)
+    title_ids = set()
     try:
-        # Query all entries in the Files table
-        files = Files.query.all()
-        
-        # List to keep track of IDs to be deleted
-        ids_to_delete = []
-        
-        for file_entry in files:
-            # Check if the file exists on disk
-            if not os.path.exists(file_entry.filepath):
-                # If the file does not exist, mark this entry for deletion
-                ids_to_delete.append(file_entry.id)
-                logger.debug(f"File not found, marking file for deletion: {file_entry.filepath}")
-        
-        # Delete all marked entries from the database
-        if ids_to_delete:
-            Files.query.filter(Files.id.in_(ids_to_delete)).delete(synchronize_session=False)
-            db.session.commit()
-            logger.info(f"Deleted {len(ids_to_delete)} files from the database.")
-        else:
-            logger.debug("No files were deleted. All files are present on disk.")
-    
+        for i in range(0, len(filepaths), chunk_size):
+            chunk = filepaths[i:i + chunk_size]
+            title_ids.update(t for (t,) in db.session.query(Files.title_id).filter(Files.filepath.in_(chunk)).distinct())
+            Files.query.filter(Files.filepath.in_(chunk)).delete(synchronize_session=False)
+        db.session.commit()
     except Exception as e:
-        db.session.rollback()  # Rollback in case of an error
-        logger.error(f"An error occurred while removing missing files: {str(e)}")
\ No newline at end of file
+        db.session.rollback()
+        logger.error(f"An error occurred while removing files: {str(e)}")
+        title_ids.clear()
+    return title_ids
+
+def remove_missing_files_from_db(existing_files=None, workers=8, chunk_size=500):
+    """Remove files missing on disk, returns the title IDs of removed files.
+
+    Files in `existing_files`, e.g. listed by a library scan, are not
+    checked again. The others are checked by a pool of `workers` threads,
+    as each check can be a network round trip.
+    """
+    start = time.perf_counter()
+    existing_files = existing_files or set()
+    try:
+        filepaths = [f for (f,) in db.session.query(Files.filepath) if f not in existing_files]
+    except Exception as e:
+        logger.error(f"An error occurred while removing missing files: {str(e)}")
+        return set()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        exists = list(executor.map(os.path.exists, filepaths, chunksize=64))
+    missing_files = [f for f, file_exists in zip(filepaths, exists) if not file_exists]
+    for filepath in missing_files:
+        logger.debug(f"File not found, marking file for deletion: {filepath}")
+
+    title_ids = set()
+    if missing_files:
+        title_ids = delete_files_by_filepaths(missing_files, chunk_size)
+        logger.info(f"Deleted {len(missing_files)} files from the database.")
+    else:
+        logger.debug("No files were deleted. All files are present on disk.")
+    logger.info(f"Checked {len(filepaths)} files for removal in {time.perf_counter() - start:.2f}s ({len(existing_files)} known from scans).")
+    return title_ids
@@ -0,0 +1,190 @@
+"""Server-Sent Events pushed to the browser: downloads and job progress"""
+from db import *
+from jobs import ACTIVE_JOB_STATUSES, job_to_dict
+from settings import load_settings
+from automation import get_qbittorrent_client
+import threading
+import queue
+import json
+import time
+import logging
+
+# Retrieve main logger
+logger = logging.getLogger('main')
+
+# seconds between polls of qBittorrent and of the job table
+DOWNLOADS_POLL_INTERVAL = 2
+JOBS_POLL_INTERVAL = 1
+# seconds between comments sent on idle streams, closed streams are detected when writing
+KEEPALIVE_INTERVAL = 15
+# events waiting to be sent to a stream, a slower client is disconnected and reconnects
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+def format_active_download(torrent):
+    return {
+        'hash': torrent.get('hash', ''),
+        'name': torrent.get('name', ''),
+        'progress': torrent.get('progress', 0) * 100,
+        'state': torrent.get('state', 'unknown'),
+        'eta': torrent.get('eta', 8640000),
+        'dlspeed': torrent.get('dlspeed', 0),
+        'size': torrent.get('size', 0),
+        'downloaded': torrent.get('downloaded', 0),
+        'num_seeds': torrent.get('num_seeds', 0),
+        'num_leechs': torrent.get('num_leechs', 0)
+    }
+
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+class EventBroker:
+    """Events shared by all the streams open in this process.
+
+    A single poller thread runs while streams are open. It queries
+    qBittorrent once for all of them and publishes only the downloads that
+    changed, new streams first get the full list. Jobs are read from the
+    database, so the progress of jobs run by other worker processes is
+    also published.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.thread = None
+        # active downloads by hash, None until the first poll
+        self.downloads = None
+        self.downloads_status = None
+        # last published (status, progress, total, message) and job by job ID
+        self.jobs = {}
+        self.jobs_polled_at = None
+
+    def subscribe(self):
+        """Queue of the events for a new stream, to close with unsubscribe()"""
+        subscriber = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            if self.downloads is not None:
+                subscriber.put(('downloads', self._downloads_event(list(self.downloads.values()), [], full=True)))
+            for _, job in self.jobs.values():
+                if job['status'] in ACTIVE_JOB_STATUSES:
+                    subscriber.put(('job', job))
+            self.subscribers.add(subscriber)
+            if self.thread is None:
+                self.jobs_polled_at = time.time()
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def stream(self, subscriber):
+        """Body of an event stream response"""
+        try:
+            # browsers reconnect after 5 seconds
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = subscriber.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is None:
+                    return
+                yield format_event(*event)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _publish(self, name, data):
+        """Queue an event for every stream, with the lock held."""
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.put_nowait((name, data))
+            except queue.Full:
+                # the client reconnects and gets the current state
+                self.subscribers.discard(subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(None)
+
+    def _downloads_event(self, changed, removed, full=False):
+        return dict(self.downloads_status, changed=changed, removed=removed, full=full)
+
+    def _run(self):
+        next_downloads_poll = 0
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    # the state is outdated by the time the next stream opens
+                    self.thread = None
+                    self.downloads = None
+                    self.downloads_status = None
+                    self.jobs = {}
+                    return
+            try:
+                with self.app.app_context():
+                    self.poll_jobs()
+                if time.monotonic() >= next_downloads_poll:
+                    next_downloads_poll = time.monotonic() + DOWNLOADS_POLL_INTERVAL
+                    self.poll_downloads()
+            except Exception as e:
+                logger.error(f'Failed to poll events: {e}')
+            time.sleep(JOBS_POLL_INTERVAL)
+
+    def poll_jobs(self):
+        """Publish the jobs that changed since the last poll."""
+        polled_at = time.time()
+        # finished_at is set by any worker process, allow some delay
+        finished_since = self.jobs_polled_at - JOBS_POLL_INTERVAL
+        jobs = Job.query.filter(db.or_(Job.status.in_(ACTIVE_JOB_STATUSES), Job.finished_at >= finished_since)).all()
+        with self.lock:
+            seen_jobs = {}
+            for job in jobs:
+                state = (job.status, job.progress, job.total, job.message)
+                previous = self.jobs.get(job.id)
+                if previous is not None and previous[0] == state:
+                    seen_jobs[job.id] = previous
+                    continue
+                job_dict = job_to_dict(job)
+                seen_jobs[job.id] = (state, job_dict)
+                self._publish('job', job_dict)
+            self.jobs = seen_jobs
+        self.jobs_polled_at = polled_at
+
+    def poll_downloads(self):
+        """Publish the active downloads that changed since the last poll."""
+        qbit_config = load_settings().get('automation', {}).get('qbittorrent', {})
+        if not qbit_config.get('url'):
+            self._set_downloads({}, {'configured': False, 'error': None})
+            return
+        qbit_client = get_qbittorrent_client(qbit_config['url'], qbit_config.get('username', ''), qbit_config.get('password', ''))
+        # only the torrents changed since the previous poll are sent by qBittorrent
+        success, torrents = qbit_client.sync_torrents(category=qbit_config.get('category', 'nintendo-switch'))
+        if not success:
+            self._set_downloads(self.downloads or {}, {'configured': True, 'error': 'Failed to get downloads'})
+            return
+        downloads = {
+            torrent.get('hash', ''): format_active_download(torrent)
+            for torrent in torrents
+            if torrent.get('progress', 0) < 1.0  # Not complete
+        }
+        self._set_downloads(downloads, {'configured': True, 'error': None})
+
+    def _set_downloads(self, downloads, status):
+        with self.lock:
+            previous = self.downloads
+            status_changed = status != self.downloads_status
+            self.downloads = downloads
+            self.downloads_status = status
+            if previous is None:
+                self._publish('downloads', self._downloads_event(list(downloads.values()), [], full=True))
+                return
+            changed = [download for download_hash, download in downloads.items() if previous.get(download_hash) != download]
+            removed = [download_hash for download_hash in previous if download_hash not in downloads]
+            if changed or removed or status_changed:
+                self._publish('downloads', self._downloads_event(changed, removed))
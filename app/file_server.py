@@ -0,0 +1,195 @@
+from db import *
+from flask import request, Response, abort
+from urllib.parse import quote
+import os
+import secrets
+import threading
+import logging
+
+# Retrieve main logger
+logger = logging.getLogger('main')
+
+# Requests with more ranges are answered with the whole file
+MAX_RANGES = 64
+CHUNK_SIZE = 1024 * 1024
+
+# Game file paths by file ID for the current library generation
+game_paths_lock = threading.Lock()
+game_paths = {}
+game_paths_generation = None
+
+
+def get_game_filepath(file_id, generation):
+    """Path of a game file, cached until the library generation changes."""
+    global game_paths_generation
+    with game_paths_lock:
+        if game_paths_generation != generation:
+            # file IDs can be reused after a library change
+            game_paths.clear()
+            game_paths_generation = generation
+        if file_id in game_paths:
+            return game_paths[file_id]
+    result = db.session.query(Files.filepath).filter_by(id=file_id).first()
+    filepath = result[0] if result is not None else None
+    with game_paths_lock:
+        if game_paths_generation == generation and filepath is not None:
+            game_paths[file_id] = filepath
+    return filepath
+
+
+def parse_range_header(range_header, size):
+    """Byte ranges of a Range header as (start, end) tuples, end included.
+
+    Returns None if the header is missing, malformed or has too many
+    ranges, in which case the whole file is sent, and an empty list if no
+    range can be satisfied.
+    """
+    if not range_header:
+        return None
+    unit, _, ranges_spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or not ranges_spec:
+        return None
+    specs = ranges_spec.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.strip().partition('-')
+        if not dash:
+            return None
+        try:
+            if not first:
+                # suffix range, the last bytes of the file
+                suffix_length = int(last)
+                if suffix_length <= 0:
+                    continue
+                start, end = max(size - suffix_length, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < 0 or start >= size:
+            continue
+        ranges.append((start, end))
+    return ranges
+
+
+def read_file_range(f, start, length):
+    f.seek(start)
+    while length > 0:
+        chunk = f.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            break
+        length -= len(chunk)
+        yield chunk
+
+
+def send_file_range(f, start, length, size):
+    """Body sending `length` bytes of a file from `start`.
+
+    Uses the file wrapper of the WSGI server, which can send the file with
+    os.sendfile, when the server stops at Content-Length or the range
+    ends with the file.
+    """
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    server = request.environ.get('SERVER_SOFTWARE', '')
+    if file_wrapper is not None and (start + length == size or server.startswith('gunicorn')):
+        f.seek(start)
+        return file_wrapper(f, CHUNK_SIZE)
+    return close_after(read_file_range(f, start, length), f)
+
+
+def close_after(chunks, f):
+    try:
+        yield from chunks
+    finally:
+        f.close()
+
+
+def multipart_range_header(boundary, start, end, size):
+    return (
+        f'--{boundary}\r\n'
+        'Content-Type: application/octet-stream\r\n'
+        f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+    ).encode()
+
+
+def send_multipart_ranges(f, ranges, size, boundary):
+    try:
+        for start, end in ranges:
+            yield multipart_range_header(boundary, start, end, size)
+            yield from read_file_range(f, start, end - start + 1)
+            yield b'\r\n'
+        yield f'--{boundary}--\r\n'.encode()
+    finally:
+        f.close()
+
+
+def send_game_file(filepath, offload=None, offload_prefix=''):
+    """Response sending a game file, with single and multiple range support.
+
+    With `offload`, the transfer is delegated to the reverse proxy:
+    'x-accel-redirect' for nginx, the file being served from the internal
+    location `offload_prefix` + file path, or 'x-sendfile' for Apache and
+    lighttpd.
+    """
+    if offload == 'x-accel-redirect':
+        return Response(headers={
+            'X-Accel-Redirect': quote(offload_prefix.rstrip('/') + filepath),
+            'Content-Type': 'application/octet-stream',
+        })
+    if offload == 'x-sendfile':
+        return Response(headers={
+            'X-Sendfile': filepath,
+            'Content-Type': 'application/octet-stream',
+        })
+
+    try:
+        f = open(filepath, 'rb')
+    except OSError as e:
+        logger.error(f'Failed to open {filepath}: {e}')
+        abort(404)
+    stat = os.fstat(f.fileno())
+    size = stat.st_size
+    etag = f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+    }
+
+    ranges = parse_range_header(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if ranges is not None and if_range is not None and if_range != etag:
+        # the file changed since the client got its first part
+        ranges = None
+
+    if ranges is None:
+        headers['Content-Length'] = str(size)
+        body = send_file_range(f, 0, size, size)
+        return Response(body, 200, headers, mimetype='application/octet-stream', direct_passthrough=True)
+
+    if not ranges:
+        f.close()
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        headers['Content-Length'] = str(end - start + 1)
+        body = send_file_range(f, start, end - start + 1, size)
+        return Response(body, 206, headers, mimetype='application/octet-stream', direct_passthrough=True)
+
+    boundary = secrets.token_hex(16)
+    content_length = len(f'--{boundary}--\r\n')
+    for start, end in ranges:
+        content_length += len(multipart_range_header(boundary, start, end, size)) + end - start + 1 + len(b'\r\n')
+    headers['Content-Length'] = str(content_length)
+    return Response(
+        send_multipart_ranges(f, ranges, size, boundary), 206, headers,
+        mimetype=f'multipart/byteranges; boundary={boundary}', direct_passthrough=True,
+    )
@@ -1,8 +1,13 @@
 from constants import *
 from utils import *
 import time, os
-from watchdog.observers.polling import PollingObserver
-from watchdog.events import FileSystemEventHandler
+import heapq
+import math
+import threading
+from functools import partial
+from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver, EventEmitter, DEFAULT_OBSERVER_TIMEOUT
+from watchdog.events import FileSystemEventHandler, FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent
 from types import SimpleNamespace
 import logging
 
@@ -10,34 +15,287 @@ import logging
 logger = logging.getLogger('main')
 
 
+# Filesystems where inotify does not report changes made by other hosts
+NETWORK_FILESYSTEMS = {
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', '9p', 'ceph', 'glusterfs',
+    'fuse.sshfs', 'fuse.rclone', 'fuse.s3fs', 'davfs', 'fuse.davfs2',
+}
+WATCHER_BACKENDS = ('native', 'polling')
+# inotify also reports opened and closed files, e.g. on every download or identification read
+LIBRARY_EVENT_TYPES = ('created', 'modified', 'moved', 'deleted')
+LIBRARY_EVENT_FILTER = [FileCreatedEvent, FileModifiedEvent, FileMovedEvent, FileDeletedEvent]
+
+
+def get_filesystem_type(path, mounts_file='/proc/mounts'):
+    """Type of the filesystem holding path, None if unknown"""
+    path = os.path.realpath(path)
+    best_mount_point, fs_type = '', None
+    try:
+        with open(mounts_file) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # spaces in mount points are escaped as \040
+                mount_point = fields[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) >= len(best_mount_point):
+                    best_mount_point, fs_type = mount_point, fields[2]
+    except OSError:
+        return None
+    return fs_type
+
+
+def detect_watcher_backend(path):
+    """Polling for network filesystems, native events (inotify on Linux) otherwise"""
+    fs_type = get_filesystem_type(path)
+    if fs_type in NETWORK_FILESYSTEMS:
+        return 'polling'
+    return 'native'
+
+
+class WatcherMetrics:
+    """Poll cost and event latency of a watcher backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.events = 0
+        self.event_latency_samples = 0
+        self.event_latency_total = 0.0
+        self.event_latency_last = None
+        self.event_latency_max = 0.0
+        self.polls = 0
+        self.poll_duration_total = 0.0
+        self.poll_duration_last = None
+        self.poll_directories_listed_last = None
+
+    def record_event(self):
+        with self.lock:
+            self.events += 1
+
+    def record_latency(self, latency):
+        with self.lock:
+            self.event_latency_samples += 1
+            self.event_latency_total += latency
+            self.event_latency_last = latency
+            self.event_latency_max = max(self.event_latency_max, latency)
+
+    def record_poll(self, duration, directories_listed):
+        with self.lock:
+            self.polls += 1
+            self.poll_duration_total += duration
+            self.poll_duration_last = duration
+            self.poll_directories_listed_last = directories_listed
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'backend': self.backend,
+                'events': self.events,
+                'event_latency_avg': self.event_latency_total / self.event_latency_samples if self.event_latency_samples else None,
+                'event_latency_last': self.event_latency_last,
+                'event_latency_max': self.event_latency_max,
+                'polls': self.polls,
+                'poll_duration_avg': self.poll_duration_total / self.polls if self.polls else None,
+                'poll_duration_last': self.poll_duration_last,
+                'poll_directories_listed_last': self.poll_directories_listed_last,
+            }
+
+
+# Adaptive polling intervals, in seconds
+POLLING_MIN_INTERVAL = 5
+POLLING_MAX_INTERVAL = 60
+# Files modified in place do not change their directory mtime,
+# every directory is listed again at this interval
+POLLING_FULL_SCAN_INTERVAL = 600
+
+
+class DirectoryState:
+    def __init__(self, mtime, files, subdirs):
+        self.mtime = mtime
+        self.files = files  # name -> (size, mtime, inode)
+        self.subdirs = subdirs
+
+
+class AdaptivePollingEmitter(EventEmitter):
+    """Polling emitter for filesystems without change notifications.
+
+    Only directories whose mtime changed since the last poll are listed
+    again, the others cost a single stat. The poll interval doubles up to
+    `max_interval` while nothing changes and goes back to `min_interval`
+    after a change. A full scan catches files modified in place.
+    """
+
+    def __init__(self, *args, metrics, min_interval=POLLING_MIN_INTERVAL, max_interval=POLLING_MAX_INTERVAL,
+                 full_scan_interval=POLLING_FULL_SCAN_INTERVAL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.full_scan_interval = full_scan_interval
+        self.interval = min_interval
+        self.directories = {}
+        self.last_full_scan = None
+
+    def on_thread_start(self):
+        # initial state, existing files are not reported
+        self.poll(full=True)
+
+    def queue_events(self, timeout):
+        if self.stopped_event.wait(self.interval):
+            return
+        full = time.monotonic() - self.last_full_scan >= self.full_scan_interval
+        events = self.poll(full)
+        for event in events:
+            self.queue_event(event)
+        if events:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+
+    def poll(self, full=False):
+        """Update the directories state and return the file events since the last poll"""
+        start = time.perf_counter()
+        created, deleted, modified = {}, {}, []
+        listed = 0
+        stack = [self.watch.path]
+        while stack:
+            dirpath = stack.pop()
+            state = self.directories.get(dirpath)
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                self._remove_tree(dirpath, deleted)
+                continue
+            if state is not None and state.mtime == mtime and not full:
+                stack.extend(os.path.join(dirpath, name) for name in state.subdirs)
+                continue
+
+            listed += 1
+            try:
+                files, subdirs = self._list_directory(dirpath)
+            except OSError:
+                self._remove_tree(dirpath, deleted)
+                continue
+            old_files = state.files if state is not None else {}
+            for name, file_stat in files.items():
+                old_stat = old_files.get(name)
+                if old_stat is None:
+                    created[os.path.join(dirpath, name)] = file_stat
+                elif old_stat != file_stat:
+                    modified.append(os.path.join(dirpath, name))
+            for name in old_files.keys() - files.keys():
+                deleted[os.path.join(dirpath, name)] = old_files[name]
+            if state is not None:
+                for name in state.subdirs - subdirs:
+                    self._remove_tree(os.path.join(dirpath, name), deleted)
+            self.directories[dirpath] = DirectoryState(mtime, files, subdirs)
+            stack.extend(os.path.join(dirpath, name) for name in subdirs)
+
+        if full:
+            self.last_full_scan = time.monotonic()
+        self.metrics.record_poll(time.perf_counter() - start, listed)
+        return self._get_events(created, deleted, modified)
+
+    def _list_directory(self, dirpath):
+        files, subdirs = {}, set()
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.add(entry.name)
+                    else:
+                        stat = entry.stat()
+                        files[entry.name] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                except OSError:
+                    continue
+        return files, subdirs
+
+    def _remove_tree(self, dirpath, deleted):
+        prefix = dirpath.rstrip(os.sep) + os.sep
+        for path in [p for p in self.directories if p == dirpath or p.startswith(prefix)]:
+            for name, file_stat in self.directories.pop(path).files.items():
+                deleted[os.path.join(path, name)] = file_stat
+
+    def _get_events(self, created, deleted, modified):
+        events = []
+        # a file deleted and created with the same inode was moved
+        deleted_by_inode = {file_stat[2]: path for path, file_stat in deleted.items()}
+        for path, file_stat in created.items():
+            src_path = deleted_by_inode.pop(file_stat[2], None)
+            if src_path is not None and deleted.pop(src_path, None) is not None:
+                events.append(FileMovedEvent(src_path, path))
+            else:
+                events.append(FileCreatedEvent(path))
+        events.extend(FileDeletedEvent(path) for path in deleted)
+        events.extend(FileModifiedEvent(path) for path in modified)
+        return events
+
+
 class Watcher:
     def __init__(self, callback):
         self.directories = set()  # Use a set to store directories
         self.callback = callback
         self.event_handler = Handler(self.callback)
-        self.observer = PollingObserver()
+        # one observer per backend, created when a directory needs it
+        self.observers = {}
+        self.metrics = {backend: WatcherMetrics(backend) for backend in WATCHER_BACKENDS}
+        self.backend_map = {}
         self.scheduler_map = {}
+        self.running = False
+
+    def _get_observer(self, backend):
+        if backend not in self.observers:
+            if backend == 'polling':
+                observer = BaseObserver(partial(AdaptivePollingEmitter, metrics=self.metrics['polling']), timeout=DEFAULT_OBSERVER_TIMEOUT)
+            else:
+                observer = Observer()
+            if self.running:
+                observer.start()
+            self.observers[backend] = observer
+        return self.observers[backend]
 
     def run(self):
-        self.observer.start()
+        self.running = True
+        for observer in self.observers.values():
+            observer.start()
         logger.debug('Successfully started observer.')
 
     def stop(self):
         logger.debug('Stopping observer...')
-        self.observer.stop()
-        self.observer.join()
+        for observer in self.observers.values():
+            observer.stop()
+            observer.join()
+        self.event_handler.stop()
+        self.running = False
         logger.debug('Successfully stopped observer.')
 
-    def add_directory(self, directory):
+    def add_directory(self, directory, backend=None):
+        """Watch a directory, with the backend detected from its filesystem if not given"""
+        if backend not in WATCHER_BACKENDS:
+            if backend is not None:
+                logger.warning(f'Unknown watcher backend {backend} for {directory}, detecting it.')
+            backend = detect_watcher_backend(directory)
+        if directory in self.directories and self.backend_map.get(directory) != backend:
+            self.remove_directory(directory)
         if directory not in self.directories:
             if not os.path.exists(directory):
                 logger.warning(f'Directory {directory} does not exist, not added to watchdog.')
                 return False
-            logger.info(f'Adding directory {directory} to watchdog.')
-            task = self.observer.schedule(self.event_handler, directory, recursive=True)
+            logger.info(f'Adding directory {directory} to watchdog with {backend} backend.')
+            try:
+                task = self._get_observer(backend).schedule(self.event_handler, directory, recursive=True, event_filter=LIBRARY_EVENT_FILTER)
+            except OSError as e:
+                if backend == 'polling':
+                    raise
+                # e.g. inotify watch limit reached
+                logger.warning(f'Failed to watch {directory} with {backend} backend ({e}), falling back to polling.')
+                backend = 'polling'
+                task = self._get_observer(backend).schedule(self.event_handler, directory, recursive=True, event_filter=LIBRARY_EVENT_FILTER)
             self.scheduler_map[directory] = task
+            self.backend_map[directory] = backend
             self.directories.add(directory)
-            self.event_handler.add_directory(directory)
+            self.event_handler.add_directory(directory, self.metrics[backend])
             return True
         return False
     
@@ -45,72 +303,178 @@ class Watcher:
         logger.info(f'Removing {directory} from watchdog monitoring...')
         if directory in self.directories:
             if directory in self.scheduler_map:
-                self.observer.unschedule(self.scheduler_map[directory])
+                self.observers[self.backend_map[directory]].unschedule(self.scheduler_map[directory])
                 del self.scheduler_map[directory]
+            del self.backend_map[directory]
             self.directories.remove(directory)
+            self.event_handler.remove_directory(directory)
             logger.info(f'Removed {directory} from watchdog monitoring.')
             return True
         else:
             logger.info(f'{directory} not in watchdog, nothing to do.')
         return False
 
+    def get_metrics(self):
+        """Metrics of the backends in use, with the directories they watch"""
+        metrics = {}
+        for directory, backend in self.backend_map.items():
+            if backend not in metrics:
+                metrics[backend] = dict(self.metrics[backend].to_dict(), directories=[])
+            metrics[backend]['directories'].append(directory)
+        return metrics
+
+# Seconds, stability deadlines are rounded up to a multiple of it
+DEADLINE_RESOLUTION = 1
+
+
 class Handler(FileSystemEventHandler):
     def __init__(self, callback, stability_duration=5):
         self._raw_callback = callback  # Callback to invoke for stable files
         self.directories = []
+        self.metrics = {}  # WatcherMetrics of the backend watching each directory
         self.stability_duration = stability_duration  # Stability duration in seconds
         self.tracked_files = {}  # Tracks files being copied
-        self.debounced_check_final = self._debounce(self._check_file_stability, stability_duration)
+        # heap of (deadline, file path), at most one entry per tracked file
+        self.deadlines = []
+        self.condition = threading.Condition()
+        self.scheduler_thread = None
+        self.stopped = False
 
-    def add_directory(self, directory):
+    def add_directory(self, directory, metrics=None):
         if directory not in self.directories:
             self.directories.append(directory)
+        if metrics is not None:
+            self.metrics[directory] = metrics
 
-    def _debounce(self, func, wait):
-        """Debounce decorator for the stability check."""
-        @debounce(wait)
-        def debounced():
-            func()
-        return debounced
+    def remove_directory(self, directory):
+        if directory in self.directories:
+            self.directories.remove(directory)
+        self.metrics.pop(directory, None)
+
+    def _record_event(self, directory):
+        metrics = self.metrics.get(directory)
+        if metrics is not None:
+            metrics.record_event()
+
+    def _record_latency(self, event, file_stat):
+        """Latency of the first event of a file, from the stat taken when its tracking starts"""
+        metrics = self.metrics.get(event.directory)
+        # moved and copied files can keep an old mtime, only writes date the change
+        if metrics is not None and event.type in ('created', 'modified'):
+            metrics.record_latency(max(time.time() - file_stat.st_mtime, 0.0))
+
+    def _next_deadline(self):
+        """Stability deadline of a file changed now, rounded up so that files
+        copied together are checked and reported together."""
+        deadline = time.monotonic() + self.stability_duration
+        return math.ceil(deadline / DEADLINE_RESOLUTION) * DEADLINE_RESOLUTION
 
     def _track_file(self, event):
-        """Start or update tracking for a file."""
+        """Start or update tracking for a file, its stability is checked at its deadline."""
         if event.type == 'moved':
             file_path = event.dest_path
         else:
             file_path = event.src_path
-        current_size = os.path.getsize(file_path)
-        if file_path not in self.tracked_files:
-            event.size = current_size
-            event.timestamp = time.time()
+        deadline = self._next_deadline()
+        with self.condition:
+            tracked_event = self.tracked_files.get(file_path)
+            if tracked_event is not None:
+                if deadline > tracked_event.deadline:
+                    # the size is recorded each time the deadline is pushed back,
+                    # at most once per DEADLINE_RESOLUTION while a file is written
+                    try:
+                        tracked_event.size = os.path.getsize(file_path)
+                    except OSError:
+                        pass
+                    tracked_event.written = False
+                    # the heap entry of the file is moved to the new deadline when it is reached
+                    tracked_event.deadline = deadline
+                else:
+                    tracked_event.written = True
+                return
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                return
+            event.size = file_stat.st_size
+            event.written = False
+            event.deadline = deadline
+            self._record_latency(event, file_stat)
             self.tracked_files[file_path] = event
-        else:
-            self.tracked_files[file_path].size = current_size
-            self.tracked_files[file_path].timestamp = time.time()
-
-    def _check_file_stability(self):
-        """Check for stable files and invoke the callback."""
-        now = time.time()
-        stable_files = []
-
-        # Check all tracked files
-        for file_path, file_data in list(self.tracked_files.items()):
-            if not os.path.exists(file_path):
-                # If the file no longer exists, stop tracking it
-                del self.tracked_files[file_path]
-                continue
-            current_size = os.path.getsize(file_path)
-            if current_size == file_data.size and (now - file_data.timestamp) >= self.stability_duration:
-                stable_files.append(file_data)
-                del self.tracked_files[file_path]  # Stop tracking stable file
+            heapq.heappush(self.deadlines, (deadline, file_path))
+            if self.scheduler_thread is None:
+                self.scheduler_thread = threading.Thread(target=self._run_scheduler, daemon=True)
+                self.scheduler_thread.start()
+            self.condition.notify()
+
+    def _wait_for_due_files(self):
+        """Tracked files whose deadline is reached, None once stopped."""
+        with self.condition:
+            while not self.stopped and (not self.deadlines or self.deadlines[0][0] > time.monotonic()):
+                timeout = self.deadlines[0][0] - time.monotonic() if self.deadlines else None
+                self.condition.wait(timeout)
+            if self.stopped:
+                return None
+            now = time.monotonic()
+            due_files = []
+            while self.deadlines and self.deadlines[0][0] <= now:
+                deadline, file_path = heapq.heappop(self.deadlines)
+                event = self.tracked_files.get(file_path)
+                if event is None:
+                    continue
+                if event.deadline > deadline:
+                    heapq.heappush(self.deadlines, (event.deadline, file_path))
+                    continue
+                due_files.append((deadline, file_path, event))
+            return due_files
+
+    def _run_scheduler(self):
+        """Check each tracked file once its deadline is reached and report stable files."""
+        while True:
+            due_files = self._wait_for_due_files()
+            if due_files is None:
+                return
+            stable_files = []
+            for deadline, file_path, event in due_files:
+                try:
+                    current_size = os.path.getsize(file_path)
+                except OSError:
+                    current_size = None
+                with self.condition:
+                    if self.tracked_files.get(file_path) is not event:
+                        continue
+                    if current_size is None:
+                        # If the file no longer exists, stop tracking it
+                        del self.tracked_files[file_path]
+                    elif event.deadline > deadline:
+                        # modified while its size was checked
+                        heapq.heappush(self.deadlines, (event.deadline, file_path))
+                    elif current_size == event.size or event.written:
+                        # unchanged since the last deadline push back, or changed by
+                        # events that came before the deadline, in the same second
+                        del self.tracked_files[file_path]  # Stop tracking stable file
+                        stable_files.append(event)
+                    else:
+                        # still being written without events, e.g. on polled network mounts
+                        event.size = current_size
+                        event.deadline = self._next_deadline()
+                        heapq.heappush(self.deadlines, (event.deadline, file_path))
 
-        # Trigger the callback for all stable files
-        if stable_files:
-            self._raw_callback(stable_files)
+            # Trigger the callback for all stable files
+            if stable_files:
+                try:
+                    self._raw_callback(stable_files)
+                except Exception as e:
+                    logger.exception(f'Failed to process library changes: {e}')
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
 
     def collect_event(self, source_event, directory):
         """Track file events and trigger the stability check."""
-        if source_event.is_directory:
+        if source_event.is_directory or source_event.event_type not in LIBRARY_EVENT_TYPES:
             return
 
         if not any(source_event.src_path.endswith(ext) or source_event.dest_path.endswith(ext) for ext in ALLOWED_EXTENSIONS):
@@ -132,12 +496,11 @@ class Handler(FileSystemEventHandler):
         else:
             # Track file on create or modify
             self._track_file(library_event)
-            self.debounced_check_final()
-
-        self._check_file_stability()
 
     def on_any_event(self, event):
         for directory in self.directories:
             if event.src_path.startswith(directory):
+                if not event.is_directory and event.event_type in LIBRARY_EVENT_TYPES:
+                    self._record_event(directory)
                 self.collect_event(event, directory)
                 break
@@ -0,0 +1,45 @@
+"""Gunicorn configuration of the Ownfoil production server, see wsgi.py.
+
+Workers and threads per worker can be set with the OWNFOIL_WORKERS and
+OWNFOIL_THREADS environment variables. Threaded workers keep serving
+other consoles while long downloads are in progress.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('OWNFOIL_PORT', '8465')}"
+workers = int(os.environ.get('OWNFOIL_WORKERS', '2'))
+# each open /api/events stream (one per open admin page) holds a thread of its
+# worker for as long as the page stays open, raise OWNFOIL_THREADS with the
+# number of pages kept open so downloads still find free threads
+threads = int(os.environ.get('OWNFOIL_THREADS', '8'))
+worker_class = 'gthread'
+# downloads are served with sendfile through wsgi.file_wrapper
+sendfile = True
+# keep connections of consoles downloading several files open
+keepalive = 5
+# the app is imported by each worker after the fork, no state is shared
+preload_app = False
+
+
+def on_starting(server):
+    """Update titledb once and fail interrupted jobs, before the workers start."""
+    from constants import CONFIG_DIR, DATA_DIR, OWNFOIL_DB
+    from settings import load_settings
+    from sqlalchemy import create_engine, inspect
+    from jobs import fail_interrupted_jobs
+    import titledb
+
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    # workers can be restarted while others run jobs, only the server start
+    # knows that no job is running
+    engine = create_engine(OWNFOIL_DB)
+    if inspect(engine).has_table('job'):
+        with engine.begin() as connection:
+            fail_interrupted_jobs(connection)
+    engine.dispose()
+    try:
+        titledb.update_titledb(load_settings())
+    except Exception as e:
+        # serve with the titledb already downloaded, if any
+        server.log.error(f'Failed to update titledb: {e}')
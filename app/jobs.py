@@ -0,0 +1,278 @@
+"""Background jobs working on the library: scans, organization and duplicate deletion"""
+from db import *
+from constants import JOBS_LOCK_DIR
+from multiworker import FileLock
+import hashlib
+import threading
+import uuid
+import json
+import os
+import time
+import logging
+
+# Retrieve main logger
+logger = logging.getLogger('main')
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+ACTIVE_JOB_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+# threads running jobs of different libraries at the same time
+JOB_WORKERS = 2
+# finished jobs kept in the database
+JOBS_HISTORY = 100
+# seconds between progress writes, also how often cancellation is checked
+PROGRESS_INTERVAL = 1
+# seconds between attempts to start jobs of libraries busy in another worker process
+RETRY_INTERVAL = 5
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job_to_dict(job):
+    job_dict = to_dict(job)
+    job_dict['libraries'] = json.loads(job.libraries or '[]')
+    job_dict['result'] = json.loads(job.result) if job.result is not None else None
+    return job_dict
+
+
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    return job_to_dict(job) if job is not None else None
+
+
+def get_jobs(statuses=None, job_type=None, limit=50):
+    """Latest jobs first"""
+    query = Job.query
+    if statuses:
+        query = query.filter(Job.status.in_(statuses))
+    if job_type:
+        query = query.filter_by(type=job_type)
+    return [job_to_dict(job) for job in query.order_by(Job.created_at.desc()).limit(limit)]
+
+
+def finish_job(job_id, status, result=None, error=None):
+    values = {'status': status, 'finished_at': time.time()}
+    if result is not None:
+        values['result'] = json.dumps(result)
+    if error is not None:
+        values['error'] = error
+    Job.query.filter_by(id=job_id).update(values)
+    db.session.commit()
+
+
+def prune_jobs(keep=JOBS_HISTORY):
+    """Delete the oldest finished jobs, keeping the `keep` latest ones."""
+    old_jobs = (
+        db.select(Job.id)
+        .where(Job.status.notin_(ACTIVE_JOB_STATUSES))
+        .order_by(Job.created_at.desc())
+        .offset(keep)
+    )
+    Job.query.filter(Job.id.in_(old_jobs)).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def fail_interrupted_jobs(connection):
+    """Mark the jobs left queued or running by a previous server as failed."""
+    connection.execute(
+        db.update(Job)
+        .where(Job.status.in_(ACTIVE_JOB_STATUSES))
+        .values(status=JOB_FAILED, error='Interrupted by a server restart', finished_at=time.time())
+    )
+
+
+class JobContext:
+    """Given to job functions to report their progress."""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.last_update = 0
+
+    def update(self, done, total, message=None):
+        """Save the progress, raises JobCancelled if the job was cancelled.
+
+        Writes are throttled to one per PROGRESS_INTERVAL, they also commit
+        the changes pending in the session of the job.
+        """
+        now = time.monotonic()
+        if now - self.last_update < PROGRESS_INTERVAL and done < total:
+            return
+        self.last_update = now
+        values = {'progress': done, 'total': total}
+        if message is not None:
+            values['message'] = message
+        Job.query.filter_by(id=self.id).update(values)
+        db.session.commit()
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if db.session.query(Job.cancel_requested).filter_by(id=self.id).scalar():
+            raise JobCancelled()
+
+
+class JobManager:
+    """Queue of background jobs.
+
+    Jobs run in a pool of threads, one at a time per library path they
+    work on, in submission order. Libraries are also locked across the
+    worker processes of a production server. Job status is stored in the
+    database, so any worker process can answer polls and cancel requests.
+    """
+
+    def __init__(self, app, workers=JOB_WORKERS, lock_dir=JOBS_LOCK_DIR):
+        self.app = app
+        self.workers = workers
+        self.lock_dir = lock_dir
+        self.condition = threading.Condition()
+        # (job ID, type, function, library paths) in submission order
+        self.pending = []
+        self.busy_libraries = set()
+        self.threads = []
+        self.stopped = False
+
+    def submit(self, job_type, func, libraries, unique=False):
+        """Queue `func(job)`, returns the job ID.
+
+        `libraries` are the library paths `func` works on. With `unique`,
+        a job of the same type and libraries still queued in this process
+        is returned instead of queueing a new one. The return value of
+        `func` is saved as the job result and must be JSON serializable.
+        """
+        libraries = sorted(set(libraries))
+        with self.condition:
+            if unique:
+                for job_id, pending_type, _, pending_libraries in self.pending:
+                    if pending_type == job_type and pending_libraries == libraries:
+                        return job_id
+            job = Job(
+                id=uuid.uuid4().hex,
+                type=job_type,
+                libraries=json.dumps(libraries),
+                status=JOB_QUEUED,
+                progress=0,
+                total=0,
+                cancel_requested=False,
+                created_at=time.time(),
+            )
+            db.session.add(job)
+            db.session.commit()
+            job_id = job.id
+            self.pending.append((job_id, job_type, func, libraries))
+            self._start_threads()
+            self.condition.notify()
+        logger.info(f'Queued {job_type} job {job_id} for {libraries or "the library"}.')
+        prune_jobs()
+        return job_id
+
+    def cancel(self, job_id):
+        """Cancel a job, returns False if it is not queued or running."""
+        with self.condition:
+            for n, (pending_id, _, _, _) in enumerate(self.pending):
+                if pending_id == job_id:
+                    del self.pending[n]
+                    finish_job(job_id, JOB_CANCELLED)
+                    return True
+        # running, or queued by another worker process
+        updated = Job.query.filter_by(id=job_id).filter(Job.status.in_(ACTIVE_JOB_STATUSES)).update({'cancel_requested': True})
+        db.session.commit()
+        return updated > 0
+
+    def stop(self, timeout=None):
+        """Stop the threads once their running jobs finish, queued jobs stay queued."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def _start_threads(self):
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+        while not self.stopped and len(self.threads) < self.workers:
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _get_lock(self, library):
+        return FileLock(os.path.join(self.lock_dir, hashlib.sha1(library.encode()).hexdigest() + '.lock'))
+
+    def _acquire_locks(self, libraries):
+        locks = []
+        for library in libraries:
+            lock = self._get_lock(library)
+            if not lock.acquire(blocking=False):
+                for acquired_lock in locks:
+                    acquired_lock.release()
+                return None
+            locks.append(lock)
+        return locks
+
+    def _next_job(self):
+        """Take the first pending job whose libraries are free, with their locks acquired."""
+        waiting_libraries = set(self.busy_libraries)
+        for n, (job_id, _, func, libraries) in enumerate(self.pending):
+            if waiting_libraries.isdisjoint(libraries):
+                locks = self._acquire_locks(libraries)
+                if locks is not None:
+                    del self.pending[n]
+                    self.busy_libraries.update(libraries)
+                    return job_id, func, libraries, locks
+            # later jobs of these libraries wait for this one
+            waiting_libraries.update(libraries)
+        return None
+
+    def _run(self):
+        os.makedirs(self.lock_dir, exist_ok=True)
+        while True:
+            with self.condition:
+                next_job = None
+                while next_job is None:
+                    if self.stopped:
+                        return
+                    next_job = self._next_job()
+                    if next_job is None:
+                        # jobs of libraries locked by another worker process are retried
+                        self.condition.wait(RETRY_INTERVAL if self.pending else None)
+            job_id, func, libraries, locks = next_job
+            try:
+                with self.app.app_context():
+                    self._run_job(job_id, func)
+            finally:
+                for lock in locks:
+                    lock.release()
+                with self.condition:
+                    self.busy_libraries.difference_update(libraries)
+                    self.condition.notify_all()
+
+    def _run_job(self, job_id, func):
+        job = db.session.get(Job, job_id)
+        if job is None:
+            return
+        if job.cancel_requested:
+            finish_job(job_id, JOB_CANCELLED)
+            return
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        job_type = job.type
+        db.session.commit()
+        logger.info(f'Starting {job_type} job {job_id}.')
+        try:
+            result = func(JobContext(job_id))
+        except JobCancelled:
+            db.session.rollback()
+            logger.info(f'{job_type} job {job_id} cancelled.')
+            finish_job(job_id, JOB_CANCELLED)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f'{job_type} job {job_id} failed: {e}')
+            finish_job(job_id, JOB_FAILED, error=str(e))
+        else:
+            logger.info(f'{job_type} job {job_id} completed.')
+            finish_job(job_id, JOB_COMPLETED, result=result)
@@ -1,34 +1,227 @@
 from constants import *
 from db import *
 from titles import *
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
+import hashlib
+import itertools
 import shutil
 import re
+import json
+import threading
 
-def identify_files_and_add_to_db(library_path, files):
+def get_identification_workers(app_settings):
+    workers = app_settings['library'].get('identification_workers', 0)
+    if not workers or workers < 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def get_walk_workers(app_settings):
+    return max(1, app_settings['library'].get('walk_workers', 4))
+
+
+def get_db_batch_size(app_settings):
+    return max(1, app_settings['library'].get('db_batch_size', 500))
+
+
+def read_cnmts_in_pool(files, workers):
+    """Read the CNMT of every file in a pool of worker processes.
+
+    Yields (filepath, cnmt) as soon as each file is done, cnmt being the
+    exception raised when the file could not be read.
+    """
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_identification_worker, initargs=(KEYS_FILE,))
+    try:
+        futures = {executor.submit(read_cnmt, filepath): filepath for filepath in files}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # worker process died, the file is identified from its filename
+                yield futures[future], e
+    finally:
+        # files not read yet are dropped if the caller stops early
+        executor.shutdown(cancel_futures=True)
+
+
+def get_file_stat(filepath):
+    stat = os.stat(filepath)
+    return stat.st_size, stat.st_mtime_ns, str(stat.st_ino)
+
+
+def get_partial_hash(filepath, size, chunk_size=64 * 1024):
+    """Hash of the first and last chunks of a file"""
+    file_hash = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        file_hash.update(f.read(chunk_size))
+        if size > 2 * chunk_size:
+            f.seek(-chunk_size, os.SEEK_END)
+            file_hash.update(f.read(chunk_size))
+    return file_hash.hexdigest()
+
+
+class IdentificationCacheLookup:
+    """View of the identification cache table for the files being identified.
+
+    A cached CNMT is reused for a file when its size, mtime and inode match
+    the cached ones, whatever its path: moved and renamed files or files of
+    a re-added library are not read again. With `use_partial_hash`, the
+    hash of the first and last 64 KiB of the file must match too.
+
+    Only the entries of the files passed to load(), by path or by size, are
+    read from the table. get() and is_changed() load single files on demand.
+    """
+
+    def __init__(self, use_partial_hash=False):
+        self.use_partial_hash = use_partial_hash
+        self.by_path = {}
+        self.by_stat = {}
+        self.loaded_paths = set()
+
+    def load(self, file_stats):
+        """Read the cache entries that can match these files, from a dict of file path to stat."""
+        file_stats = {filepath: file_stat for filepath, file_stat in file_stats.items() if filepath not in self.loaded_paths}
+        if not file_stats:
+            return
+        for entry in get_identification_cache_entries(file_stats.keys(), (file_stat[0] for file_stat in file_stats.values())):
+            self.by_path[entry['filepath']] = entry
+            self.by_stat[(entry['size'], entry['mtime'], entry['inode'])] = entry
+        self.loaded_paths.update(file_stats)
+
+    def get(self, filepath, file_stat):
+        """Cached CNMT of a file, None if the file is unknown or changed."""
+        self.load({filepath: file_stat})
+        entry = self.by_path.get(filepath)
+        if entry is None or (entry['size'], entry['mtime'], entry['inode']) != file_stat:
+            entry = self.by_stat.get(file_stat)
+        if entry is None:
+            return None
+        if self.use_partial_hash and entry['partial_hash'] != get_partial_hash(filepath, file_stat[0]):
+            return None
+        if entry['filepath'] != filepath:
+            logger.debug(f"Reusing identification of {entry['filepath']} for moved file {filepath}")
+            move_identification_cache_entry(entry['id'], filepath)
+            self.by_path.pop(entry['filepath'], None)
+            entry['filepath'] = filepath
+            self.by_path[filepath] = entry
+        return entry['app_id'], entry['version'], entry['type']
+
+    def add(self, filepath, file_stat, cnmt):
+        partial_hash = get_partial_hash(filepath, file_stat[0]) if self.use_partial_hash else None
+        add_to_identification_cache(filepath, file_stat, partial_hash, cnmt)
+
+    def is_changed(self, filepath, file_stat):
+        """True if the file was identified before with a different size, mtime or inode."""
+        self.load({filepath: file_stat})
+        entry = self.by_path.get(filepath)
+        return entry is not None and (entry['size'], entry['mtime'], entry['inode']) != file_stat
+
+
+def new_identification_cache(app_settings):
+    return IdentificationCacheLookup(app_settings['library'].get('identification_cache_partial_hash', False))
+
+
+def identify_files_and_add_to_db(library_path, files, workers=1, progress_callback=None, cache=None, batch_size=500, file_stats=None):
+    """Identify files and add them to the database.
+
+    With valid keys, CNMTs are first looked up in the identification cache.
+    The others are read in parallel by a process pool when more than one
+    worker is requested, while identification results are written to the
+    database by this thread only, in batches of `batch_size` files.
+    `progress_callback(done, total)` is called after each file, files
+    identified before it raises are still saved. `file_stats` holds the
+    stats of the files already known from the library walk, others are
+    stat'ed.
+    """
     nb_to_identify = len(files)
-    for n, filepath in enumerate(files):
-        file = filepath.replace(library_path, "")
-        logger.info(f'Identifying file ({n+1}/{nb_to_identify}): {file}')
+    cached_results = []
+    files_to_read = files
+    file_stats = dict(file_stats or {})
+    if Keys.keys_loaded:
+        if cache is None:
+            cache = IdentificationCacheLookup()
+        files_to_read = []
+        for filepath in files:
+            if filepath not in file_stats:
+                try:
+                    file_stats[filepath] = get_file_stat(filepath)
+                except OSError:
+                    pass
+        cache.load({filepath: file_stats[filepath] for filepath in files if filepath in file_stats})
+        for filepath in files:
+            if filepath not in file_stats:
+                files_to_read.append(filepath)
+                continue
+            cnmt = cache.get(filepath, file_stats[filepath])
+            if cnmt is None:
+                files_to_read.append(filepath)
+            else:
+                cached_results.append((filepath, cnmt))
+        if cached_results:
+            logger.info(f'Reusing cached identification for {len(cached_results)}/{nb_to_identify} files.')
 
-        file_info = identify_file(filepath)
+    if not Keys.keys_loaded:
+        results = ((filepath, None) for filepath in files)
+    elif workers > 1 and len(files_to_read) > 1:
+        workers = min(workers, len(files_to_read))
+        logger.info(f'Identifying {len(files_to_read)} files with {workers} workers ...')
+        results = read_cnmts_in_pool(files_to_read, workers)
+    else:
+        results = (read_cnmt(filepath) for filepath in files_to_read)
 
-        if file_info is None:
-            logger.error(f'Failed to identify: {file} - file will be skipped.')
-            # in the future save identification error to be displayed and inspected in the UI
-            continue
+    identified_files = []
+    try:
+        for n, (filepath, cnmt) in enumerate(itertools.chain(cached_results, results)):
+            file = filepath.replace(library_path, "")
+            logger.info(f'Identifying file ({n+1}/{nb_to_identify}): {file}')
+
+            if n >= len(cached_results) and filepath in file_stats and cnmt is not None and not isinstance(cnmt, Exception):
+                cache.add(filepath, file_stats[filepath], cnmt)
+
+            file_info = identify_file(filepath, cnmt, file_stats[filepath][0] if filepath in file_stats else None)
+
+            if file_info is None:
+                logger.error(f'Failed to identify: {file} - file will be skipped.')
+                # in the future save identification error to be displayed and inspected in the UI
+            else:
+                logger.info(f'Identifying file ({n+1}/{nb_to_identify}): {file} OK Title ID: {file_info["title_id"]} App ID : {file_info["app_id"]} Title Type: {file_info["type"]} Version: {file_info["version"]}')
+                identified_files.append(file_info)
+                if len(identified_files) >= batch_size:
+                    batch, identified_files = identified_files, []
+                    library_model.invalidate(add_many_to_titles_db(library_path, batch, batch_size))
+
+            if progress_callback is not None:
+                progress_callback(n + 1, nb_to_identify)
+    except BaseException:
+        results.close()
+        # the files identified before an error or a cancellation are still saved,
+        # without hiding the error if saving them fails too
+        try:
+            library_model.invalidate(add_many_to_titles_db(library_path, identified_files, batch_size))
+        except Exception as e:
+            logger.error(f'Failed to save the {len(identified_files)} files identified before the error: {e}')
+        raise
+    else:
+        results.close()
+        # also saves the cache entries of files left unchanged in the database
+        library_model.invalidate(add_many_to_titles_db(library_path, identified_files, batch_size))
 
-        logger.info(f'Identifying file ({n+1}/{nb_to_identify}): {file} OK Title ID: {file_info["title_id"]} App ID : {file_info["app_id"]} Title Type: {file_info["type"]} Version: {file_info["version"]}')
-        add_to_titles_db(library_path, file_info)
 
+def scan_library_path(app_settings, library_path, progress_callback=None):
+    """Scan a library path, returns the paths of the files found on disk.
 
-def scan_library_path(app_settings, library_path):
+    `progress_callback(done, total)` is called once the library is walked,
+    then after each file identified.
+    """
     try:
         logger.info(f'Scanning library path {library_path} ...')
         if not os.path.isdir(library_path):
             logger.warning(f'Library path {library_path} does not exists.')
-            return
-        _, files = getDirsAndFiles(library_path)
+            return set()
+        walk_errors = []
+        file_stats = {f.path: f.stat for f in walk_library(library_path, get_walk_workers(app_settings), walk_errors)}
 
         if app_settings['titles']['valid_keys']:
             current_identification = 'cnmt'
@@ -36,18 +229,51 @@ def scan_library_path(app_settings, library_path):
             logger.warning('Invalid or non existing keys.txt, title identification fallback to filename only.')
             current_identification = 'filename'
 
-        all_files_with_current_identification = get_all_files_with_identification(current_identification)
-        files_to_identify = [f for f in files if f not in all_files_with_current_identification]
-        identify_files_and_add_to_db(library_path, files_to_identify)
+        # reconcile the files on disk with the database in a single pass
+        db_files = get_library_files_state(library_path)
+        removed_files = db_files.keys() - file_stats.keys()
+        if walk_errors:
+            # files under paths that could not be read are kept until a scan sees them
+            unreadable = tuple(path.rstrip(os.sep) + os.sep for path in walk_errors)
+            kept_files = {f for f in removed_files if f in set(walk_errors) or f.startswith(unreadable)}
+            logger.warning(f'Library path {library_path}: {len(walk_errors)} paths could not be read, keeping their {len(kept_files)} files.')
+            removed_files -= kept_files
+        new_files = file_stats.keys() - db_files.keys()
+        cache = new_identification_cache(app_settings)
+        changed_files = set()
+        if current_identification == 'cnmt':
+            cache.load({f: file_stats[f] for f in file_stats.keys() & db_files.keys()})
+        for f in file_stats.keys() & db_files.keys():
+            identification, size = db_files[f]
+            if identification != current_identification:
+                changed_files.add(f)
+            elif size != file_stats[f][0] or (current_identification == 'cnmt' and cache.is_changed(f, file_stats[f])):
+                # files replaced in place since their identification
+                changed_files.add(f)
+        logger.info(f'Library path {library_path}: {len(new_files)} new, {len(changed_files)} to identify again, {len(removed_files)} removed files.')
+
+        if removed_files:
+            library_model.invalidate(delete_files_by_filepaths(removed_files))
+        files_to_identify = sorted(new_files | changed_files)
+        if progress_callback is not None:
+            progress_callback(0, len(files_to_identify))
+
+        identify_files_and_add_to_db(library_path, files_to_identify, workers=get_identification_workers(app_settings), cache=cache, batch_size=get_db_batch_size(app_settings), file_stats=file_stats, progress_callback=progress_callback)
+        # after identification, which reuses the entries of moved files
+        pruned = prune_identification_cache(library_path, file_stats, walk_errors)
+        if pruned:
+            logger.info(f'Library path {library_path}: removed {pruned} identification cache entries of deleted or changed files.')
+        return set(file_stats)
     finally:
         pass
 
 
-def get_library_status(title_id):
+def get_library_status(title_id, title_files=None):
     has_base = False
     has_latest_version = False
 
-    title_files = get_all_title_files(title_id)
+    if title_files is None:
+        title_files = get_all_title_files(title_id)
     if len(list(filter(lambda x: x.get('type') == APP_TYPE_BASE, title_files))):
         has_base = True
 
@@ -80,11 +306,22 @@ def get_library_status(title_id):
     return library_status
 
 
-def generate_library():
-    logger.info(f'Generating library ...')
-    titles = get_all_titles_from_db()
+def group_files_by_title(files):
+    files_by_title = {}
+    for file in files:
+        files_by_title.setdefault(file['title_id'], []).append(file)
+    return files_by_title
+
+
+def build_library_entries(files, files_by_title):
+    """Library entries for base and DLC files.
+
+    `files_by_title` maps title IDs to their files and must contain the
+    titles of every base file, it is used to compute their library status.
+    """
     games_info = []
-    for title in titles:
+    for file in files:
+        title = dict(file)
         # Check only critical fields, version can be None for base games and DLC
         critical_fields = ['filepath', 'title_id', 'app_id', 'type']
         has_critical_none = any(title.get(field) is None for field in critical_fields)
@@ -106,7 +343,7 @@ def generate_library():
                 logger.info(f"Using extracted name '{extracted_name}' for {title['filename']}")
         title.update(info_from_titledb)
         if title['type'] == APP_TYPE_BASE:
-            library_status = get_library_status(title['app_id'])
+            library_status = get_library_status(title['app_id'], files_by_title.get(title['app_id'].upper(), []))
             title.update(library_status)
             title['title_id_name'] = title['name']
         if title['type'] == APP_TYPE_DLC:
@@ -134,16 +371,161 @@ def generate_library():
             titleid_info = get_game_info(title['title_id'])
             title['title_id_name'] = titleid_info['name']
         games_info.append(title)
-    titles_library = sorted(games_info, key=lambda x: (
+    return games_info
+
+
+def sort_library(games_info):
+    return sorted(games_info, key=lambda x: (
         "title_id_name" not in x, 
         x.get("title_id_name", "Unrecognized") or "Unrecognized", 
-        x.get('app_id', "") or ""
+        x.get('app_id', "") or "",
+        x.get('filepath', "") or ""
     ))
+
+
+def generate_library():
+    logger.info(f'Generating library ...')
+    titles = get_all_titles_from_db()
+    titles_library = sort_library(build_library_entries(titles, group_files_by_title(titles)))
     logger.info(f'Generating library done.')
 
     return titles_library
 
 
+class LibraryModel:
+    """In-memory library updated title by title.
+
+    Library entries are kept grouped by the title ID of their file. Changes
+    to the Files table are reported with invalidate(), and refresh() only
+    recomputes the entries of the titles that were touched since the last
+    refresh. invalidate() without title IDs schedules a full rebuild.
+
+    With several worker processes, each one has its own model and the
+    touched title IDs are published to the others through `shared_changes`,
+    see sync().
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries_by_title = {}
+        # base app ID -> title IDs of groups holding a base file with that app ID
+        # when it differs from the file title ID, their status depends on both
+        self.status_dependents = {}
+        self.dirty_titles = set()
+        self.needs_full_rebuild = True
+        self.generation = 0
+        self._library = None
+        # SharedChangeLog publishing changes to the other worker processes, if any
+        self.shared_changes = None
+
+    def invalidate(self, title_ids=None):
+        with self.lock:
+            if title_ids is None:
+                self.needs_full_rebuild = True
+            else:
+                title_ids = set(t.upper() for t in title_ids if t)
+                if not title_ids:
+                    return
+                self.dirty_titles.update(title_ids)
+            self.generation += 1
+            if self.shared_changes is not None:
+                self.shared_changes.publish(None if title_ids is None else sorted(title_ids))
+
+    def sync(self):
+        """Invalidate the titles other worker processes changed, returns True if any."""
+        if self.shared_changes is None:
+            return False
+        title_ids = self.shared_changes.read()
+        if title_ids is not None and not title_ids:
+            return False
+        with self.lock:
+            if title_ids is None:
+                self.needs_full_rebuild = True
+            else:
+                self.dirty_titles.update(title_ids)
+            self.generation += 1
+        return True
+
+    def refresh(self):
+        """Apply pending changes and return the sorted library, needs an app context."""
+        with self.lock:
+            if self.needs_full_rebuild:
+                self._rebuild()
+            elif self.dirty_titles:
+                self._update(self.dirty_titles)
+            self.dirty_titles = set()
+            if self._library is None:
+                self._library = sort_library(
+                    entry for entries in self.entries_by_title.values() for entry in entries
+                )
+            return self._library
+
+    def get_library(self):
+        return self.refresh()
+
+    def _rebuild(self):
+        logger.info('Generating library ...')
+        files = get_all_titles_from_db()
+        files_by_title = group_files_by_title(files)
+        self.entries_by_title = {}
+        self.status_dependents = {}
+        for title_id, title_files in files_by_title.items():
+            self._set_title_entries(title_id, title_files, files_by_title)
+        self.needs_full_rebuild = False
+        self._library = None
+        logger.info('Generating library done.')
+
+    def _update(self, title_ids):
+        title_ids = set(title_ids)
+        for title_id in list(title_ids):
+            title_ids.update(self.status_dependents.get(title_id, ()))
+        logger.info(f'Updating library for {len(title_ids)} titles ...')
+
+        files_by_title = get_files_by_title_ids(title_ids)
+        base_app_ids = set(
+            f['app_id'].upper() for title_files in files_by_title.values() for f in title_files
+            if f['type'] == APP_TYPE_BASE and f['app_id']
+        )
+        missing_app_ids = base_app_ids - set(files_by_title) - title_ids
+        if missing_app_ids:
+            files_by_title.update(get_files_by_title_ids(missing_app_ids))
+
+        for title_id in title_ids:
+            self._set_title_entries(title_id, files_by_title.get(title_id, []), files_by_title)
+        self._library = None
+
+    def _set_title_entries(self, title_id, title_files, files_by_title):
+        for dependents in self.status_dependents.values():
+            dependents.discard(title_id)
+        entries = build_library_entries(title_files, files_by_title)
+        if entries:
+            self.entries_by_title[title_id] = entries
+        else:
+            self.entries_by_title.pop(title_id, None)
+        for f in title_files:
+            if title_id and f['type'] == APP_TYPE_BASE and f['app_id'] and f['app_id'].upper() != title_id:
+                self.status_dependents.setdefault(f['app_id'].upper(), set()).add(title_id)
+
+    def check_consistency(self):
+        """Compare the model with a full rebuild of the library.
+
+        Returns the differences as a list of (source, entry) tuples, where
+        source is 'model' for entries only found in the model and 'rebuild'
+        for entries only found in the full rebuild. Empty when consistent.
+        """
+        def canonical(entries):
+            return Counter(json.dumps(entry, sort_keys=True, default=str) for entry in entries)
+
+        model_entries = canonical(self.refresh())
+        rebuilt_entries = canonical(generate_library())
+        differences = [('model', json.loads(e)) for e in (model_entries - rebuilt_entries).elements()]
+        differences += [('rebuild', json.loads(e)) for e in (rebuilt_entries - model_entries).elements()]
+        return differences
+
+
+library_model = LibraryModel()
+
+
 def sanitize_filename(filename):
     """Remove or replace characters that are invalid in filenames"""
     # Remove or replace invalid characters
@@ -272,8 +654,71 @@ def preview_library_organization(library_paths=None, organize_by_name=True):
     return changes, errors
 
 
-def apply_library_organization(changes, dry_run=False, remove_empty_folders=True):
-    """Apply the organization changes to the library"""
+def _apply_organization_change(change, dry_run, results, processed_destinations):
+    """Move one file of the library organization, adding the outcome to `results`"""
+    old_path = change['old_path']
+    new_path = change['new_path']
+    
+    try:
+        if not dry_run:
+            # Create directory if it doesn't exist
+            new_dir = os.path.dirname(new_path)
+            os.makedirs(new_dir, exist_ok=True)
+            
+            # Check if destination already exists
+            if os.path.exists(new_path) and old_path.lower() != new_path.lower():
+                # Check if files are identical by comparing size
+                old_size = os.path.getsize(old_path) if os.path.exists(old_path) else 0
+                new_size = os.path.getsize(new_path)
+                
+                if old_size == new_size:
+                    # Files are likely the same, skip and mark for potential deletion
+                    results['skipped'].append({
+                        'file': old_path,
+                        'reason': f'Identical file already exists at destination: {new_path}',
+                        'can_delete': True
+                    })
+                else:
+                    # Files are different, don't overwrite
+                    results['errors'].append({
+                        'file': old_path,
+                        'error': f'Destination already exists: {new_path}'
+                    })
+                return
+            
+            # Check if we've already processed a file going to this destination
+            if new_path.lower() in processed_destinations:
+                results['errors'].append({
+                    'file': old_path,
+                    'error': f'Another file is already being moved to: {new_path}'
+                })
+                return
+            
+            # Move the file
+            shutil.move(old_path, new_path)
+            processed_destinations.add(new_path.lower())
+            
+            # Update database
+            library_model.invalidate([update_file_path(change['library'], old_path, new_path)])
+            
+        results['success'].append({
+            'old_path': old_path,
+            'new_path': new_path
+        })
+        
+    except Exception as e:
+        results['errors'].append({
+            'file': old_path,
+            'error': str(e)
+        })
+        logger.error(f'Error organizing file {old_path}: {e}')
+
+
+def apply_library_organization(changes, dry_run=False, remove_empty_folders=True, progress_callback=None):
+    """Apply the organization changes to the library
+
+    `progress_callback(done, total)` is called after each change.
+    """
     results = {
         'success': [],
         'errors': [],
@@ -283,63 +728,10 @@ def apply_library_organization(changes, dry_run=False, remove_empty_folders=True
     # Track processed files to avoid moving duplicates
     processed_destinations = set()
     
-    for change in changes:
-        old_path = change['old_path']
-        new_path = change['new_path']
-        
-        try:
-            if not dry_run:
-                # Create directory if it doesn't exist
-                new_dir = os.path.dirname(new_path)
-                os.makedirs(new_dir, exist_ok=True)
-                
-                # Check if destination already exists
-                if os.path.exists(new_path) and old_path.lower() != new_path.lower():
-                    # Check if files are identical by comparing size
-                    old_size = os.path.getsize(old_path) if os.path.exists(old_path) else 0
-                    new_size = os.path.getsize(new_path)
-                    
-                    if old_size == new_size:
-                        # Files are likely the same, skip and mark for potential deletion
-                        results['skipped'].append({
-                            'file': old_path,
-                            'reason': f'Identical file already exists at destination: {new_path}',
-                            'can_delete': True
-                        })
-                    else:
-                        # Files are different, don't overwrite
-                        results['errors'].append({
-                            'file': old_path,
-                            'error': f'Destination already exists: {new_path}'
-                        })
-                    continue
-                
-                # Check if we've already processed a file going to this destination
-                if new_path.lower() in processed_destinations:
-                    results['errors'].append({
-                        'file': old_path,
-                        'error': f'Another file is already being moved to: {new_path}'
-                    })
-                    continue
-                
-                # Move the file
-                shutil.move(old_path, new_path)
-                processed_destinations.add(new_path.lower())
-                
-                # Update database
-                update_file_path(change['library'], old_path, new_path)
-                
-            results['success'].append({
-                'old_path': old_path,
-                'new_path': new_path
-            })
-            
-        except Exception as e:
-            results['errors'].append({
-                'file': old_path,
-                'error': str(e)
-            })
-            logger.error(f'Error organizing file {old_path}: {e}')
+    for n, change in enumerate(changes, 1):
+        _apply_organization_change(change, dry_run, results, processed_destinations)
+        if progress_callback is not None:
+            progress_callback(n, len(changes))
     
     # Clean up empty directories after organization (if requested)
     if not dry_run and results['success'] and remove_empty_folders:
@@ -540,14 +932,17 @@ def find_duplicate_updates(title_id=None):
     return [d for d in all_duplicates if d['type'] == 'Update']
 
 
-def delete_duplicate_updates(duplicates, dry_run=False):
-    """Delete duplicate update files"""
+def delete_duplicate_updates(duplicates, dry_run=False, progress_callback=None):
+    """Delete duplicate update files
+
+    `progress_callback(done, total)` is called after each file.
+    """
     results = {
         'deleted': [],
         'errors': []
     }
     
-    for dup in duplicates:
+    for n, dup in enumerate(duplicates, 1):
         filepath = dup['filepath']
         
         try:
@@ -558,7 +953,7 @@ def delete_duplicate_updates(duplicates, dry_run=False):
                     logger.info(f"Deleted duplicate update: {filepath}")
                 
                 # Remove from database
-                delete_file_by_filepath(filepath)
+                library_model.invalidate([delete_file_by_filepath(filepath)])
             
             results['deleted'].append({
                 'filepath': filepath,
@@ -573,6 +968,9 @@ def delete_duplicate_updates(duplicates, dry_run=False):
                 'error': str(e)
             })
             logger.error(f'Error deleting file {filepath}: {e}')
+
+        if progress_callback is not None:
+            progress_callback(n, len(duplicates))
     
     return results
 
@@ -0,0 +1,135 @@
+"""Coordination of the processes of a production server running several workers"""
+import os
+import logging
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where the server runs in a single process
+    fcntl = None
+
+# Retrieve main logger
+logger = logging.getLogger('main')
+
+
+class FileLock:
+    """Lock shared by all processes opening the same file, released when the holder exits."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self, blocking=True):
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+# size past which the change log is started over
+CHANGE_LOG_MAX_SIZE = 1024 * 1024
+
+
+class SharedChangeLog:
+    """Changed items appended to a file by a process, to notify the other ones.
+
+    Each process reads the entries appended since its last read, skipping
+    its own. An entry without items, or a log started over once it grows
+    past CHANGE_LOG_MAX_SIZE, means that everything may have changed.
+    """
+
+    def __init__(self, path, owner=None):
+        self.path = path
+        self.owner = str(owner or os.getpid())
+        # entries written before this process started are already applied
+        open(self.path, 'a').close()
+        self.inode, self.position = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+    def _open_locked(self):
+        """Log opened for appending, locked against other writers"""
+        while True:
+            f = open(self.path, 'a')
+            if fcntl is None:
+                return f
+            fcntl.flock(f, fcntl.LOCK_EX)
+            # started over by another process while waiting for the lock
+            if os.fstat(f.fileno()).st_ino == self._stat()[0]:
+                return f
+            f.close()
+
+    def publish(self, items=None):
+        """Append the changed items, None if everything may have changed"""
+        entry = f'{self.owner} {"*" if items is None else " ".join(items)}\n'
+        with self._open_locked() as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size + len(entry) <= CHANGE_LOG_MAX_SIZE:
+                f.write(entry)
+                return
+            # the new log only holds our own entry, nothing to read from it
+            # unless entries of the other processes were left unread in the old one
+            caught_up = stat.st_ino == self.inode and not self._has_unread_entries(stat.st_size)
+            tmp_path = f'{self.path}.{os.getpid()}'
+            with open(tmp_path, 'w') as tmp:
+                tmp.write(entry)
+                tmp.flush()
+                new_stat = os.fstat(tmp.fileno())
+            os.replace(tmp_path, self.path)
+            if caught_up:
+                self.inode, self.position = new_stat.st_ino, new_stat.st_size
+
+    def _has_unread_entries(self, size):
+        """Whether the locked log holds entries of other processes not read yet"""
+        with open(self.path, 'rb') as f:
+            f.seek(self.position)
+            data = f.read(size - self.position)
+        owner = self.owner.encode()
+        return any(entry.partition(b' ')[0] != owner for entry in data.splitlines())
+
+    def read(self):
+        """Items changed by the other processes since the last call.
+
+        Returns an empty set if nothing changed, None if everything may
+        have changed.
+        """
+        inode, size = self._stat()
+        if inode == self.inode and size == self.position:
+            return set()
+        if inode != self.inode or size < self.position:
+            self.inode, self.position = inode, size
+            return None
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_ino != inode:
+                return None
+            f.seek(self.position)
+            data = f.read(size - self.position)
+        # an entry being written is read on the next call
+        data = data[:data.rfind(b'\n') + 1]
+        self.position += len(data)
+        changed = set()
+        for entry in data.decode().splitlines():
+            owner, _, items = entry.partition(' ')
+            if owner == self.owner:
+                continue
+            if items == '*':
+                return None
+            changed.update(items.split())
+        return changed
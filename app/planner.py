@@ -0,0 +1,221 @@
+"""Batch downloads of the missing content of the library: Jackett searches queued to qBittorrent"""
+from utils import format_bytes
+from automation import get_info_hash
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import re
+import logging
+
+# Retrieve main logger
+logger = logging.getLogger('main')
+
+# Jackett searches running at the same time
+PLANNER_SEARCH_WORKERS = 4
+PLANNER_MAX_SEARCH_WORKERS = 16
+PLANNER_SEARCH_LIMIT = 150
+# torrents sent in each torrents/add request
+PLANNER_ADD_BATCH_SIZE = 200
+
+SEARCH_TYPES = ('base', 'update', 'dlc')
+
+
+def score_search_result(result, search_type, title_id):
+    """Add the relevance of a search result, and its formatted size"""
+    title = result['title'].lower()
+
+    # Don't filter out results, just add relevance scoring
+    result['relevance'] = 1.0
+
+    # Boost relevance for Nintendo Switch content
+    if any(keyword in title for keyword in ['nsw', 'switch', 'nsp', 'nsz', 'xci', 'xcz']):
+        result['relevance'] *= 1.2
+
+    # Relevance scoring based on search type (but don't exclude)
+    if search_type == 'update':
+        if 'update' in title or 'patch' in title:
+            result['relevance'] *= 1.5
+    elif search_type == 'dlc':
+        if 'dlc' in title:
+            result['relevance'] *= 1.5
+
+    # Check if title contains the Title ID - big relevance boost
+    if title_id and title_id.lower() in title:
+        result['has_title_id'] = True
+        result['relevance'] *= 2.0
+    else:
+        result['has_title_id'] = False
+
+    # Format file size
+    if result['size'] > 0:
+        result['size_formatted'] = format_bytes(result['size'])
+    else:
+        result['size_formatted'] = 'Unknown'
+    return result
+
+
+def clean_search_name(name):
+    """Game name without the symbols interfering with searches, as on the missing content page"""
+    name = re.sub(r'[™®©:]', '', name)
+    name = re.sub(r'[‘’]', "'", name)
+    name = re.sub(r'[“”]', '"', name)
+    return ' '.join(name.split())
+
+
+def plan_searches(missing, search_types=SEARCH_TYPES):
+    """Searches for the output of get_missing_content, one per title and type"""
+    searches = []
+    if 'base' in search_types:
+        for item in missing['missing_base']:
+            searches.append({'type': 'base', 'title_id': item['title_id'], 'name': item['name'],
+                             'query': clean_search_name(item['name'])})
+    if 'update' in search_types:
+        for item in missing['missing_updates']:
+            searches.append({'type': 'update', 'title_id': item['title_id'], 'name': item['name'],
+                             'query': clean_search_name(item['name']) + ' update',
+                             'version': item['latest_version']})
+    if 'dlc' in search_types:
+        for item in missing['missing_dlc']:
+            searches.append({'type': 'dlc', 'title_id': item['title_id'], 'name': item['name'],
+                             'query': clean_search_name(item['name']) + ' DLC',
+                             'dlcs': [dlc['app_id'] for dlc in item['missing_dlcs']]})
+    return searches
+
+
+def choose_result(results, search_type, title_id, min_seeders=1, require_title_id=False):
+    """Best downloadable result of a search, None if there is none
+
+    Results are ranked like on the search page, except that those naming
+    the title ID come first.
+    """
+    candidates = []
+    for result in results:
+        score_search_result(result, search_type, title_id)
+        if not (result.get('magnet_link') or result.get('link')):
+            continue
+        if result['seeders'] < min_seeders or (require_title_id and not result['has_title_id']):
+            continue
+        candidates.append(result)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda result: (result['has_title_id'], result['relevance'], result['seeders']))
+
+
+def summarize_result(result):
+    return {
+        'title': result['title'],
+        'size': result['size'],
+        'size_formatted': result['size_formatted'],
+        'seeders': result['seeders'],
+        'indexer': result.get('indexer', ''),
+        'info_hash': get_info_hash(result),
+        'relevance': result['relevance'],
+        'has_title_id': result['has_title_id'],
+    }
+
+
+def plan_missing_downloads(missing, search, qbit_client=None, qbit_config=None, download_path=None,
+                           search_types=SEARCH_TYPES, workers=PLANNER_SEARCH_WORKERS, min_seeders=1,
+                           require_title_id=False, progress_callback=None):
+    """Search torrents for the missing content and queue the best ones
+
+    Args:
+        missing: Output of get_missing_content
+        search: Function of (query) returning (success, results/error_message)
+        qbit_client: Client the chosen torrents are added to, nothing is
+            added without it
+        progress_callback: Called with (searches done, total, message)
+
+    Returns:
+        Report of the run, with the status of each search: queued,
+        planned (not added), already_queued, not_found, search_failed or
+        add_failed
+    """
+    searches = plan_searches(missing, search_types)
+    total = len(searches)
+    report = {
+        'dry_run': qbit_client is None,
+        'total': total,
+        'items': searches,
+        'summary': {},
+    }
+    if progress_callback and total:
+        progress_callback(0, total, 'Searching')
+
+    # torrents qBittorrent already has are not added again
+    existing_hashes = set()
+    if qbit_client is not None:
+        success, torrents = qbit_client.sync_torrents()
+        if success:
+            existing_hashes = {torrent['hash'].lower() for torrent in torrents}
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, PLANNER_MAX_SEARCH_WORKERS)))
+    try:
+        futures = {executor.submit(search, item['query']): item for item in searches}
+        for done, future in enumerate(as_completed(futures), 1):
+            item = futures[future]
+            try:
+                success, results = future.result()
+            except Exception as e:
+                success, results = False, f'Search error: {str(e)}'
+            if not success:
+                item['status'] = 'search_failed'
+                item['message'] = results
+            else:
+                chosen = choose_result(results, item['type'], item['title_id'], min_seeders, require_title_id)
+                if chosen is None:
+                    item['status'] = 'not_found'
+                    item['message'] = f'None of {len(results)} results can be downloaded'
+                else:
+                    item['status'] = 'planned'
+                    item['torrent'] = summarize_result(chosen)
+                    item['url'] = chosen.get('magnet_link') or chosen['link']
+            if progress_callback:
+                progress_callback(done, total, item['name'])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # the same torrent can be chosen for several titles, like collections
+    urls = []
+    urls_by_hash = {}
+    planned = []
+    for item in searches:
+        if item['status'] != 'planned':
+            continue
+        info_hash = item['torrent']['info_hash']
+        if info_hash and info_hash in existing_hashes:
+            item['status'] = 'already_queued'
+            item['message'] = 'Already in qBittorrent'
+            continue
+        planned.append(item)
+        if info_hash and info_hash in urls_by_hash:
+            item['url'] = urls_by_hash[info_hash]
+            item['message'] = 'Same torrent as another title'
+            continue
+        if info_hash:
+            urls_by_hash[info_hash] = item['url']
+        urls.append(item['url'])
+
+    if qbit_client is not None and planned:
+        category = (qbit_config or {}).get('category', '')
+        added_urls = set()
+        for start in range(0, len(urls), PLANNER_ADD_BATCH_SIZE):
+            batch = urls[start:start + PLANNER_ADD_BATCH_SIZE]
+            # one request for the whole batch, URLs separated by newlines
+            success, message, _ = qbit_client.add_torrent('\n'.join(batch), category=category, save_path=download_path)
+            if success:
+                added_urls.update(batch)
+            else:
+                logger.error(f'Failed to add {len(batch)} torrents: {message}')
+                failed_urls = set(batch)
+                for item in planned:
+                    if item['url'] in failed_urls:
+                        item['message'] = message
+        for item in planned:
+            if item['status'] == 'planned':
+                item['status'] = 'queued' if item['url'] in added_urls else 'add_failed'
+        logger.info(f'Queued {len(added_urls)} torrents for {total} missing titles.')
+
+    for item in searches:
+        item.pop('url', None)
+        report['summary'][item['status']] = report['summary'].get(item['status'], 0) + 1
+    report['torrents'] = len(urls)
+    return report
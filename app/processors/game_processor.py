@@ -6,6 +6,9 @@ import logging
 import zipfile
 import tarfile
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import ExitStack
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 from enum import Enum
@@ -25,6 +28,51 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+ARCHIVE_EXTENSIONS = ('.tar.gz', '.tar.bz2', '.zip', '.rar', '.7z', '.tar', '.tgz')
+# volumes of multi-part RAR archives, the next ones are extracted with the first one
+RAR_VOLUME_PATTERN = re.compile(r'\.part(\d+)\.rar$', re.IGNORECASE)
+
+# archives extracted at the same time, and at the same time on each disk:
+# more concurrent readers or writers on a hard drive mostly add seeks
+EXTRACT_WORKERS = 4
+EXTRACT_WORKERS_PER_DEVICE = 2
+
+
+def archive_extension(file_path) -> Optional[str]:
+    """Archive extension of a file name, including .tar.gz and .tar.bz2"""
+    name = str(file_path).lower()
+    for ext in ARCHIVE_EXTENSIONS:
+        if name.endswith(ext):
+            return ext
+    return None
+
+
+class DeviceLimiter:
+    """Limits the extractions reading from or writing to each disk"""
+    
+    def __init__(self, per_device: int = EXTRACT_WORKERS_PER_DEVICE):
+        self.per_device = max(1, per_device)
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        
+    def _device(self, path: Path) -> int:
+        # the parent of a file not created yet
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        return path.stat().st_dev
+        
+    def slots(self, *paths: Path) -> ExitStack:
+        """Context holding a slot on the disks of every path"""
+        devices = sorted({self._device(Path(path)) for path in paths})
+        with self.lock:
+            semaphores = [self.semaphores.setdefault(device, threading.Semaphore(self.per_device)) for device in devices]
+        stack = ExitStack()
+        # always acquired in device order, so two extractions cannot deadlock
+        for semaphore in semaphores:
+            semaphore.acquire()
+            stack.callback(semaphore.release)
+        return stack
+
 
 class GameType(Enum):
     BASE = "BASE"
@@ -50,7 +98,7 @@ class ArchiveHandler:
         extract_to.mkdir(parents=True, exist_ok=True)
         
         # Determine archive type and extract
-        ext = archive_path.suffix.lower()
+        ext = archive_extension(archive_path) or archive_path.suffix.lower()
         
         try:
             if ext in ['.zip']:
@@ -140,6 +188,8 @@ class SwitchGameProcessor:
         self.archive_handler = ArchiveHandler(
             passwords=config.get('extract_passwords', [])
         )
+        self.extract_workers = max(1, config.get('extract_workers') or EXTRACT_WORKERS)
+        self.device_limiter = DeviceLimiter(config.get('extract_workers_per_device') or EXTRACT_WORKERS_PER_DEVICE)
         self.platform_info = self._get_platform_info()
         
     def _get_platform_info(self) -> Dict[str, any]:
@@ -178,7 +228,11 @@ class SwitchGameProcessor:
                          auto_organize: bool = True,
                          use_hardlinks: bool = True,
                          delete_after_process: bool = False) -> Dict[str, any]:
-        """Process all game files in a directory"""
+        """Process all game files in a directory
+        
+        Archives are extracted concurrently, and the game files of each
+        archive are organized as soon as it is extracted.
+        """
         source_path = Path(source_dir)
         target_path = Path(target_dir)
         
@@ -203,66 +257,28 @@ class SwitchGameProcessor:
             # Step 1: Process source directory (could be file or directory)
             if source_path.is_file():
                 # Single file download - check if it's an archive or game file
+                archives, game_files = [], []
                 if self._is_archive(source_path):
-                    if auto_extract:
-                        extracted_files = self._process_archive(source_path, results, temp_dirs)
-                        if extracted_files:
-                            processed_archives.append(source_path)
-                            # Process extracted files
-                            for game_file in extracted_files:
-                                if auto_organize:
-                                    success, message = self._organize_game_file(
-                                        game_file, target_path, use_hardlinks
-                                    )
-                                    if success:
-                                        results['files_organized'] += 1
-                                        results['processed'].append({
-                                            'file': str(game_file),
-                                            'message': message
-                                        })
-                                    else:
-                                        results['errors'].append(f"{game_file.name}: {message}")
+                    archives.append(source_path)
                 elif self._is_game_file(source_path):
-                    if auto_organize:
-                        success, message = self._organize_game_file(
-                            source_path, target_path, use_hardlinks
-                        )
-                        if success:
-                            results['files_organized'] += 1
-                            results['processed'].append({
-                                'file': str(source_path),
-                                'message': message
-                            })
-                        else:
-                            results['errors'].append(f"{source_path.name}: {message}")
+                    game_files.append(source_path)
             else:
-                # Directory download - process recursively
-                if auto_extract:
-                    # Find and extract all archives first
-                    archives = self._find_archives(source_path)
-                    for archive in archives:
-                        extracted_files = self._process_archive(archive, results, temp_dirs)
-                        if extracted_files:
-                            processed_archives.append(archive)
+                # Directory download - a single walk finds archives and game files
+                archives, game_files = self._scan_tree(source_path)
                 
-                # Find and organize all game files (including from extractions)
+            def organize(files):
                 if auto_organize:
-                    # Search entire source directory and all temp directories
-                    search_dirs = [source_path] + temp_dirs
-                    for search_dir in search_dirs:
-                        game_files = self._find_game_files(search_dir)
-                        for game_file in game_files:
-                            success, message = self._organize_game_file(
-                                game_file, target_path, use_hardlinks
-                            )
-                            if success:
-                                results['files_organized'] += 1
-                                results['processed'].append({
-                                    'file': str(game_file),
-                                    'message': message
-                                })
-                            else:
-                                results['errors'].append(f"{game_file.name}: {message}")
+                    self._organize_files(files, target_path, use_hardlinks, results)
+                    
+            # Step 2: Extract archives while organizing game files
+            if auto_extract and archives:
+                self._extract_archives(
+                    archives, results, temp_dirs, processed_archives,
+                    on_extracted=organize,
+                    before_wait=lambda: organize(game_files)
+                )
+            else:
+                organize(game_files)
             
             # Step 3: Cleanup if configured
             if delete_after_process and results['files_organized'] > 0:
@@ -291,67 +307,113 @@ class SwitchGameProcessor:
                     
         return results
         
-    def _find_archives(self, directory: Path) -> List[Path]:
-        """Find all supported archive files in directory"""
-        archive_extensions = {'.zip', '.rar', '.7z', '.tar', '.tar.gz', '.tgz', '.tar.bz2'}
+    def _organize_files(self, game_files: List[Path], target_path: Path, use_hardlinks: bool, results: Dict):
+        for game_file in game_files:
+            success, message = self._organize_game_file(
+                game_file, target_path, use_hardlinks
+            )
+            if success:
+                results['files_organized'] += 1
+                results['processed'].append({
+                    'file': str(game_file),
+                    'message': message
+                })
+            else:
+                results['errors'].append(f"{game_file.name}: {message}")
+                
+    def _extract_archives(self, archives: List[Path], results: Dict, temp_dirs: List[Path],
+                          processed_archives: List[Path], on_extracted, before_wait=None):
+        """Extract archives, and the archives they contain, with a pool of threads
+        
+        `on_extracted` is called with the game files of each archive once
+        it is extracted, `before_wait` once the extractions are started.
+        Results are only changed by the calling thread.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.extract_workers)
+        try:
+            # extraction futures by archive, with the archive it was found in
+            pending = {}
+            
+            def submit(archive, parent=None):
+                # Create temporary directory for extraction
+                temp_dir = Path(tempfile.mkdtemp(prefix=f"ownfoil_extract_{archive.stem}_"))
+                temp_dirs.append(temp_dir)
+                future = executor.submit(self._extract_to_temp, archive, temp_dir)
+                pending[future] = (archive, parent)
+                
+            for archive in archives:
+                submit(archive)
+            if before_wait is not None:
+                before_wait()
+                
+            # top level archives with game files, directly or in nested archives
+            archives_with_games = set()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    archive, parent = pending.pop(future)
+                    success, message, game_files, nested_archives = future.result()
+                    if not success:
+                        results['errors'].append(f"Failed to extract {archive.name}: {message}")
+                        continue
+                    results['archives_extracted'] += 1
+                    logger.info(f"Extracted {archive.name} to temporary directory")
+                    top_archive = parent or archive
+                    if game_files:
+                        archives_with_games.add(top_archive)
+                        on_extracted(game_files)
+                    # Also check for nested archives
+                    for nested_archive in nested_archives:
+                        logger.info(f"Found nested archive: {nested_archive.name}")
+                        submit(nested_archive, top_archive)
+            processed_archives.extend(archive for archive in archives if archive in archives_with_games)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            
+    def _extract_to_temp(self, archive: Path, temp_dir: Path) -> Tuple[bool, str, List[Path], List[Path]]:
+        """Extract an archive, returns its game files and nested archives"""
+        try:
+            with self.device_limiter.slots(archive, temp_dir):
+                success, message = self.archive_handler.extract(str(archive), str(temp_dir))
+        except Exception as e:
+            success, message = False, f"Extraction failed: {str(e)}"
+        if not success:
+            return False, message, [], []
+        archives, game_files = self._scan_tree(temp_dir)
+        return True, message, game_files, archives
+        
+    def _scan_tree(self, directory: Path) -> Tuple[List[Path], List[Path]]:
+        """Archives and game files of a directory tree, listed with a single walk"""
         archives = []
+        game_files = []
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if self._is_game_file(Path(filename)):
+                    game_files.append(Path(dirpath) / filename)
+                elif archive_extension(filename) and not self._is_next_rar_volume(filename):
+                    archives.append(Path(dirpath) / filename)
+        return archives, game_files
+        
+    def _is_next_rar_volume(self, filename: str) -> bool:
+        """Check if file is the second or a next volume of a multi-part RAR archive"""
+        match = RAR_VOLUME_PATTERN.search(filename)
+        return match is not None and int(match.group(1)) > 1
         
-        for ext in archive_extensions:
-            archives.extend(directory.glob(f'**/*{ext}'))
-            
-        return archives
+    def _find_archives(self, directory: Path) -> List[Path]:
+        """Find all supported archive files in directory"""
+        return self._scan_tree(directory)[0]
         
     def _find_game_files(self, directory: Path) -> List[Path]:
         """Find all Switch game files in directory"""
-        game_files = []
-        
-        for ext in self.GAME_EXTENSIONS:
-            game_files.extend(directory.glob(f'**/*{ext}'))
-            
-        return game_files
+        return self._scan_tree(directory)[1]
         
     def _is_archive(self, file_path: Path) -> bool:
         """Check if file is a supported archive"""
-        archive_extensions = {'.zip', '.rar', '.7z', '.tar', '.tar.gz', '.tgz', '.tar.bz2'}
-        return file_path.suffix.lower() in archive_extensions
+        return archive_extension(file_path) is not None
         
     def _is_game_file(self, file_path: Path) -> bool:
         """Check if file is a Switch game file"""
-        return file_path.suffix.lower() in {f'.{ext}' for ext in self.GAME_EXTENSIONS}
-        
-    def _process_archive(self, archive: Path, results: Dict, temp_dirs: List[Path]) -> List[Path]:
-        """Process an archive file and return list of game files found"""
-        game_files = []
-        
-        # Create temporary directory for extraction
-        temp_dir = Path(tempfile.mkdtemp(prefix=f"ownfoil_extract_{archive.stem}_"))
-        temp_dirs.append(temp_dir)
-        
-        # Extract archive
-        success, message = self.archive_handler.extract(str(archive), str(temp_dir))
-        
-        if success:
-            results['archives_extracted'] += 1
-            logger.info(f"Extracted {archive.name} to temporary directory")
-            
-            # Search for game files in extracted content
-            game_files = self._find_game_files(temp_dir)
-            
-            # Also check for nested archives
-            nested_archives = self._find_archives(temp_dir)
-            for nested_archive in nested_archives:
-                logger.info(f"Found nested archive: {nested_archive.name}")
-                nested_files = self._process_archive(nested_archive, results, temp_dirs)
-                game_files.extend(nested_files)
-        else:
-            results['errors'].append(f"Failed to extract {archive.name}: {message}")
-            
-        return game_files
-        
-    def _extract_archive(self, archive: Path, extract_base: Path) -> Tuple[bool, str]:
-        """Extract archive to a subdirectory"""
-        extract_dir = extract_base / f"{archive.stem}_extracted"
-        return self.archive_handler.extract(str(archive), str(extract_dir))
+        return file_path.suffix.lower() in self.GAME_EXTENSIONS
         
     def _identify_game_type(self, filename: str, title_id: str) -> GameType:
         """Identify if file is BASE, UPDATE, or DLC"""
@@ -1,6 +1,8 @@
 from constants import *
 import yaml
 import os, sys
+import copy
+import threading
 
 sys.path.append(APP_DIR + '/NSTools/py')
 from nstools.nut import Keys
@@ -23,35 +25,89 @@ def load_keys(key_file=KEYS_FILE):
         logger.error(f'Provided keys file {key_file} is invalid.')
     return valid
 
-def load_settings():
+def get_settings_signature():
+    """Size and mtime of the files settings are loaded from"""
+    signature = []
+    for path in (CONFIG_FILE, KEYS_FILE):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+def read_settings():
     if os.path.exists(CONFIG_FILE):
         logger.debug('Reading configuration file.')
         with open(CONFIG_FILE, 'r') as yaml_file:
             settings = yaml.safe_load(yaml_file)
 
         # Merge with default settings to ensure all keys exist
+        merged = False
         for key, value in DEFAULT_SETTINGS.items():
             if key not in settings:
-                settings[key] = value
+                settings[key] = copy.deepcopy(value)
+                merged = True
             elif isinstance(value, dict):
                 # Merge nested dictionaries
                 for subkey, subvalue in value.items():
                     if subkey not in settings[key]:
-                        settings[key][subkey] = subvalue
+                        settings[key][subkey] = copy.deepcopy(subvalue)
+                        merged = True
 
         valid_keys = load_keys()
+        merged = merged or settings['titles'].get('valid_keys') != valid_keys
         settings['titles']['valid_keys'] = valid_keys
 
         # Save the merged settings back
-        with open(CONFIG_FILE, 'w') as yaml_file:
-            yaml.dump(settings, yaml_file)
+        if merged:
+            save_settings(settings)
 
     else:
-        settings = DEFAULT_SETTINGS
-        with open(CONFIG_FILE, 'w') as yaml_file:
-            yaml.dump(settings, yaml_file)
+        settings = copy.deepcopy(DEFAULT_SETTINGS)
+        save_settings(settings)
     return settings
 
+def save_settings(settings):
+    with open(CONFIG_FILE, 'w') as yaml_file:
+        yaml.dump(settings, yaml_file)
+    settings_store.invalidate()
+
+
+class SettingsStore:
+    """Settings kept in memory, reloaded only when the settings or keys files change.
+
+    The same settings object is returned until a reload, it must not be
+    modified: setters work on a copy and save it with save_settings().
+    """
+
+    def __init__(self):
+        # reentrant, read_settings() invalidates the store when saving merged settings
+        self.lock = threading.RLock()
+        self.settings = None
+        self.signature = None
+
+    def get(self):
+        with self.lock:
+            if self.settings is None or get_settings_signature() != self.signature:
+                self.settings = read_settings()
+                # after reading, which can save merged settings
+                self.signature = get_settings_signature()
+            return self.settings
+
+    def invalidate(self):
+        with self.lock:
+            self.settings = None
+
+settings_store = SettingsStore()
+
+def load_settings():
+    return settings_store.get()
+
+def load_settings_copy():
+    """Settings that can be modified and saved"""
+    return copy.deepcopy(load_settings())
+
 def verify_settings(section, data):
     success = True
     errors = []
@@ -77,7 +133,7 @@ def add_library_path_to_settings(path):
             'error': f"Path {path} does not exists."
         })
     else:
-        settings = load_settings()
+        settings = load_settings_copy()
         library_paths = settings['library']['paths']
         if library_paths:
             if path in library_paths:
@@ -91,21 +147,19 @@ def add_library_path_to_settings(path):
         else:
             library_paths = [path]
         settings['library']['paths'] = library_paths
-        with open(CONFIG_FILE, 'w') as yaml_file:
-            yaml.dump(settings, yaml_file)
+        save_settings(settings)
     return success, errors
 
 def delete_library_path_from_settings(path):
     success = True
     errors = []
-    settings = load_settings()
+    settings = load_settings_copy()
     library_paths = settings['library']['paths']
     if library_paths:
         if path in library_paths:
             library_paths.remove(path)
             settings['library']['paths'] = library_paths
-            with open(CONFIG_FILE, 'w') as yaml_file:
-                yaml.dump(settings, yaml_file)
+            save_settings(settings)
         else:
             success = False
             errors.append({
@@ -115,25 +169,22 @@ def delete_library_path_from_settings(path):
     return success, errors
 
 def set_titles_settings(region, language):
-    settings = load_settings()
+    settings = load_settings_copy()
     settings['titles']['region'] = region
     settings['titles']['language'] = language
-    with open(CONFIG_FILE, 'w') as yaml_file:
-        yaml.dump(settings, yaml_file)
+    save_settings(settings)
 
 def set_shop_settings(data):
-    settings = load_settings()
+    settings = load_settings_copy()
     shop_host = data['host']
     if '://' in shop_host:
         data['host'] = shop_host.split('://')[-1]
     settings['shop'].update(data)
-    with open(CONFIG_FILE, 'w') as yaml_file:
-        yaml.dump(settings, yaml_file)
+    save_settings(settings)
 
 def set_automation_settings(data):
-    settings = load_settings()
+    settings = load_settings_copy()
     if 'automation' not in settings:
         settings['automation'] = {}
     settings['automation'].update(data)
-    with open(CONFIG_FILE, 'w') as yaml_file:
-        yaml.dump(settings, yaml_file)
+    save_settings(settings)
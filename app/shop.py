@@ -6,6 +6,8 @@ from Crypto.Cipher import AES
 import zstandard as zstd
 import random
 import json
+import hashlib
+import threading
 
 # https://github.com/blawar/tinfoil/blob/master/docs/files/public.key 1160174fa2d7589831f74d149bc403711f3991e4
 TINFOIL_PUBLIC_KEY = '''-----BEGIN PUBLIC KEY-----
@@ -62,3 +64,34 @@ def encrypt_shop(shop):
 
     binary_data = b'TINFOIL' + flag.to_bytes(1, byteorder='little') + sessionKey + sz.to_bytes(8, 'little') + buf
     return binary_data
+
+
+# Shop payloads of the current library generation, by shop header and encryption
+shop_cache_lock = threading.Lock()
+shop_cache = {}
+shop_files_cache = (None, None)
+
+def get_shop_payload(db, generation, shop, encrypt):
+    """Serialized shop and its ETag, regenerated only when the library generation changes.
+
+    `shop` holds the shop header fields, the files are added from the database.
+    """
+    global shop_files_cache
+    key = (json.dumps(shop, sort_keys=True), encrypt)
+    # a single payload is generated at a time, concurrent requests wait for it
+    with shop_cache_lock:
+        cached = shop_cache.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1], cached[2]
+
+        if shop_files_cache[0] != generation:
+            shop_cache.clear()
+            shop_files_cache = (generation, gen_shop_files(db))
+        shop = dict(shop, files=shop_files_cache[1])
+        payload = json.dumps(shop).encode('utf-8')
+        etag = hashlib.sha256(payload).hexdigest()
+        if encrypt:
+            payload = encrypt_shop(shop)
+            etag += '-encrypted'
+        shop_cache[key] = (generation, payload, etag)
+        return payload, etag
@@ -5,6 +5,8 @@ import json
 
 import titledb
 from constants import *
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from binascii import hexlify as hx, unhexlify as uhx
 import logging
@@ -22,21 +24,74 @@ Pfs0.Print.silent = True
 app_id_regex = r"\[([0-9A-Fa-f]{16})\]"
 version_regex = r"\[v?(\d+)\]"  # Match both [v123] and [123] formats
 
-def getDirsAndFiles(path):
-    entries = os.listdir(path)
-    allFiles = []
-    allDirs = []
-
-    for entry in entries:
-        fullPath = os.path.join(path, entry)
-        if os.path.isdir(fullPath):
-            allDirs.append(fullPath)
-            dirs, files = getDirsAndFiles(fullPath)
-            allDirs += dirs
-            allFiles += files
-        elif fullPath.split('.')[-1] in ALLOWED_EXTENSIONS:
-            allFiles.append(fullPath)
-    return allDirs, allFiles
+# Lookup indexes built by load_titledb
+titles_index = {}
+dlcs_by_title = {}
+versions_by_title = {}
+titledb_signature = None
+
+# Game file found by walk_library, stat as (size, mtime in ns, inode) for the identification cache
+LibraryFile = namedtuple('LibraryFile', ['path', 'stat'])
+
+def walk_directory(path, errors=None):
+    """Yield the game files under path, with os.scandir to avoid a stat per directory entry.
+
+    The paths that could not be listed or stat'ed are appended to `errors`,
+    the files under them are unknown rather than removed.
+    """
+    stack = [path]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            stack.append(entry.path)
+                        elif entry.name.split('.')[-1] in ALLOWED_EXTENSIONS:
+                            stat = entry.stat()
+                            yield LibraryFile(entry.path, (stat.st_size, stat.st_mtime_ns, str(stat.st_ino)))
+                    except OSError as e:
+                        logger.warning(f'Failed to read {entry.path}: {e}')
+                        if errors is not None:
+                            errors.append(entry.path)
+        except OSError as e:
+            logger.warning(f'Failed to list {dirpath}: {e}')
+            if errors is not None:
+                errors.append(dirpath)
+
+def walk_library(path, workers=1, errors=None):
+    """Yield the game files under path as LibraryFile, lazily.
+
+    With more than one worker, the top-level subdirectories are walked
+    concurrently, which hides the latency of network shares. The paths
+    that could not be read are appended to `errors`, see walk_directory.
+    """
+    if workers <= 1:
+        yield from walk_directory(path, errors)
+        return
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.path)
+                    elif entry.name.split('.')[-1] in ALLOWED_EXTENSIONS:
+                        stat = entry.stat()
+                        yield LibraryFile(entry.path, (stat.st_size, stat.st_mtime_ns, str(stat.st_ino)))
+                except OSError as e:
+                    logger.warning(f'Failed to read {entry.path}: {e}')
+                    if errors is not None:
+                        errors.append(entry.path)
+    except OSError as e:
+        logger.warning(f'Failed to list {path}: {e}')
+        if errors is not None:
+            errors.append(path)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(lambda subdir: list(walk_directory(subdir, errors)), subdir) for subdir in subdirs]
+        for future in as_completed(futures):
+            yield from future.result()
 
 def get_app_id_from_filename(filename):
     app_id_match = re.search(app_id_regex, filename)
@@ -95,19 +150,85 @@ def identify_appId(app_id):
     
     return title_id.upper(), app_type
 
+def build_titles_index(titles):
+    """Index the regional titles JSON (keyed by nsuId) by title ID.
+
+    Only the fields served by get_game_info are kept. When several nsuIds
+    share a title ID the first one wins, as with the former linear scan.
+    """
+    index = {}
+    for title in titles.values():
+        title_id = title.get('id')
+        if not title_id:
+            continue
+        title_id = title_id.upper()
+        if title_id in index:
+            continue
+        index[title_id] = {
+            'name': title.get('name'),
+            'bannerUrl': title.get('bannerUrl'),
+            'iconUrl': title.get('iconUrl'),
+            'id': title.get('id'),
+            'category': title.get('category'),
+        }
+    return index
+
+def build_dlcs_index(cnmts):
+    """Map each base title ID (as found in cnmts.json) to its DLC app IDs."""
+    index = {}
+    for app_id, app_versions in cnmts.items():
+        for version_description in app_versions.values():
+            base_title_id = version_description.get('otherApplicationId')
+            if version_description.get('titleType') == 130 and base_title_id:
+                dlcs = index.setdefault(base_title_id, [])
+                if app_id.upper() not in dlcs:
+                    dlcs.append(app_id.upper())
+    return index
+
+def build_versions_index(versions):
+    """Map each title ID to its (version, update number, release date) tuples."""
+    return {
+        title_id: [
+            (int(version), get_update_number(version), release_date)
+            for version, release_date in title_versions.items()
+        ]
+        for title_id, title_versions in versions.items()
+    }
+
+def get_titledb_signature(app_settings):
+    titledb_files = ['cnmts.json', titledb.get_region_titles_file(app_settings), 'versions.json', 'versions.txt']
+    signature = []
+    for titledb_file in titledb_files:
+        stat = os.stat(os.path.join(TITLEDB_DIR, titledb_file))
+        signature.append((titledb_file, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
 def load_titledb(app_settings):
     global cnmts_db
     global titles_db
     global versions_db
     global versions_txt_db
+    global titles_index
+    global dlcs_by_title
+    global versions_by_title
+    global titledb_signature
+
+    signature = get_titledb_signature(app_settings)
+    if signature == titledb_signature:
+        logger.debug('titledb files unchanged, keeping the loaded indexes.')
+        return
+
     with open(os.path.join(TITLEDB_DIR, 'cnmts.json')) as f:
         cnmts_db = json.load(f)
+    dlcs_by_title = build_dlcs_index(cnmts_db)
 
     with open(os.path.join(TITLEDB_DIR, titledb.get_region_titles_file(app_settings))) as f:
         titles_db = json.load(f)
+    titles_index = build_titles_index(titles_db)
 
     with open(os.path.join(TITLEDB_DIR, 'versions.json')) as f:
         versions_db = json.load(f)
+    versions_by_title = build_versions_index(versions_db)
 
     versions_txt_db = {}
     with open(os.path.join(TITLEDB_DIR, 'versions.txt')) as f:
@@ -118,6 +239,8 @@ def load_titledb(app_settings):
                 version = "0"
             versions_txt_db[app_id] = version
 
+    titledb_signature = signature
+
 def identify_file_from_filename(filename):
     version = get_version_from_filename(filename)
     if version is None:
@@ -160,12 +283,38 @@ def identify_file_from_cnmt(filepath):
 
     return titleId, version, titleType
 
-def identify_file(filepath):
+def init_identification_worker(keys_file):
+    """Process pool initializer, workers need the console keys to read CNMTs."""
+    if not Keys.keys_loaded and os.path.isfile(keys_file):
+        Keys.load(keys_file)
+
+def read_cnmt(filepath):
+    """Read the CNMT of a file in an identification worker.
+
+    Errors are returned instead of raised, as a plain Exception so they can
+    be sent back to the parent process.
+    """
+    try:
+        return filepath, identify_file_from_cnmt(filepath)
+    except Exception as e:
+        return filepath, Exception(str(e))
+
+def identify_file(filepath, cnmt=None, size=None):
+    """Identify a file from its metadata, or from its filename as fallback.
+
+    `cnmt` is the result of identify_file_from_cnmt (or the exception it
+    raised) when it was already read by an identification worker. `size`
+    is the size known from the library walk, the file is stat'ed without it.
+    """
     filedir, filename = os.path.split(filepath)
     extension = filename.split('.')[-1]
     if Keys.keys_loaded:
         try:
-            app_id, version, app_type = identify_file_from_cnmt(filepath)
+            if cnmt is None:
+                cnmt = identify_file_from_cnmt(filepath)
+            elif isinstance(cnmt, Exception):
+                raise cnmt
+            app_id, version, app_type = cnmt
             if app_type != APP_TYPE_BASE:
                 # need to get the title ID from cnmts
                 title_id, app_type = identify_appId(app_id)
@@ -209,7 +358,7 @@ def identify_file(filepath):
         'type': app_type,
         'version': version,
         'extension': extension,
-        'size': get_file_size(filepath),
+        'size': size if size is not None else get_file_size(filepath),
         'identification': identification,
         'extracted_name': extracted_name,  # Fallback name from filename
     }
@@ -237,16 +386,8 @@ def extract_name_from_filename(filename):
     return None
 
 def get_game_info(title_id):
-    try:
-        title_info = [titles_db[t] for t in list(titles_db.keys()) if titles_db[t]['id'] == title_id][0]
-        return {
-            'name': title_info['name'],
-            'bannerUrl': title_info['bannerUrl'],
-            'iconUrl': title_info['iconUrl'],
-            'id': title_info['id'],
-            'category': title_info['category'],
-        }
-    except Exception:
+    title_info = titles_index.get(title_id.upper()) if title_id else None
+    if title_info is None:
         logger.error(f"Title ID not found in titledb: {title_id}")
         return {
             'name': 'Unrecognized',
@@ -255,6 +396,8 @@ def get_game_info(title_id):
             'id': title_id + ' not found in titledb',
             'category': '',
         }
+    # callers update the returned dict in place
+    return dict(title_info)
 
 def get_update_number(version):
     return int(version)//65536
@@ -264,18 +407,18 @@ def get_game_latest_version(all_existing_versions):
 
 def get_all_existing_versions(titleid):
     titleid = titleid.lower()
-    if titleid not in versions_db:
+    if titleid not in versions_by_title:
         # print(f'Title ID not in versions.json: {titleid.upper()}')
         return None
 
-    versions_from_db = versions_db[titleid].keys()
+    # fresh dicts on every call, callers flag the owned versions in place
     return [
         {
-            'version': int(version_from_db),
-            'update_number': get_update_number(version_from_db),
-            'release_date': versions_db[titleid][str(version_from_db)],
+            'version': version,
+            'update_number': update_number,
+            'release_date': release_date,
         }
-        for version_from_db in versions_from_db
+        for version, update_number, release_date in versions_by_title[titleid]
     ]
 
 def get_all_dlc_existing_versions(app_id):
@@ -295,11 +438,5 @@ def get_app_id_version_from_versions_txt(app_id):
         return versions_txt_db.get(app_id, None)
     
 def get_all_existing_dlc(title_id):
-    title_id = title_id.lower()
-    dlcs = []
-    for app_id in cnmts_db.keys():
-        for version, version_description in cnmts_db[app_id].items():
-            if version_description.get('titleType') == 130 and version_description.get('otherApplicationId') == title_id:
-                if app_id.upper() not in dlcs:
-                    dlcs.append(app_id.upper())
-    return dlcs
+    return list(dlcs_by_title.get(title_id.lower(), []))
+
@@ -0,0 +1,7 @@
+"""Entry point of production servers, started from this directory with:
+
+    gunicorn --config gunicorn.conf.py wsgi:app
+"""
+from app import app, init_worker
+
+init_worker()
@@ -0,0 +1,712 @@
+#!/usr/bin/env python3
+"""
+Ownfoil benchmarks
+
+Synthetic benchmarks for the hot paths of the library pipeline.
+Each benchmark is a subcommand, run from the repository root:
+
+    python benchmark.py library --files 20000 --titles 50000
+    python benchmark.py poll --files 50000
+    python benchmark.py walk --files 50000 --workers 4
+    python benchmark.py ingest --files 20000 --batch-size 500
+    python benchmark.py identify --files 400 --workers 4
+    python benchmark.py serve --size-mb 256 --clients 4
+    python benchmark.py downloads http://localhost:8465/api/get_game/1 --clients 8
+    python benchmark.py torznab --items 20000 --limit 150
+    python benchmark.py extract --archives 24 --size-mb 16 --workers 4
+
+The app modules are imported from ./app, so the NSTools submodule
+must be checked out (git clone --recurse-submodules).
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import hashlib
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+
+from constants import APP_TYPE_BASE, APP_TYPE_UPD, APP_TYPE_DLC, ALLOWED_EXTENSIONS
+
+
+def make_app(db_path):
+    """Create a minimal Flask app bound to a throwaway SQLite database"""
+    from flask import Flask
+    from db import db
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def synthetic_ids(n):
+    """Base, update and DLC app IDs for the n-th synthetic title"""
+    base_id = f'01{n * 2:011X}000'
+    update_id = f'01{n * 2:011X}800'
+    dlc_id = f'01{n * 2 + 1:011X}001'
+    return base_id, update_id, dlc_id
+
+
+def synthetic_titledb(nb_titles):
+    """Build titles/cnmts/versions databases shaped like the real titledb files"""
+    titles_db = {}
+    cnmts_db = {}
+    versions_db = {}
+    # every game also has a DLC entry in the regional titles file
+    for n in range(nb_titles // 2):
+        base_id, update_id, dlc_id = synthetic_ids(n)
+        titles_db[str(70010000000000 + 2 * n)] = {
+            'id': base_id,
+            'name': f'Synthetic Game {n}',
+            'bannerUrl': f'https://example.com/{base_id}/banner.jpg',
+            'iconUrl': f'https://example.com/{base_id}/icon.jpg',
+            'category': ['Action'],
+        }
+        titles_db[str(70010000000000 + 2 * n + 1)] = {
+            'id': dlc_id,
+            'name': f'Synthetic Game {n} - Extra Content',
+            'bannerUrl': None,
+            'iconUrl': None,
+            'category': [],
+        }
+        cnmts_db[update_id.lower()] = {
+            '65536': {'titleType': 129, 'otherApplicationId': base_id.lower()},
+            '131072': {'titleType': 129, 'otherApplicationId': base_id.lower()},
+        }
+        cnmts_db[dlc_id.lower()] = {
+            '0': {'titleType': 130, 'otherApplicationId': base_id.lower()},
+        }
+        versions_db[base_id.lower()] = {
+            '65536': '2020-01-01',
+            '131072': '2020-06-01',
+        }
+    return titles_db, cnmts_db, versions_db
+
+
+def synthetic_file_rows(nb_files, library='/games'):
+    """Files rows: base, latest update and DLC for consecutive titles"""
+    rows = []
+    n = 0
+    while len(rows) < nb_files:
+        base_id, update_id, dlc_id = synthetic_ids(n)
+        name = f'Synthetic Game {n}'
+        for app_id, app_type, version in (
+            (base_id, APP_TYPE_BASE, '0'),
+            (update_id, APP_TYPE_UPD, '131072'),
+            (dlc_id, APP_TYPE_DLC, '0'),
+        ):
+            filename = f'{name} [{app_id}][v{version}].nsp'
+            rows.append({
+                'filepath': os.path.join(library, name, filename),
+                'library': library,
+                'folder': '/' + name,
+                'filename': filename,
+                'title_id': base_id,
+                'app_id': app_id,
+                'type': app_type,
+                'version': version,
+                'extension': 'nsp',
+                'size': 1024 * 1024 * (n % 4096 + 1),
+                'identification': 'filename',
+            })
+        n += 1
+    return rows[:nb_files]
+
+
+def load_synthetic_titledb(nb_titles):
+    import titles
+
+    titles_db, cnmts_db, versions_db = synthetic_titledb(nb_titles)
+    titles.titles_db = titles_db
+    titles.cnmts_db = cnmts_db
+    titles.versions_db = versions_db
+    titles.versions_txt_db = {}
+    titles.titles_index = titles.build_titles_index(titles_db)
+    titles.dlcs_by_title = titles.build_dlcs_index(cnmts_db)
+    titles.versions_by_title = titles.build_versions_index(versions_db)
+
+
+def linear_get_game_info(title_id):
+    """get_game_info as it was before titledb indexing, scanning every entry"""
+    import titles
+
+    try:
+        title_info = [titles.titles_db[t] for t in list(titles.titles_db.keys()) if titles.titles_db[t]['id'] == title_id][0]
+        return {
+            'name': title_info['name'],
+            'bannerUrl': title_info['bannerUrl'],
+            'iconUrl': title_info['iconUrl'],
+            'id': title_info['id'],
+            'category': title_info['category'],
+        }
+    except Exception:
+        return {
+            'name': 'Unrecognized',
+            'bannerUrl': '//placehold.it/400x200',
+            'iconUrl': '',
+            'id': title_id + ' not found in titledb',
+            'category': '',
+        }
+
+
+def bench_library(args):
+    """Time generate_library with the linear titledb scan and with the index"""
+    import library
+    from db import db, Files
+
+    load_synthetic_titledb(args.titles)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'bench.db'))
+        with app.app_context():
+            db.session.bulk_insert_mappings(Files, synthetic_file_rows(args.files))
+            db.session.commit()
+
+            indexed_get_game_info = library.get_game_info
+            timings = {}
+            runs = [('indexed', indexed_get_game_info)]
+            if not args.skip_before:
+                runs.insert(0, ('linear scan', linear_get_game_info))
+            for label, get_game_info in runs:
+                library.get_game_info = get_game_info
+                try:
+                    start = time.perf_counter()
+                    titles_library = library.generate_library()
+                    timings[label] = time.perf_counter() - start
+                finally:
+                    library.get_game_info = indexed_get_game_info
+                print(f'generate_library ({label}): {timings[label]:.2f}s for {len(titles_library)} library entries')
+
+    if len(timings) == 2:
+        print(f'Speedup: {timings["linear scan"] / timings["indexed"]:.1f}x')
+
+
+def bench_poll(args):
+    """Poll an unchanged tree with watchdog snapshots and with the adaptive poller"""
+    from watchdog.utils.dirsnapshot import DirectorySnapshot
+    from watchdog.observers.api import ObservedWatch
+    from file_watcher import AdaptivePollingEmitter, WatcherMetrics
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in range(args.files):
+            directory = os.path.join(tmpdir, f'Game {n // args.files_per_dir}')
+            os.makedirs(directory, exist_ok=True)
+            open(os.path.join(directory, f'file {n}.nsp'), 'wb').close()
+
+        start = time.perf_counter()
+        for _ in range(args.polls):
+            DirectorySnapshot(tmpdir, recursive=True)
+        before = (time.perf_counter() - start) / args.polls
+
+        emitter = AdaptivePollingEmitter(None, ObservedWatch(tmpdir, recursive=True), metrics=WatcherMetrics('polling'))
+        emitter.poll(full=True)
+        start = time.perf_counter()
+        for _ in range(args.polls):
+            emitter.poll()
+        after = (time.perf_counter() - start) / args.polls
+
+    print(f'watchdog snapshot: {before * 1000:.1f} ms per poll')
+    print(f'adaptive poller: {after * 1000:.1f} ms per poll')
+    print(f'Speedup: {before / after:.1f}x')
+
+
+def getDirsAndFiles(path):
+    """Former recursive listing of the library, one stat per directory entry"""
+    entries = os.listdir(path)
+    allFiles = []
+    allDirs = []
+
+    for entry in entries:
+        fullPath = os.path.join(path, entry)
+        if os.path.isdir(fullPath):
+            allDirs.append(fullPath)
+            dirs, files = getDirsAndFiles(fullPath)
+            allDirs += dirs
+            allFiles += files
+        elif fullPath.split('.')[-1] in ALLOWED_EXTENSIONS:
+            allFiles.append(fullPath)
+    return allDirs, allFiles
+
+
+def bench_walk(args):
+    """List a library tree with getDirsAndFiles and with walk_library"""
+    from titles import walk_library
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in range(args.files):
+            directory = os.path.join(tmpdir, f'Game {n // args.files_per_dir}')
+            os.makedirs(directory, exist_ok=True)
+            open(os.path.join(directory, f'file {n}.nsp'), 'wb').close()
+
+        start = time.perf_counter()
+        _, files = getDirsAndFiles(tmpdir)
+        before = time.perf_counter() - start
+        print(f'getDirsAndFiles: {before:.2f}s for {len(files)} files, without stats')
+        for workers in (1, args.workers):
+            start = time.perf_counter()
+            files = list(walk_library(tmpdir, workers))
+            after = time.perf_counter() - start
+            print(f'walk_library ({workers} workers): {after:.2f}s for {len(files)} files, with stats')
+
+
+def bench_ingest(args):
+    """Write identified files to the database one by one and in batches"""
+    from db import db, Files, add_to_titles_db, add_many_to_titles_db
+
+    library_path = '/games'
+    file_infos = []
+    for row in synthetic_file_rows(args.files, library_path):
+        file_info = dict(row)
+        file_info['filedir'] = library_path + row['folder']
+        file_infos.append(file_info)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'bench.db'))
+        with app.app_context():
+            timings = {}
+            for label in ('per file', 'batched'):
+                Files.query.delete()
+                db.session.commit()
+                start = time.perf_counter()
+                if label == 'per file':
+                    for file_info in file_infos:
+                        add_to_titles_db(library_path, file_info)
+                else:
+                    add_many_to_titles_db(library_path, file_infos, args.batch_size)
+                timings[label] = time.perf_counter() - start
+                print(f'{label}: {timings[label]:.2f}s, {len(file_infos) / timings[label]:.0f} rows/s ({Files.query.count()} rows)')
+
+    print(f'Speedup: {timings["per file"] / timings["batched"]:.1f}x')
+
+
+FAKE_CONTAINER_MAGIC = b'FAKECNMT'
+
+
+def write_fake_containers(directory, nb_files, size_mb):
+    """Files with a fake CNMT header followed by random padding"""
+    files = []
+    padding = os.urandom(1024 * 1024)
+    for n in range(nb_files):
+        base_id, update_id, dlc_id = synthetic_ids(n // 3)
+        app_id, app_type, version = [
+            (base_id, APP_TYPE_BASE, 0),
+            (update_id, APP_TYPE_UPD, 65536),
+            (dlc_id, APP_TYPE_DLC, 0),
+        ][n % 3]
+        filepath = os.path.join(directory, f'fake {n}.nsp')
+        with open(filepath, 'wb') as f:
+            f.write(FAKE_CONTAINER_MAGIC + f'|{app_id}|{version}|{app_type}|'.encode().ljust(56))
+            for _ in range(size_mb):
+                f.write(padding)
+        files.append(filepath)
+    return files
+
+
+def fake_identify_file_from_cnmt(filepath, rounds=20):
+    """Stand-in for identify_file_from_cnmt on fake containers.
+
+    Reads the whole file and hashes the first MB `rounds` times, to cost
+    I/O and CPU like opening a container and decrypting its META NCA.
+    """
+    with open(filepath, 'rb') as f:
+        header = f.read(64)
+        first_mb = header + f.read(1024 * 1024 - 64)
+        while f.read(1024 * 1024):
+            pass
+    if not header.startswith(FAKE_CONTAINER_MAGIC):
+        raise ValueError(f'Not a fake container: {filepath}')
+    for _ in range(rounds):
+        first_mb = hashlib.sha256(first_mb).digest() + first_mb[32:]
+    _, app_id, version, app_type, _ = header.decode().split('|')
+    return app_id, int(version), app_type
+
+
+def bench_identify(args):
+    """Identify a synthetic library of fake containers serially and with a process pool"""
+    import titles
+    import library
+    from db import db, Files, IdentificationCache
+
+    load_synthetic_titledb(args.files)
+    # fork started workers inherit the patched reader and keys state
+    titles.identify_file_from_cnmt = fake_identify_file_from_cnmt
+    titles.Keys.keys_loaded = True
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        library_path = os.path.join(tmpdir, 'games')
+        os.makedirs(library_path)
+        files = write_fake_containers(library_path, args.files, args.size_mb)
+        app = make_app(os.path.join(tmpdir, 'bench.db'))
+        with app.app_context():
+            timings = {}
+            # the last run re-identifies from the identification cache left by the previous one
+            for label, workers, use_cache in ((1, 1, False), (args.workers, args.workers, False), ('cached', 1, True)):
+                Files.query.delete()
+                if not use_cache:
+                    IdentificationCache.query.delete()
+                db.session.commit()
+                start = time.perf_counter()
+                library.identify_files_and_add_to_db(library_path, files, workers=workers)
+                timings[label] = time.perf_counter() - start
+                identified = Files.query.filter_by(identification='cnmt').count()
+                print(f'{label if use_cache else f"{workers} worker(s)"}: {timings[label]:.2f}s, {len(files) / timings[label]:.1f} files/s ({identified}/{len(files)} identified)')
+
+    print(f'Speedup: {timings[1] / timings[args.workers]:.1f}x, cached: {timings[1] / timings["cached"]:.1f}x')
+
+
+TORZNAB_ITEM = """    <item>
+      <title>{title}</title>
+      <guid>http://jackett.local/dl/{n}</guid>
+      <jackettindexer id="indexer{indexer}">Indexer {indexer}</jackettindexer>
+      <type>public</type>
+      <comments>http://tracker{indexer}.local/details/{n}</comments>
+      <pubDate>Mon, 01 Jan 2024 00:00:00 +0000</pubDate>
+      <size>{size}</size>
+      <description>{description}</description>
+      <link>http://jackett.local/dl/{n}.torrent</link>
+      <category>1000</category>
+      <category>100{indexer}</category>
+      <enclosure url="http://jackett.local/dl/{n}.torrent" length="{size}" type="application/x-bittorrent" />
+      <torznab:attr name="category" value="1000" />
+      <torznab:attr name="genre" value="" />
+      <torznab:attr name="files" value="{files}" />
+      <torznab:attr name="grabs" value="{grabs}" />
+      <torznab:attr name="size" value="{size}" />
+      <torznab:attr name="seeders" value="{seeders}" />
+      <torznab:attr name="peers" value="{peers}" />
+      <torznab:attr name="infohash" value="{info_hash}" />
+      <torznab:attr name="magneturl" value="magnet:?xt=urn:btih:{info_hash}&amp;dn={title}&amp;tr=http%3A%2F%2Ftracker{indexer}.local%2Fannounce" />
+      <torznab:attr name="minimumratio" value="1" />
+      <torznab:attr name="minimumseedtime" value="172800" />
+      <torznab:attr name="downloadvolumefactor" value="1" />
+      <torznab:attr name="uploadvolumefactor" value="1" />
+    </item>
+"""
+
+
+def write_torznab_feed(filepath, nb_items):
+    """Torznab feed shaped like a broad Jackett search"""
+    with open(filepath, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom" xmlns:torznab="http://torznab.com/schemas/2015/feed">\n')
+        f.write('  <channel>\n    <title>AggregateSearch</title>\n    <description>AggregateSearch</description>\n')
+        for n in range(nb_items):
+            f.write(TORZNAB_ITEM.format(
+                n=n,
+                title=f'Synthetic Game {n} [{synthetic_ids(n)[0]}][v0] (NSP)',
+                indexer=n % 8,
+                size=(n % 64 + 1) * 256 * 1024 * 1024,
+                description=f'Synthetic Game {n} for the Nintendo Switch, base game with its updates. ' * 4,
+                files=n % 5 + 1,
+                grabs=n % 1000,
+                seeders=n % 300,
+                peers=n % 350,
+                info_hash=hashlib.sha1(str(n).encode()).hexdigest(),
+            ))
+        f.write('  </channel>\n</rss>\n')
+
+
+def tree_parse_torznab(xml_content):
+    """_parse_torznab_response as it was before incremental parsing, on the whole tree"""
+    import xml.etree.ElementTree as ET
+
+    results = []
+    root = ET.fromstring(xml_content)
+    for item in root.findall('.//item'):
+        result = {
+            'title': item.findtext('title', ''),
+            'link': item.findtext('link', ''),
+            'size': 0,
+            'seeders': 0,
+            'leechers': 0,
+            'publish_date': item.findtext('pubDate', ''),
+            'category': item.findtext('category', ''),
+            'indexer': '',
+            'magnet_link': '',
+            'info_hash': ''
+        }
+        for attr in item.findall('.//torznab:attr', {'torznab': 'http://torznab.com/schemas/2015/feed'}):
+            name = attr.get('name')
+            value = attr.get('value')
+            if name == 'size':
+                result['size'] = int(value) if value else 0
+            elif name == 'seeders':
+                result['seeders'] = int(value) if value else 0
+            elif name == 'peers':
+                result['leechers'] = int(value) if value else 0
+            elif name == 'indexer':
+                result['indexer'] = value
+            elif name == 'magneturl':
+                result['magnet_link'] = value
+            elif name == 'infohash':
+                result['info_hash'] = value
+        results.append(result)
+    return results
+
+
+def bench_torznab(args):
+    """Parse a large Torznab feed with the whole tree and incrementally"""
+    import tracemalloc
+    from automation import parse_torznab
+
+    def whole_tree(filepath):
+        with open(filepath, 'rb') as f:
+            # what response.text gave the previous parser
+            return tree_parse_torznab(f.read().decode())
+
+    def incremental(filepath, limit=None):
+        with open(filepath, 'rb') as f:
+            return parse_torznab(f, limit)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = args.feed
+        if filepath is None:
+            filepath = os.path.join(tmpdir, 'feed.xml')
+            write_torznab_feed(filepath, args.items)
+        print(f'Feed: {os.path.getsize(filepath) / 1024 / 1024:.1f} MB')
+
+        timings = {}
+        runs = [
+            ('whole tree', whole_tree),
+            ('incremental', incremental),
+            (f'incremental, limit {args.limit}', lambda filepath: incremental(filepath, args.limit)),
+        ]
+        for label, parse in runs:
+            start = time.perf_counter()
+            results = parse(filepath)
+            timings[label] = time.perf_counter() - start
+            # measured on another run, tracing slows parsing down
+            tracemalloc.start()
+            parse(filepath)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{label}: {timings[label] * 1000:.0f} ms, peak {peak / 1024 / 1024:.1f} MB for {len(results)} results')
+
+    print(f'Speedup: {timings["whole tree"] / timings["incremental"]:.1f}x, '
+          f'with limit: {timings["whole tree"] / timings[f"incremental, limit {args.limit}"]:.1f}x')
+
+
+def write_archive_fixtures(directory, nb_archives, size_mb):
+    """Season-pack like download: zip and tar.gz archives of fake game files"""
+    import io
+    import tarfile
+    import zipfile
+
+    # compressible like real containers, so extraction costs CPU as well as I/O
+    block = os.urandom(64 * 1024) * 4
+    data = block * (size_mb * 4)
+    download = os.path.join(directory, 'download')
+    os.makedirs(download)
+    for n in range(nb_archives):
+        base_id, update_id, _ = synthetic_ids(n)
+        if n % 2:
+            with zipfile.ZipFile(os.path.join(download, f'Game {n}.zip'), 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+                zf.writestr(f'Game {n} [{base_id}][v0].nsp', data)
+        else:
+            with tarfile.open(os.path.join(download, f'Game {n}.tar.gz'), 'w:gz', compresslevel=1) as tf:
+                info = tarfile.TarInfo(f'Game {n} [{update_id}][v65536].nsp')
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+    return download
+
+
+def bench_extract(args):
+    """Process a download of archives with one extraction at a time and with the pool"""
+    import shutil
+    from processors.game_processor import SwitchGameProcessor
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        download = write_archive_fixtures(tmpdir, args.archives, args.size_mb)
+        timings = {}
+        runs = [('1 worker', 1, 1), (f'{args.workers} workers, {args.per_device} per disk', args.workers, args.per_device)]
+        for label, workers, per_device in runs:
+            target = os.path.join(tmpdir, 'library')
+            processor = SwitchGameProcessor({'extract_workers': workers, 'extract_workers_per_device': per_device})
+            start = time.perf_counter()
+            results = processor.process_directory(download, target, use_hardlinks=False)
+            timings[label] = time.perf_counter() - start
+            shutil.rmtree(target)
+            print(f'{label}: {timings[label]:.2f}s, {results["archives_extracted"]} archives, {results["files_organized"]} files organized')
+
+    first, second = timings.values()
+    print(f'Speedup: {first / second:.1f}x')
+
+
+def bench_downloads(args):
+    """Download the same game from a running server with concurrent clients"""
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    auth = (args.user, args.password) if args.user else None
+
+    def client(_):
+        downloaded = 0
+        with requests.Session() as session:
+            for _ in range(args.requests):
+                with session.get(args.url, auth=auth, stream=True) as r:
+                    r.raise_for_status()
+                    if r.headers.get('Content-Type', '').startswith('application/json'):
+                        # Tinfoil errors are sent as JSON
+                        raise RuntimeError(r.text)
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
+                        downloaded += len(chunk)
+        return downloaded
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        downloaded = sum(executor.map(client, range(args.clients)))
+    elapsed = time.perf_counter() - start
+    print(f'{args.clients} clients x {args.requests} downloads: {downloaded / 1024 / 1024:.0f} MB in {elapsed:.2f}s, {downloaded / 1024 / 1024 / elapsed:.1f} MB/s')
+
+
+def make_serve_app(filepath):
+    """App serving a file with send_from_directory (before) and the file server (after)"""
+    from flask import Flask, send_from_directory
+    from file_server import send_game_file
+
+    app = Flask(__name__)
+
+    @app.route('/before')
+    def before():
+        filedir, filename = os.path.split(filepath)
+        return send_from_directory(filedir, filename)
+
+    @app.route('/after')
+    def after():
+        return send_game_file(filepath)
+
+    return app
+
+
+def bench_serve(args):
+    """Download a file served by gunicorn with send_from_directory and with the file server"""
+    import random
+    import subprocess
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, 'game.nsp')
+        padding = os.urandom(1024 * 1024)
+        with open(filepath, 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(padding)
+        size = args.size_mb * 1024 * 1024
+
+        server = subprocess.Popen([
+            sys.executable, '-m', 'gunicorn', '--chdir', os.path.dirname(os.path.abspath(__file__)),
+            '--bind', f'127.0.0.1:{args.port}', '--worker-class', 'gthread', '--threads', str(args.clients),
+            '--log-level', 'warning', f'benchmark:make_serve_app({filepath!r})',
+        ])
+        try:
+            base_url = f'http://127.0.0.1:{args.port}'
+            for _ in range(100):
+                try:
+                    requests.get(base_url + '/after', headers={'Range': 'bytes=0-0'})
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+
+            def client(url, ranged):
+                downloaded = 0
+                with requests.Session() as session:
+                    for _ in range(args.requests):
+                        headers = {}
+                        if ranged:
+                            start = random.randrange(size)
+                            headers['Range'] = f'bytes={start}-{min(start + 16 * 1024 * 1024, size) - 1}'
+                        with session.get(url, headers=headers, stream=True) as r:
+                            for chunk in r.iter_content(chunk_size=1024 * 1024):
+                                downloaded += len(chunk)
+                return downloaded
+
+            for ranged in (False, True):
+                for label in ('before', 'after'):
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+                        futures = [executor.submit(client, base_url + '/' + label, ranged) for _ in range(args.clients)]
+                        downloaded = sum(f.result() for f in futures)
+                    elapsed = time.perf_counter() - start
+                    kind = '16 MB ranges' if ranged else 'full files'
+                    print(f'{label} ({kind}): {downloaded / 1024 / 1024 / elapsed:.1f} MB/s')
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ownfoil benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    library_parser = subparsers.add_parser('library', help='generate_library on a synthetic database')
+    library_parser.add_argument('--files', type=int, default=20000, help='number of files in the library')
+    library_parser.add_argument('--titles', type=int, default=50000, help='number of entries in the titles database')
+    library_parser.add_argument('--skip-before', action='store_true', help='only time the indexed lookup')
+    library_parser.set_defaults(func=bench_library)
+
+    poll_parser = subparsers.add_parser('poll', help='polling an unchanged library tree')
+    poll_parser.add_argument('--files', type=int, default=50000, help='number of files in the tree')
+    poll_parser.add_argument('--files-per-dir', type=int, default=10, help='files in each directory')
+    poll_parser.add_argument('--polls', type=int, default=5, help='number of polls timed')
+    poll_parser.set_defaults(func=bench_poll)
+
+    walk_parser = subparsers.add_parser('walk', help='listing the files of a library path')
+    walk_parser.add_argument('--files', type=int, default=50000, help='number of files in the tree')
+    walk_parser.add_argument('--files-per-dir', type=int, default=10, help='files in each directory')
+    walk_parser.add_argument('--workers', type=int, default=4, help='walker threads')
+    walk_parser.set_defaults(func=bench_walk)
+
+    ingest_parser = subparsers.add_parser('ingest', help='database writes of identified files')
+    ingest_parser.add_argument('--files', type=int, default=20000, help='number of identified files')
+    ingest_parser.add_argument('--batch-size', type=int, default=500, help='files per batch')
+    ingest_parser.set_defaults(func=bench_ingest)
+
+    identify_parser = subparsers.add_parser('identify', help='file identification on fake containers')
+    identify_parser.add_argument('--files', type=int, default=400, help='number of fake containers')
+    identify_parser.add_argument('--size-mb', type=int, default=1, help='size of each fake container in MB')
+    identify_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='identification workers')
+    identify_parser.set_defaults(func=bench_identify)
+
+    downloads_parser = subparsers.add_parser('downloads', help='concurrent downloads from a running server')
+    downloads_parser.add_argument('url', help='game URL, e.g. http://localhost:8465/api/get_game/1')
+    downloads_parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    downloads_parser.add_argument('--requests', type=int, default=2, help='downloads per client')
+    downloads_parser.add_argument('--user', help='user of a private shop')
+    downloads_parser.add_argument('--password', help='password of a private shop')
+    downloads_parser.set_defaults(func=bench_downloads)
+
+    serve_parser = subparsers.add_parser('serve', help='game file serving, before and after the file server')
+    serve_parser.add_argument('--size-mb', type=int, default=256, help='size of the served file in MB')
+    serve_parser.add_argument('--clients', type=int, default=4, help='concurrent clients')
+    serve_parser.add_argument('--requests', type=int, default=4, help='downloads per client')
+    serve_parser.add_argument('--port', type=int, default=8466, help='port of the benchmark server')
+    serve_parser.set_defaults(func=bench_serve)
+
+    torznab_parser = subparsers.add_parser('torznab', help='parsing a large Jackett search feed')
+    torznab_parser.add_argument('--items', type=int, default=20000, help='items in the synthetic feed')
+    torznab_parser.add_argument('--feed', help='recorded Torznab feed to parse instead of a synthetic one')
+    torznab_parser.add_argument('--limit', type=int, default=150, help='results requested by searches')
+    torznab_parser.set_defaults(func=bench_torznab)
+
+    extract_parser = subparsers.add_parser('extract', help='extracting and organizing a download of archives')
+    extract_parser.add_argument('--archives', type=int, default=24, help='number of zip and tar.gz archives')
+    extract_parser.add_argument('--size-mb', type=int, default=16, help='size of the game file in each archive in MB')
+    extract_parser.add_argument('--workers', type=int, default=4, help='archives extracted at the same time')
+    extract_parser.add_argument('--per-device', type=int, default=4, help='archives extracted at the same time on a disk')
+    extract_parser.set_defaults(func=bench_extract)
+
+    args = parser.parse_args()
+    logging.getLogger('main').setLevel(logging.ERROR)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,4 +13,11 @@ chown -R ${uid}:${gid} /root
 
 echo "Starting ownfoil"
 
+# OWNFOIL_SERVER=gunicorn serves with several worker processes,
+# sized with OWNFOIL_WORKERS and OWNFOIL_THREADS
+if [ "${OWNFOIL_SERVER}" = "gunicorn" ]; then
+    cd /app
+    exec sudo -E -u "#${uid}" gunicorn --config /app/gunicorn.conf.py wsgi:app
+fi
+
 exec sudo -E -u "#${uid}" python /app/app.py
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Test the batched writes and deletes of library files in the database"""
+
+import os
+import sys
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from flask import Flask
+from sqlalchemy import event
+
+import db as db_module
+import library
+import titles
+from constants import APP_TYPE_BASE
+from db import db, Files, add_many_to_titles_db, remove_missing_files_from_db
+from library import identify_files_and_add_to_db
+
+LIBRARY = '/games'
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def file_info(n, version=0, size=1024):
+    title_id = f'01000000000{n:02d}000'
+    filename = f'Game {n} [{title_id}][v{version}].nsp'
+    return {
+        'filepath': os.path.join(LIBRARY, filename),
+        'filedir': LIBRARY,
+        'filename': filename,
+        'title_id': title_id,
+        'app_id': title_id,
+        'type': APP_TYPE_BASE,
+        'version': version,
+        'extension': 'nsp',
+        'size': size,
+        'identification': 'filename',
+    }
+
+
+def test_batches():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        with app.app_context():
+            first = [file_info(n) for n in range(3)]
+            assert add_many_to_titles_db(LIBRARY, first, batch_size=2) == {info['title_id'] for info in first}
+
+            # existing rows are found in every batch, only changed ones are touched
+            files = first + [file_info(n) for n in range(3, 5)]
+            files[1] = file_info(1, size=2048)
+            touched = add_many_to_titles_db(LIBRARY, files, batch_size=2)
+            assert touched == {files[1]['title_id'], files[3]['title_id'], files[4]['title_id']}
+            assert Files.query.count() == 5
+            assert Files.query.filter_by(filepath=files[1]['filepath']).one().size == 2048
+
+            # a failed batch rolls back the whole call
+            broken = file_info(7)
+            del broken['size']
+            try:
+                add_many_to_titles_db(LIBRARY, [file_info(5), file_info(6), broken], batch_size=2)
+            except KeyError:
+                pass
+            else:
+                raise AssertionError('broken file info written')
+            assert Files.query.count() == 5
+
+
+class Cancelled(Exception):
+    pass
+
+
+def test_files_identified_before_an_error_are_saved():
+    titles.cnmts_db = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        library_path = os.path.join(tmpdir, 'games')
+        os.makedirs(library_path)
+        files = []
+        for n in range(5):
+            files.append(os.path.join(library_path, f'Game {n} [01000000000{n:02d}000][v0].nsp'))
+            open(files[-1], 'wb').close()
+
+        def cancel_after(files_done):
+            def progress_callback(done, total):
+                if done == files_done:
+                    raise Cancelled()
+            return progress_callback
+
+        with app.app_context():
+            try:
+                identify_files_and_add_to_db(library_path, files, batch_size=2, progress_callback=cancel_after(3))
+            except Cancelled:
+                pass
+            else:
+                raise AssertionError('cancellation not raised')
+            assert Files.query.count() == 3
+
+            # the error is raised even when saving the identified files fails too
+            def failing_add(library_path, file_infos, batch_size):
+                raise RuntimeError('database is locked')
+
+            add_many = library.add_many_to_titles_db
+            library.add_many_to_titles_db = failing_add
+            try:
+                identify_files_and_add_to_db(library_path, files[3:], progress_callback=cancel_after(1))
+            except RuntimeError:
+                raise AssertionError('the cancellation was replaced by the saving error')
+            except Cancelled:
+                pass
+            finally:
+                library.add_many_to_titles_db = add_many
+
+            identify_files_and_add_to_db(library_path, files, batch_size=2)
+            assert Files.query.count() == 5
+
+
+def test_remove_missing_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        library_path = os.path.join(tmpdir, 'games')
+        os.makedirs(library_path)
+        files = [file_info(n) for n in range(4)] + [file_info(n, version=65536) for n in range(4)]
+        for info in files:
+            info['filedir'] = library_path
+            info['filepath'] = os.path.join(library_path, info['filename'])
+        # games 0 and 1 are on disk, games 2 and 3 are gone with their updates
+        for info in files[:2] + files[4:6]:
+            open(info['filepath'], 'wb').close()
+        scanned = files[3]['filepath']
+
+        checked = []
+        def exists(path):
+            checked.append(path)
+            return os.path.isfile(path)
+
+        deletes = []
+        def count_deletes(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('DELETE'):
+                deletes.append(statement)
+
+        with app.app_context():
+            add_many_to_titles_db(library_path, files)
+            event.listen(db.engine, 'before_cursor_execute', count_deletes)
+            os_path_exists = db_module.os.path.exists
+            db_module.os.path.exists = exists
+            try:
+                # a file listed by a scan is kept without being checked
+                title_ids = remove_missing_files_from_db(existing_files={scanned}, workers=4, chunk_size=2)
+            finally:
+                db_module.os.path.exists = os_path_exists
+                event.remove(db.engine, 'before_cursor_execute', count_deletes)
+
+            assert sorted(checked) == sorted(info['filepath'] for info in files if info['filepath'] != scanned)
+            assert title_ids == {files[2]['title_id'], files[3]['title_id']}
+            # 3 missing files deleted 2 at a time
+            assert len(deletes) == 2
+            remaining = {f for (f,) in db.session.query(Files.filepath)}
+            assert remaining == {info['filepath'] for info in files[:2] + files[4:6]} | {scanned}
+
+            assert remove_missing_files_from_db(chunk_size=2) == {files[3]['title_id']}
+            assert Files.query.count() == 4
+
+
+if __name__ == '__main__':
+    test_batches()
+    test_files_identified_before_an_error_are_saved()
+    test_remove_missing_files()
+    print('Library files are written and deleted in batches, and kept after errors.')
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Test the Files table indexes and the migration of older databases"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from flask import Flask
+from sqlalchemy.dialects import sqlite
+
+from db import db, Files, MIGRATIONS, run_migrations
+
+# Files table as created by releases without indexes
+LEGACY_FILES_TABLE = """
+CREATE TABLE files (
+    id INTEGER NOT NULL PRIMARY KEY,
+    filepath VARCHAR, library VARCHAR, folder VARCHAR, filename VARCHAR,
+    title_id VARCHAR, app_id VARCHAR, type VARCHAR, version VARCHAR,
+    extension VARCHAR, size INTEGER, identification VARCHAR
+)
+"""
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    db.init_app(app)
+    return app
+
+
+def query_plan(query):
+    """EXPLAIN QUERY PLAN details of a SQLAlchemy query"""
+    statement = query.statement.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {statement}')).all()
+    return ' '.join(row[-1] for row in rows)
+
+
+def test_hot_queries_use_indexes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        with app.app_context():
+            db.create_all()
+            run_migrations()
+            queries = {
+                'ix_files_filepath': Files.query.filter_by(filepath='/games/a.nsp'),
+                'ix_files_title_id': Files.query.filter_by(title_id='0100000000010000'),
+                'ix_files_app_id': Files.query.filter_by(app_id='0100000000010000'),
+                'ix_files_library': Files.query.filter_by(library='/games'),
+                'ix_files_identification': Files.query.filter_by(identification='cnmt'),
+            }
+            for index, query in queries.items():
+                plan = query_plan(query)
+                assert f'USING INDEX {index}' in plan or f'USING COVERING INDEX {index}' in plan, plan
+            assert 'INTEGER PRIMARY KEY' in query_plan(db.session.query(Files.filepath).filter_by(id=1))
+
+
+def test_legacy_database_is_upgraded():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, 'ownfoil.db')
+        connection = sqlite3.connect(db_path)
+        connection.execute(LEGACY_FILES_TABLE)
+        # the same file added twice
+        connection.executemany(
+            'INSERT INTO files (filepath, library, title_id, identification) VALUES (?, ?, ?, ?)',
+            [('/games/a.nsp', '/games', 'OLD', 'filename'), ('/games/a.nsp', '/games', 'NEW', 'cnmt'),
+             ('/games/b.nsp', '/games', 'B', 'cnmt')],
+        )
+        connection.commit()
+        connection.close()
+
+        app = make_app(db_path)
+        with app.app_context():
+            db.create_all()
+            run_migrations()
+            assert sorted((f.filepath, f.title_id) for f in Files.query.all()) == [('/games/a.nsp', 'NEW'), ('/games/b.nsp', 'B')]
+            indexes = {row[1] for row in db.session.execute(db.text('PRAGMA index_list(files)'))}
+            assert {'ix_files_filepath', 'ix_files_title_id', 'ix_files_app_id', 'ix_files_library', 'ix_files_identification'} <= indexes
+            assert db.session.execute(db.text('PRAGMA user_version')).scalar() == len(MIGRATIONS)
+            # migrations are not applied twice
+            run_migrations()
+            assert Files.query.count() == 2
+
+
+if __name__ == '__main__':
+    test_hot_queries_use_indexes()
+    test_legacy_database_is_upgraded()
+    print('Database indexes are used and legacy databases are upgraded.')
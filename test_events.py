@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Test the events stream shared by the downloads and job pages"""
+
+import os
+import sys
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from flask import Flask
+
+from db import db, Job
+from events import EventBroker, format_event
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def drain(subscriber):
+    events = []
+    while not subscriber.empty():
+        events.append(subscriber.get_nowait())
+    return events
+
+
+def download(download_hash, progress):
+    return {'hash': download_hash, 'name': download_hash, 'progress': progress}
+
+
+def set_subscriber(broker):
+    """Subscribe without starting the poller thread"""
+    broker.thread = True
+    return broker.subscribe()
+
+
+def test_only_changed_downloads_are_sent():
+    broker = EventBroker(app=None)
+    first = set_subscriber(broker)
+    status = {'configured': True, 'error': None}
+
+    broker._set_downloads({'a': download('a', 10), 'b': download('b', 20)}, status)
+    [(name, event)] = drain(first)
+    assert name == 'downloads' and event['full'] and len(event['changed']) == 2
+
+    broker._set_downloads({'a': download('a', 10), 'b': download('b', 30)}, status)
+    [(_, event)] = drain(first)
+    assert not event['full'] and event['changed'] == [download('b', 30)] and event['removed'] == []
+
+    # nothing changed, nothing sent
+    broker._set_downloads({'a': download('a', 10), 'b': download('b', 30)}, status)
+    assert drain(first) == []
+
+    broker._set_downloads({'b': download('b', 30)}, status)
+    [(_, event)] = drain(first)
+    assert event['changed'] == [] and event['removed'] == ['a']
+
+    # a new stream starts with the full list
+    second = set_subscriber(broker)
+    [(_, event)] = drain(second)
+    assert event['full'] and event['changed'] == [download('b', 30)]
+
+    assert format_event('downloads', {'full': True}) == 'event: downloads\ndata: {"full": true}\n\n'
+
+
+def test_job_progress_is_sent_once():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        broker = EventBroker(app)
+        subscriber = set_subscriber(broker)
+        broker.jobs_polled_at = 0
+        with app.app_context():
+            db.session.add(Job(id='scan', type='scan', libraries='["/games"]', status='running', progress=1, total=10))
+            db.session.commit()
+            broker.poll_jobs()
+            broker.poll_jobs()
+            [(name, job)] = drain(subscriber)
+            assert name == 'job' and job['progress'] == 1 and job['libraries'] == ['/games']
+
+            Job.query.filter_by(id='scan').update({'status': 'completed', 'progress': 10, 'finished_at': broker.jobs_polled_at})
+            db.session.commit()
+            broker.poll_jobs()
+            [(_, job)] = drain(subscriber)
+            assert job['status'] == 'completed'
+
+
+if __name__ == '__main__':
+    test_only_changed_downloads_are_sent()
+    test_job_progress_is_sent_once()
+    print('Only changed downloads and job progress are sent.')
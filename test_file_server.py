@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Test range requests on game file downloads"""
+
+import os
+import sys
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from flask import Flask
+
+from file_server import send_game_file
+
+CONTENT = bytes(range(256)) * 40
+
+
+def make_client(filepath):
+    app = Flask(__name__)
+
+    @app.route('/game')
+    def game():
+        return send_game_file(filepath)
+
+    return app.test_client()
+
+
+def test_ranges():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, 'game.nsp')
+        with open(filepath, 'wb') as f:
+            f.write(CONTENT)
+        client = make_client(filepath)
+        size = len(CONTENT)
+
+        r = client.get('/game')
+        assert r.status_code == 200 and r.data == CONTENT
+        assert r.headers['Accept-Ranges'] == 'bytes'
+
+        for range_header, start, end in (
+            ('bytes=0-99', 0, 99),
+            ('bytes=1000-', 1000, size - 1),
+            ('bytes=-500', size - 500, size - 1),
+            ('bytes=10000-20000', 10000, size - 1),
+        ):
+            r = client.get('/game', headers={'Range': range_header})
+            assert r.status_code == 206, range_header
+            assert r.headers['Content-Range'] == f'bytes {start}-{end}/{size}'
+            assert r.data == CONTENT[start:end + 1]
+            assert int(r.headers['Content-Length']) == end - start + 1
+
+        r = client.get('/game', headers={'Range': 'bytes=0-9,100-109,-5'})
+        assert r.status_code == 206
+        assert r.mimetype == 'multipart/byteranges'
+        assert int(r.headers['Content-Length']) == len(r.data)
+        boundary = r.mimetype_params['boundary']
+        parts = r.data.split(f'--{boundary}'.encode())
+        assert parts[-1] == b'--\r\n'
+        bodies = [part.split(b'\r\n\r\n', 1)[1][:-2] for part in parts[1:-1]]
+        assert bodies == [CONTENT[0:10], CONTENT[100:110], CONTENT[-5:]]
+        assert f'Content-Range: bytes 100-109/{size}'.encode() in parts[2]
+
+        r = client.get('/game', headers={'Range': f'bytes={size}-'})
+        assert r.status_code == 416
+        assert r.headers['Content-Range'] == f'bytes */{size}'
+
+        # malformed ranges and ranges of a changed file get the whole file
+        for headers in ({'Range': 'bytes=5-1'}, {'Range': 'items=0-1'}, {'Range': 'bytes=0-1', 'If-Range': '"old"'}):
+            r = client.get('/game', headers=headers)
+            assert r.status_code == 200 and r.data == CONTENT, headers
+
+
+if __name__ == '__main__':
+    test_ranges()
+    print('Range requests are served correctly.')
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Test the library file watcher: event filtering, stability deadlines and polling"""
+
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from watchdog.events import FileClosedEvent, FileClosedNoWriteEvent, FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent, FileOpenedEvent
+from watchdog.observers.api import ObservedWatch
+import file_watcher
+from file_watcher import AdaptivePollingEmitter, Handler, WatcherMetrics
+
+
+def test_open_and_close_events_are_ignored():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        file_path = os.path.join(tmpdir, 'game.nsp')
+        with open(file_path, 'wb') as f:
+            f.write(b'data')
+        metrics = WatcherMetrics('native')
+        handler = Handler(lambda events: None, stability_duration=60)
+        handler.add_directory(tmpdir, metrics)
+        try:
+            for event_class in (FileOpenedEvent, FileClosedEvent, FileClosedNoWriteEvent):
+                handler.on_any_event(event_class(file_path))
+            assert handler.tracked_files == {} and metrics.events == 0
+
+            handler.on_any_event(FileCreatedEvent(file_path))
+            for _ in range(3):
+                handler.on_any_event(FileModifiedEvent(file_path))
+            # latency comes from the stat taken once when tracking starts
+            assert list(handler.tracked_files) == [file_path]
+            assert metrics.events == 4 and metrics.event_latency_samples == 1
+        finally:
+            handler.stop()
+
+
+class StableFiles:
+    """Callback of the handler recording each report"""
+
+    def __init__(self):
+        self.reports = []
+        self.reported = threading.Event()
+
+    def __call__(self, events):
+        self.reports.append((time.monotonic(), sorted((event.type, os.path.basename(event.src_path)) for event in events)))
+        self.reported.set()
+
+
+def write(file_path, data, mode='wb'):
+    with open(file_path, mode) as f:
+        f.write(data)
+
+
+def test_stability_deadlines():
+    resolution = file_watcher.DEADLINE_RESOLUTION
+    file_watcher.DEADLINE_RESOLUTION = 0.1
+    stable = StableFiles()
+    handler = Handler(stable, stability_duration=0.5)
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler.add_directory(tmpdir)
+            paths = {name: os.path.join(tmpdir, name) for name in ('copied.nsp', 'first.nsp', 'second.nsp', 'deleted.nsp')}
+
+            # a modification pushes the deadline back and records the size
+            write(paths['copied.nsp'], b'a')
+            handler.on_any_event(FileCreatedEvent(paths['copied.nsp']))
+            time.sleep(0.3)
+            write(paths['copied.nsp'], b'bc', 'ab')
+            modified_at = time.monotonic()
+            handler.on_any_event(FileModifiedEvent(paths['copied.nsp']))
+            assert handler.tracked_files[paths['copied.nsp']].size == 3
+            # written after the size was recorded, in the same deadline tick
+            write(paths['copied.nsp'], b'd', 'ab')
+            handler.on_any_event(FileModifiedEvent(paths['copied.nsp']))
+
+            assert stable.reported.wait(5)
+            [(reported_at, events)] = stable.reports
+            assert events == [('created', 'copied.nsp')]
+            assert reported_at >= modified_at + 0.5
+            # not rescheduled for the write following the last size record
+            assert reported_at < modified_at + 1.0
+            stable.reported.clear()
+
+            # files copied together are reported together, deleted ones are not
+            for name in ('first.nsp', 'second.nsp', 'deleted.nsp'):
+                write(paths[name], b'data')
+                handler.on_any_event(FileCreatedEvent(paths[name]))
+            os.remove(paths['deleted.nsp'])
+            handler.on_any_event(FileDeletedEvent(paths['deleted.nsp']))
+            assert stable.reported.wait(5)
+            stable.reported.clear()
+            assert stable.reported.wait(5)
+            assert [events for _, events in stable.reports[1:]] == [
+                [('deleted', 'deleted.nsp')],
+                [('created', 'first.nsp'), ('created', 'second.nsp')],
+            ]
+            assert handler.tracked_files == {} and handler.deadlines == []
+    finally:
+        handler.stop()
+        file_watcher.DEADLINE_RESOLUTION = resolution
+
+
+def touch(path, seconds):
+    """Move the mtime of path forward, changes can happen within the filesystem timestamp granularity"""
+    path_stat = os.stat(path)
+    os.utime(path, ns=(path_stat.st_atime_ns, path_stat.st_mtime_ns + seconds * 10 ** 9))
+
+
+def test_adaptive_polling():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        games = os.path.join(tmpdir, 'Games')
+        os.mkdir(games)
+        write(os.path.join(games, 'game.nsp'), b'data')
+        write(os.path.join(tmpdir, 'update.nsp'), b'data')
+        emitter = AdaptivePollingEmitter(queue.Queue(), ObservedWatch(tmpdir, recursive=True), metrics=WatcherMetrics('polling'))
+        # the initial state, discarded when the emitter starts
+        assert len(emitter.poll(full=True)) == 2
+
+        # a move keeps the inode
+        os.rename(os.path.join(games, 'game.nsp'), os.path.join(tmpdir, 'game.nsp'))
+        touch(games, 1)
+        touch(tmpdir, 1)
+        assert emitter.poll() == [FileMovedEvent(os.path.join(games, 'game.nsp'), os.path.join(tmpdir, 'game.nsp'))]
+
+        # files of new subdirectories
+        dlc = os.path.join(tmpdir, 'DLC')
+        os.mkdir(dlc)
+        write(os.path.join(dlc, 'dlc.nsp'), b'data')
+        touch(tmpdir, 2)
+        assert emitter.poll() == [FileCreatedEvent(os.path.join(dlc, 'dlc.nsp'))]
+        assert emitter.metrics.poll_directories_listed_last == 2
+
+        # modified in place, the directory mtime does not change
+        write(os.path.join(tmpdir, 'update.nsp'), b'DATA', 'r+b')
+        touch(os.path.join(tmpdir, 'update.nsp'), 1)
+        assert emitter.poll() == []
+        assert emitter.metrics.poll_directories_listed_last == 0
+        assert emitter.poll(full=True) == [FileModifiedEvent(os.path.join(tmpdir, 'update.nsp'))]
+        assert emitter.poll(full=True) == []
+
+
+if __name__ == '__main__':
+    test_open_and_close_events_are_ignored()
+    test_stability_deadlines()
+    test_adaptive_polling()
+    print('Only library changes are watched.')
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Test the extraction and organization of downloaded games"""
+
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from processors.game_processor import SwitchGameProcessor, archive_extension
+
+
+def write_zip(path, files):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+
+
+def write_tar(path, files):
+    with tarfile.open(path, 'w:gz') as tf:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+
+def make_download(directory):
+    """Download with loose, zipped, tarred and nested game files"""
+    download = Path(directory) / 'download'
+    (download / 'sub').mkdir(parents=True)
+    (download / 'Loose Game [0100000000010000][v0].nsp').write_bytes(b'loose')
+    write_zip(download / 'base.zip', {'Zipped Game [0100000000020000][v0].nsp': b'zipped'})
+    write_tar(download / 'sub' / 'update.tar.gz', {'Zipped Game [0100000000020800][v65536].nsp': b'update'})
+    nested = io.BytesIO()
+    write_zip(nested, {'Nested Game [0100000000030001][v0].nsz': b'dlc'})
+    write_zip(download / 'outer.zip', {'inner.zip': nested.getvalue(), 'readme.txt': b'readme'})
+    write_zip(download / 'empty.zip', {'readme.txt': b'readme'})
+    (download / 'broken.zip').write_bytes(b'not a zip')
+    # later volumes of a multi-part RAR archive are not archives of their own
+    (download / 'pack.part2.rar').write_bytes(b'volume')
+    return download
+
+
+def test_archives_are_extracted_and_organized():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        download = make_download(tmpdir)
+        target = Path(tmpdir) / 'library'
+        processor = SwitchGameProcessor({'extract_workers': 3})
+        results = processor.process_directory(str(download), str(target), use_hardlinks=False, delete_after_process=True)
+
+        organized = sorted(str(path.relative_to(target)) for path in target.rglob('*') if path.is_file())
+        assert organized == [
+            'Loose Game/BASE/Loose Game [0100000000010000][v0].nsp',
+            'Nested Game/DLC/Nested Game [0100000000030001][v0].nsz',
+            'Zipped Game/BASE/Zipped Game [0100000000020000][v0].nsp',
+            'Zipped Game/UPDATES/Zipped Game [0100000000020800][v65536].nsp',
+        ]
+        assert results['files_organized'] == 4 and results['archives_extracted'] == 5
+        assert len(results['errors']) == 1 and 'broken.zip' in results['errors'][0]
+        # only archives with game files are deleted, temporary directories are removed
+        assert results['archives_deleted'] == 3
+        assert sorted(path.name for path in download.rglob('*') if path.is_file()) == [
+            'Loose Game [0100000000010000][v0].nsp', 'broken.zip', 'empty.zip', 'pack.part2.rar'
+        ]
+        assert results['temp_dirs_cleaned'] == 6
+
+        assert archive_extension('Game.TAR.GZ') == '.tar.gz' and archive_extension('Game.nsp') is None
+
+
+def test_first_rar_volumes_are_extracted():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in ('pack.part01.rar', 'pack.part02.rar', 'other.part001.rar', 'other.part010.rar',
+                     'single.part1.rar', 'single.part2.rar', 'plain.rar'):
+            (Path(tmpdir) / name).write_bytes(b'volume')
+        archives, game_files = SwitchGameProcessor({})._scan_tree(Path(tmpdir))
+        assert sorted(path.name for path in archives) == ['other.part001.rar', 'pack.part01.rar', 'plain.rar', 'single.part1.rar']
+        assert game_files == []
+
+
+def test_extractions_per_disk_are_limited():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        download = Path(tmpdir) / 'download'
+        download.mkdir()
+        for n in range(6):
+            write_zip(download / f'{n}.zip', {f'Game {n} [01000000000{n}0000][v0].nsp': b'game'})
+        processor = SwitchGameProcessor({'extract_workers': 6, 'extract_workers_per_device': 2})
+
+        lock = threading.Lock()
+        running = []
+        extract = processor.archive_handler.extract
+
+        def slow_extract(archive_path, extract_to):
+            with lock:
+                running.append(archive_path)
+                concurrency.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(archive_path)
+            return extract(archive_path, extract_to)
+
+        concurrency = []
+        processor.archive_handler.extract = slow_extract
+        results = processor.process_directory(str(download), str(Path(tmpdir) / 'library'), use_hardlinks=False)
+        assert results['files_organized'] == 6
+        # archives and temporary directories are on the same disk here
+        assert max(concurrency) == 2
+
+
+if __name__ == '__main__':
+    test_archives_are_extracted_and_organized()
+    test_first_rar_volumes_are_extracted()
+    test_extractions_per_disk_are_limited()
+    print('Archives are extracted concurrently and their game files organized.')
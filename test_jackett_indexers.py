@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Test the concurrent search of Jackett indexers against a local stub"""
+
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from automation import JackettClient, SearchResultsMerger, TorznabParseError, get_info_hash, jackett_search_cache, parse_torznab
+
+HASH = 'c' * 40
+
+INDEXERS = '''<?xml version="1.0" encoding="UTF-8"?>
+<indexers>
+  <indexer id="fast" configured="true"><title>Fast</title></indexer>
+  <indexer id="other" configured="true"><title>Other</title></indexer>
+  <indexer id="slow" configured="true"><title>Slow</title></indexer>
+  <indexer id="broken" configured="true"><title>Broken</title></indexer>
+  <indexer id="truncated" configured="true"><title>Truncated</title></indexer>
+  <indexer id="trickle" configured="true"><title>Trickle</title></indexer>
+</indexers>'''
+
+
+def feed(items):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:torznab="http://torznab.com/schemas/2015/feed"><channel>'
+        + ''.join(
+            f'<item><title>{title}</title><link>http://example.com/{title}</link>'
+            f'<torznab:attr name="seeders" value="{seeders}"/>'
+            f'<torznab:attr name="infohash" value="{info_hash}"/></item>'
+            for title, seeders, info_hash in items
+        )
+        + '</channel></rss>'
+    )
+
+
+RESULTS = {
+    'fast': feed([('Game', 5, HASH), ('Game DLC', 1, 'd' * 40)]),
+    'other': feed([('Game', 9, HASH.upper())]),
+    'slow': feed([('Game', 50, HASH)]),
+    # the connection dropped in the middle of the feed
+    'truncated': feed([('Game', 70, HASH), ('Game Update', 7, 'e' * 40)])[:-40],
+    'trickle': feed([('Game', 90, HASH)]),
+}
+
+
+class StubJackett(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, slow_delay):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.slow_delay = slow_delay
+        self.searches = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body, chunk_delay=0):
+        body = body.encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if not chunk_delay:
+                self.wfile.write(body)
+                return
+            # a few bytes at a time, never long enough for a read timeout
+            for start in range(0, len(body), 16):
+                self.wfile.write(body[start:start + 16])
+                self.wfile.flush()
+                time.sleep(chunk_delay)
+        except OSError:
+            # the client gave up on a slow indexer
+            pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        indexer_id = url.path.split('/')[4]
+        if params.get('t') == ['indexers']:
+            return self.send(200, INDEXERS)
+        self.server.searches.append(indexer_id)
+        if indexer_id == 'slow':
+            time.sleep(self.server.slow_delay)
+        if indexer_id not in RESULTS:
+            return self.send(500, 'error')
+        self.send(200, RESULTS[indexer_id], chunk_delay=0.1 if indexer_id == 'trickle' else 0)
+
+
+def start_stub(slow_delay):
+    server = StubJackett(slow_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_info_hash_and_merge():
+    # base32 magnet links give the same hex hash
+    assert get_info_hash({'magnet_link': 'magnet:?xt=urn:btih:' + 'A' * 32}) == '00' * 20
+    assert get_info_hash({'info_hash': HASH.upper()}) == HASH
+
+    merger = SearchResultsMerger()
+    assert len(merger.add([{'title': 'Game', 'info_hash': HASH, 'seeders': 5}])) == 1
+    assert merger.add([{'title': 'Game (other)', 'info_hash': HASH, 'seeders': 2}]) == []
+    [changed] = merger.add([{'title': 'Game', 'magnet_link': f'magnet:?xt=urn:btih:{HASH}', 'seeders': 8}])
+    assert changed['seeders'] == 8 and changed['key'] == HASH
+    # without hashes, results are told apart by title and size
+    merger.add([{'title': 'Game', 'size': 1}, {'title': 'GAME', 'size': 1, 'seeders': 1}, {'title': 'Game', 'size': 2}])
+    assert len(merger.results) == 3
+
+
+def test_parse_torznab():
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:torznab="http://torznab.com/schemas/2015/feed"><channel><title>Feed</title>'
+        '<item><title>Game</title><guid>1</guid><link>http://example.com/1</link><pubDate>today</pubDate>'
+        '<category>1000</category><category>1010</category>'
+        '<enclosure url="magnet:?xt=urn:btih:' + HASH + '" />'
+        '<torznab:attr name="size" value="1024"/><torznab:attr name="seeders" value="3"/>'
+        '<torznab:attr name="peers" value="4"/><torznab:attr name="grabs" value="9"/>'
+        '<torznab:attr name="indexer" value="Fast"/></item>'
+        '<item><title>Game DLC</title><torznab:attr name="seeders" value=""/></item>'
+        '<item><title>Game Update</title></item>'
+    )
+    [first, second, third] = parse_torznab(xml + '</channel></rss>')
+    assert first == {
+        'title': 'Game', 'link': 'http://example.com/1', 'size': 1024, 'seeders': 3, 'leechers': 4,
+        'publish_date': 'today', 'category': '1000', 'indexer': 'Fast',
+        'magnet_link': f'magnet:?xt=urn:btih:{HASH}', 'info_hash': '',
+    }
+    assert second['title'] == 'Game DLC' and second['seeders'] == 0 and third['title'] == 'Game Update'
+
+    # stops at the limit, and keeps the items before a truncated end
+    assert [result['title'] for result in parse_torznab(xml.encode(), limit=2)] == ['Game', 'Game DLC']
+    try:
+        parse_torznab(xml + '<item><title>Cut')
+    except TorznabParseError as e:
+        assert len(e.results) == 3
+    else:
+        raise AssertionError('truncated feed parsed without error')
+
+
+def test_slow_indexer_does_not_delay_the_others():
+    jackett_search_cache.clear()
+    server = start_stub(slow_delay=2)
+    try:
+        client = JackettClient(server.url, 'key')
+        started = time.monotonic()
+        answers = []
+        for indexer, success, results in client.search_indexers('game', timeout=0.5):
+            answers.append((indexer['id'], success, time.monotonic() - started))
+        # the indexer still sending its feed does not hold the search past its timeout
+        assert time.monotonic() - started < 1
+        by_indexer = {indexer_id: (success, elapsed) for indexer_id, success, elapsed in answers}
+        assert by_indexer['fast'][0] and by_indexer['other'][0]
+        assert not by_indexer['slow'][0] and not by_indexer['broken'][0]
+        assert not by_indexer['truncated'][0] and not by_indexer['trickle'][0]
+        # answered while the slow indexer was still searching
+        assert by_indexer['fast'][1] < 0.5 and by_indexer['other'][1] < 0.5
+        assert {indexer_id for indexer_id, _, _ in answers[-2:]} == {'slow', 'trickle'}
+
+        success, results = client.search_all_indexers('game', timeout=0.5)
+        assert success
+        by_hash = {result['key']: result for result in results}
+        assert sorted(by_hash) == [HASH, 'd' * 40]
+        assert by_hash[HASH]['seeders'] == 9 and by_hash[HASH]['indexer'] == 'Other'
+        # fast and other answers came from the cache, failed searches are retried
+        assert server.searches.count('fast') == 1 and server.searches.count('broken') == 2
+        # partial results of a truncated feed are neither merged nor cached
+        assert server.searches.count('truncated') == 2
+    finally:
+        jackett_search_cache.clear()
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    test_info_hash_and_merge()
+    test_parse_torznab()
+    test_slow_indexer_does_not_delay_the_others()
+    print('Indexers are searched concurrently and their results merged.')
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Test the background job queue"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from flask import Flask
+
+import jobs
+from db import db
+from jobs import JobManager, JobCancelled, get_job, fail_interrupted_jobs
+
+jobs.PROGRESS_INTERVAL = 0
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def wait_for(app, job_id, statuses=('completed', 'failed', 'cancelled'), timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with app.app_context():
+            job = get_job(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} is still {job["status"]}')
+
+
+def test_jobs_of_a_library_run_in_order():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        manager = JobManager(app, workers=2, lock_dir=os.path.join(tmpdir, 'locks'))
+        started = threading.Event()
+        release = threading.Event()
+        running = []
+        overlaps = []
+
+        def work(name, job):
+            running.append(name)
+            if len(running) > 1:
+                overlaps.append(list(running))
+            started.set()
+            # the first job holds the library until the duplicate is submitted
+            assert release.wait(5)
+            running.remove(name)
+            return {'name': name}
+
+        try:
+            with app.app_context():
+                first = manager.submit('scan', lambda job: work('first', job), ['/games'])
+                assert started.wait(5)
+                second = manager.submit('scan', lambda job: work('second', job), ['/games'])
+                # merged into the queued scan
+                assert manager.submit('scan', lambda job: work('third', job), ['/games'], unique=True) == second
+            release.set()
+            assert wait_for(app, first)['result'] == {'name': 'first'}
+            job = wait_for(app, second)
+            assert job['status'] == 'completed' and job['libraries'] == ['/games']
+            assert not overlaps
+        finally:
+            release.set()
+            manager.stop()
+
+
+def test_cancel_and_failure():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        manager = JobManager(app, workers=1, lock_dir=os.path.join(tmpdir, 'locks'))
+        started = threading.Event()
+
+        def long_job(job):
+            started.set()
+            for n in range(1000):
+                job.update(n, 1000)
+                time.sleep(0.01)
+
+        def failing_job(job):
+            raise ValueError('broken')
+
+        try:
+            with app.app_context():
+                running_id = manager.submit('organize', long_job, ['/games'])
+                queued_id = manager.submit('organize', long_job, ['/games'])
+                assert started.wait(5)
+                assert manager.cancel(queued_id)
+                assert manager.cancel(running_id)
+            job = wait_for(app, running_id)
+            assert job['status'] == 'cancelled' and 0 < job['total'] == 1000
+            assert wait_for(app, queued_id)['status'] == 'cancelled'
+
+            with app.app_context():
+                failing_id = manager.submit('delete_duplicates', failing_job, [])
+            job = wait_for(app, failing_id)
+            assert job['status'] == 'failed' and job['error'] == 'broken'
+            with app.app_context():
+                assert not manager.cancel(failing_id)
+        finally:
+            manager.stop()
+
+
+def test_interrupted_jobs_are_failed():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        # a job whose libraries are locked by another process stays queued
+        manager = JobManager(app, workers=1, lock_dir=os.path.join(tmpdir, 'locks'))
+        os.makedirs(manager.lock_dir)
+        lock = manager._get_lock('/games')
+        lock.acquire()
+        try:
+            with app.app_context():
+                job_id = manager.submit('scan', lambda job: None, ['/games'])
+                time.sleep(0.1)
+                assert get_job(job_id)['status'] == 'queued'
+                with db.engine.begin() as connection:
+                    fail_interrupted_jobs(connection)
+                assert get_job(job_id)['status'] == 'failed'
+        finally:
+            manager.stop()
+            lock.release()
+
+
+if __name__ == '__main__':
+    test_jobs_of_a_library_run_in_order()
+    test_cancel_and_failure()
+    test_interrupted_jobs_are_failed()
+    print('Jobs run one at a time per library, and can be cancelled.')
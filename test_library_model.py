@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Test that the incremental library model stays consistent with a full rebuild"""
+
+import os
+import sys
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from flask import Flask
+
+import titles
+from constants import APP_TYPE_BASE, APP_TYPE_UPD, APP_TYPE_DLC
+from db import db, add_to_titles_db, update_file_path, delete_file_by_filepath
+import multiworker
+from library import LibraryModel
+from multiworker import SharedChangeLog
+
+LIBRARY = '/games'
+
+# Two games: the first one has one update and one DLC, the second one has nothing
+BASE_A, UPDATE_A, DLC_A = '0100000000010000', '0100000000010800', '0100000000011001'
+BASE_B = '0100000000020000'
+
+
+def load_test_titledb():
+    titles_db = {
+        '1': {'id': BASE_A, 'name': 'Game A', 'bannerUrl': '', 'iconUrl': '', 'category': []},
+        '2': {'id': DLC_A, 'name': 'Game A DLC', 'bannerUrl': '', 'iconUrl': '', 'category': []},
+        '3': {'id': BASE_B, 'name': 'Game B', 'bannerUrl': '', 'iconUrl': '', 'category': []},
+    }
+    cnmts_db = {
+        UPDATE_A.lower(): {'65536': {'titleType': 129, 'otherApplicationId': BASE_A.lower()}},
+        DLC_A.lower(): {'0': {'titleType': 130, 'otherApplicationId': BASE_A.lower()}},
+    }
+    versions_db = {BASE_A.lower(): {'65536': '2020-01-01'}}
+    titles.titles_db = titles_db
+    titles.cnmts_db = cnmts_db
+    titles.versions_db = versions_db
+    titles.versions_txt_db = {}
+    titles.titles_index = titles.build_titles_index(titles_db)
+    titles.dlcs_by_title = titles.build_dlcs_index(cnmts_db)
+    titles.versions_by_title = titles.build_versions_index(versions_db)
+
+
+def file_info(title_id, app_id, app_type, version, folder='/'):
+    filename = f'{app_id}[v{version}].nsp'
+    filedir = os.path.join(LIBRARY, folder.strip('/'))
+    return {
+        'filepath': os.path.join(filedir, filename),
+        'filedir': filedir,
+        'filename': filename,
+        'title_id': title_id,
+        'app_id': app_id,
+        'type': app_type,
+        'version': version,
+        'extension': 'nsp',
+        'size': 1024,
+        'identification': 'filename',
+    }
+
+
+def assert_consistent(model):
+    differences = model.check_consistency()
+    assert not differences, differences
+
+
+def test_incremental_updates_match_full_rebuild():
+    load_test_titledb()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmpdir, 'test.db')
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            model = LibraryModel()
+
+            # initial library with the base game only
+            base_a = file_info(BASE_A, BASE_A, APP_TYPE_BASE, 0)
+            model.invalidate(add_to_titles_db(LIBRARY, base_a))
+            assert_consistent(model)
+            assert model.refresh()[0]['has_latest_version'] is False
+
+            # adding the update and the DLC only touches game A
+            model.invalidate(add_to_titles_db(LIBRARY, file_info(BASE_A, UPDATE_A, APP_TYPE_UPD, 65536)))
+            model.invalidate(add_to_titles_db(LIBRARY, file_info(BASE_A, DLC_A, APP_TYPE_DLC, 0)))
+            model.invalidate(add_to_titles_db(LIBRARY, file_info(BASE_B, BASE_B, APP_TYPE_BASE, 0)))
+            assert model.dirty_titles == {BASE_A, BASE_B}
+            assert_consistent(model)
+            entry_a = [e for e in model.refresh() if e['app_id'] == BASE_A][0]
+            assert entry_a['has_latest_version'] is True
+            assert entry_a['has_all_dlcs'] is True
+
+            # moving a file
+            moved = os.path.join(LIBRARY, 'Game A', base_a['filename'])
+            model.invalidate([update_file_path(LIBRARY, base_a['filepath'], moved)])
+            assert_consistent(model)
+            assert [e['filepath'] for e in model.refresh() if e['app_id'] == BASE_A] == [moved]
+
+            # deleting the DLC
+            dlc_path = file_info(BASE_A, DLC_A, APP_TYPE_DLC, 0)['filepath']
+            model.invalidate([delete_file_by_filepath(dlc_path)])
+            assert model.dirty_titles == {BASE_A}
+            assert_consistent(model)
+            entry_a = [e for e in model.refresh() if e['app_id'] == BASE_A][0]
+            assert entry_a['has_all_dlcs'] is False
+            assert len(model.refresh()) == 2
+
+
+def test_changes_of_other_workers_are_applied_incrementally():
+    load_test_titledb()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmpdir, 'test.db')
+        db.init_app(app)
+        changes_path = os.path.join(tmpdir, 'library.changes')
+        with app.app_context():
+            db.create_all()
+            # models of two worker processes
+            writer, reader = LibraryModel(), LibraryModel()
+            writer.shared_changes = SharedChangeLog(changes_path, owner='writer')
+            reader.shared_changes = SharedChangeLog(changes_path, owner='reader')
+            writer.invalidate(add_to_titles_db(LIBRARY, file_info(BASE_A, BASE_A, APP_TYPE_BASE, 0)))
+            assert reader.sync() and reader.dirty_titles == {BASE_A}
+            reader.refresh()
+            assert not writer.sync() and not reader.sync()
+
+            writer.invalidate(add_to_titles_db(LIBRARY, file_info(BASE_B, BASE_B, APP_TYPE_BASE, 0)))
+            writer.invalidate(add_to_titles_db(LIBRARY, file_info(BASE_A, UPDATE_A, APP_TYPE_UPD, 65536)))
+            # only the titles touched by the other worker are updated
+            assert reader.sync() and not reader.needs_full_rebuild
+            assert reader.dirty_titles == {BASE_A, BASE_B}
+            assert_consistent(reader)
+            assert not writer.sync()
+
+            writer.invalidate()
+            assert reader.sync() and reader.needs_full_rebuild
+            assert_consistent(reader)
+
+            # a log started over means everything may have changed
+            size_limit = multiworker.CHANGE_LOG_MAX_SIZE
+            multiworker.CHANGE_LOG_MAX_SIZE = os.path.getsize(changes_path)
+            try:
+                writer.invalidate([BASE_B])
+            finally:
+                multiworker.CHANGE_LOG_MAX_SIZE = size_limit
+            assert os.path.getsize(changes_path) == len(f'writer {BASE_B}\n')
+            assert reader.sync() and reader.needs_full_rebuild
+            assert_consistent(reader)
+            assert not reader.sync()
+            # the writer does not rebuild because of its own entry
+            assert not writer.sync()
+            writer.invalidate([BASE_A])
+            assert not writer.sync()
+            assert reader.sync() and reader.dirty_titles == {BASE_A}
+            reader.refresh()
+
+            # unless entries of the other worker were left unread in the old log
+            reader.invalidate([BASE_B])
+            multiworker.CHANGE_LOG_MAX_SIZE = os.path.getsize(changes_path)
+            try:
+                writer.invalidate([BASE_A])
+            finally:
+                multiworker.CHANGE_LOG_MAX_SIZE = size_limit
+            assert writer.sync() and writer.needs_full_rebuild
+            assert reader.sync() and reader.needs_full_rebuild
+
+
+if __name__ == '__main__':
+    test_incremental_updates_match_full_rebuild()
+    test_changes_of_other_workers_are_applied_incrementally()
+    print('Library model is consistent with full rebuilds.')
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Test the reconciliation of a library scan with the database and the identification cache"""
+
+import os
+import sys
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from flask import Flask
+
+import titles
+from db import db, Files, IdentificationCache
+from library import IdentificationCacheLookup, get_file_stat, scan_library_path
+
+APP_SETTINGS = {
+    'titles': {'valid_keys': False},
+    'library': {'walk_workers': 2, 'identification_workers': 1},
+}
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def write(file_path, data):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as f:
+        f.write(data)
+
+
+class UnreadableDirectories:
+    """os.scandir failing on some directories, like a stale network mount"""
+
+    def __init__(self, *paths):
+        self.paths = paths
+        self.scandir = os.scandir
+
+    def __call__(self, path):
+        if path in self.paths:
+            raise PermissionError(13, 'Permission denied', path)
+        return self.scandir(path)
+
+    def __enter__(self):
+        os.scandir = self
+        return self
+
+    def __exit__(self, *args):
+        os.scandir = self.scandir
+
+
+def library_rows():
+    return {f.filepath: f.size for f in Files.query.all()}
+
+
+def test_unreadable_directories_are_not_removed():
+    titles.cnmts_db = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        library = os.path.join(tmpdir, 'games')
+        removed = os.path.join(library, 'A', 'Game A [0100000000010000][v0].nsp')
+        changed = os.path.join(library, 'B', 'Game B [0100000000020000][v0].nsp')
+        unreadable = os.path.join(library, 'C', 'Game C [0100000000030000][v0].nsp')
+        added = os.path.join(library, 'D', 'Game D [0100000000040000][v0].nsp')
+        for file_path in (removed, changed, unreadable):
+            write(file_path, b'data')
+
+        with app.app_context():
+            assert scan_library_path(APP_SETTINGS, library) == {removed, changed, unreadable}
+            assert library_rows() == {removed: 4, changed: 4, unreadable: 4}
+
+            os.remove(removed)
+            write(changed, b'more data')
+            write(added, b'data')
+            with UnreadableDirectories(os.path.dirname(unreadable)):
+                found_files = scan_library_path(APP_SETTINGS, library)
+            assert found_files == {changed, added}
+            # the files of the directory that failed to list are kept
+            assert library_rows() == {changed: 9, unreadable: 4, added: 4}
+
+            # removed once a scan can list them again, and see they are gone
+            os.remove(unreadable)
+            scan_library_path(APP_SETTINGS, library)
+            assert library_rows() == {changed: 9, added: 4}
+
+
+class FakeCnmtReader:
+    """identify_file_from_cnmt taking the app ID from the filename, counting the files read"""
+
+    def __init__(self):
+        self.read = []
+
+    def __call__(self, filepath):
+        self.read.append(os.path.basename(filepath))
+        return titles.get_app_id_from_filename(filepath), 0, titles.APP_TYPE_BASE
+
+
+def cache_rows():
+    return sorted(os.path.basename(entry.filepath) for entry in IdentificationCache.query.all())
+
+
+def test_identification_cache():
+    titles.cnmts_db = {}
+    app_settings = {'titles': {'valid_keys': True}, 'library': dict(APP_SETTINGS['library'])}
+    keys_loaded, identify_file_from_cnmt = titles.Keys.keys_loaded, titles.identify_file_from_cnmt
+    reader = titles.identify_file_from_cnmt = FakeCnmtReader()
+    titles.Keys.keys_loaded = True
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            app = make_app(os.path.join(tmpdir, 'test.db'))
+            library = os.path.join(tmpdir, 'games')
+            game_a = os.path.join(library, 'Game A [0100000000010000].nsp')
+            game_b = os.path.join(library, 'Game B [0100000000020000].nsp')
+            game_c = os.path.join(library, 'Game C [0100000000030000].nsp')
+            for file_path in (game_a, game_b, game_c):
+                write(file_path, b'data')
+
+            with app.app_context():
+                scan_library_path(app_settings, library)
+                assert sorted(reader.read) == sorted(os.path.basename(p) for p in (game_a, game_b, game_c))
+                reader.read.clear()
+
+                # renamed and moved files reuse their CNMT
+                moved_a = os.path.join(library, 'A', 'Game A.nsp')
+                os.makedirs(os.path.dirname(moved_a))
+                os.rename(game_a, moved_a)
+                # rewritten in place with the same size
+                write(game_b, b'DATA')
+                os.utime(game_b, ns=(0, 10 ** 9))
+                os.remove(game_c)
+                scan_library_path(app_settings, library)
+                assert reader.read == [os.path.basename(game_b)]
+                assert Files.query.filter_by(filepath=moved_a).one().app_id == '0100000000010000'
+                # the entry of the deleted file is pruned
+                assert cache_rows() == ['Game A.nsp', os.path.basename(game_b)]
+
+                # an unchanged library reads nothing
+                reader.read.clear()
+                scan_library_path(app_settings, library)
+                assert reader.read == []
+
+                # the same size, mtime and inode with other contents
+                file_stat = get_file_stat(game_b)
+                write(game_b, b'Data')
+                os.utime(game_b, ns=(0, file_stat[1]))
+                assert get_file_stat(game_b) == file_stat
+                assert IdentificationCacheLookup().get(game_b, file_stat) is not None
+                partial_hash_cache = IdentificationCacheLookup(use_partial_hash=True)
+                partial_hash_cache.add(game_b, file_stat, ('0100000000020000', 0, titles.APP_TYPE_BASE))
+                db.session.commit()
+                assert partial_hash_cache.get(game_b, file_stat) is not None
+                write(game_b, b'dATA')
+                os.utime(game_b, ns=(0, file_stat[1]))
+                assert IdentificationCacheLookup(use_partial_hash=True).get(game_b, file_stat) is None
+    finally:
+        titles.Keys.keys_loaded, titles.identify_file_from_cnmt = keys_loaded, identify_file_from_cnmt
+
+
+if __name__ == '__main__':
+    test_unreadable_directories_are_not_removed()
+    test_identification_cache()
+    print('Library scans only remove the files they could see are gone, and reuse identifications.')
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Test the batch planner fetching missing content"""
+
+import os
+import sys
+import threading
+import time
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from planner import plan_missing_downloads, clean_search_name
+
+MISSING = {
+    'missing_base': [{'title_id': '0100000000010000', 'name': 'Game™: One'}],
+    'missing_updates': [
+        {'title_id': '0100000000020000', 'name': 'Game Two', 'latest_version': 65536},
+        {'title_id': '0100000000030000', 'name': 'Game Three', 'latest_version': 131072},
+    ],
+    'missing_dlc': [
+        {'title_id': '0100000000040000', 'name': 'Game Four', 'missing_dlcs': [{'app_id': '0100000000041001', 'name': 'Pack'}]},
+        {'title_id': '0100000000050000', 'name': 'Game Five', 'missing_dlcs': [{'app_id': '0100000000051001', 'name': 'Pack'}]},
+    ],
+}
+
+
+def result(title, seeders, info_hash, size=1024):
+    return {'title': title, 'link': '', 'size': size, 'seeders': seeders, 'indexer': 'Test',
+            'magnet_link': f'magnet:?xt=urn:btih:{info_hash}', 'info_hash': info_hash}
+
+
+SEARCHES = {
+    'Game One': (True, [
+        result('Game One NSP', 50, 'a' * 40),
+        result('Game One [0100000000010000] NSP', 5, 'b' * 40),
+    ]),
+    'Game Two update': (True, [result('Game Two Update v65536 NSP', 10, 'c' * 40)]),
+    'Game Three update': (True, [result('Game Three Update', 0, 'd' * 40)]),
+    'Game Four DLC': (True, [result('Game Four + Five DLC bundle', 20, 'e' * 40)]),
+    'Game Five DLC': (True, [result('Game Four + Five DLC bundle', 20, 'e' * 40)]),
+}
+
+
+class FakeSearch:
+    """Jackett search function counting concurrent calls"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.queries = []
+
+    def __call__(self, query):
+        with self.lock:
+            self.queries.append(query)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return SEARCHES.get(query, (False, 'Search failed: 500'))
+
+
+class FakeQBittorrent:
+    def __init__(self, existing=()):
+        self.existing = existing
+        self.added = []
+
+    def sync_torrents(self, category=None):
+        return True, [{'hash': info_hash} for info_hash in self.existing]
+
+    def add_torrent(self, urls, category=None, save_path=None):
+        self.added.append(urls)
+        return True, 'Torrent added successfully', None
+
+
+def test_missing_content_is_queued_in_one_request():
+    search = FakeSearch()
+    qbit_client = FakeQBittorrent(existing=['C' * 40])
+    progress = []
+    report = plan_missing_downloads(MISSING, search, qbit_client, {'category': 'switch'}, workers=2,
+                                    progress_callback=lambda done, total, message: progress.append((done, total)))
+
+    assert sorted(search.queries) == sorted(SEARCHES)
+    assert search.max_running == 2
+    assert progress[0] == (0, 5) and progress[-1] == (5, 5)
+
+    items = {item['title_id']: item for item in report['items']}
+    # torrents naming the title ID come first
+    assert items['0100000000010000']['torrent']['info_hash'] == 'b' * 40
+    assert items['0100000000020000']['status'] == 'already_queued'
+    assert items['0100000000030000']['status'] == 'not_found'
+    assert items['0100000000040000']['status'] == items['0100000000050000']['status'] == 'queued'
+    assert report['summary'] == {'queued': 3, 'already_queued': 1, 'not_found': 1}
+
+    # a single request, the bundle chosen for two titles is sent once
+    [urls] = qbit_client.added
+    assert urls.split('\n') == [f'magnet:?xt=urn:btih:{"b" * 40}', f'magnet:?xt=urn:btih:{"e" * 40}']
+    assert report['torrents'] == 2 and not report['dry_run']
+
+
+def test_preview_adds_nothing():
+    report = plan_missing_downloads(MISSING, FakeSearch(), search_types=['base'], min_seeders=0)
+    [item] = report['items']
+    assert report['dry_run'] and item['status'] == 'planned' and item['query'] == 'Game One'
+    assert clean_search_name('Game™:  “One”') == 'Game "One"'
+
+
+if __name__ == '__main__':
+    test_missing_content_is_queued_in_one_request()
+    test_preview_adds_nothing()
+    print('Missing content is searched concurrently and queued in one request.')
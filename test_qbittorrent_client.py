@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Test the qBittorrent client against a local stub of the Web API"""
+
+import copy
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from automation import get_qbittorrent_client
+
+
+class StubQBittorrent(ThreadingHTTPServer):
+    """qBittorrent Web API subset: login, torrents/add and sync/maindata"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.logins = 0
+        self.connections = set()
+        self.sessions = set()
+        self.torrents = {}
+        # torrents by rid, as last sent to the client
+        self.snapshots = {}
+        self.rid = 0
+        self.requests = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def maindata(self, rid):
+        if rid not in self.snapshots:
+            data = {'full_update': True, 'torrents': copy.deepcopy(self.torrents)}
+        else:
+            previous = self.snapshots[rid]
+            data = {
+                'torrents': {
+                    torrent_hash: {k: v for k, v in torrent.items() if previous.get(torrent_hash, {}).get(k) != v}
+                    for torrent_hash, torrent in self.torrents.items()
+                    if previous.get(torrent_hash) != torrent
+                },
+                'torrents_removed': [torrent_hash for torrent_hash in previous if torrent_hash not in self.torrents],
+            }
+        self.rid += 1
+        self.snapshots[self.rid] = copy.deepcopy(self.torrents)
+        data['rid'] = self.rid
+        return data
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body, headers=()):
+        body = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authenticated(self):
+        cookies = dict(c.strip().split('=', 1) for c in self.headers.get('Cookie', '').split(';') if '=' in c)
+        return cookies.get('SID') in self.server.sessions
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        url = urlparse(self.path)
+        self.server.requests.append(url.path)
+        if not self.authenticated():
+            return self.send(403, 'Forbidden')
+        if url.path == '/api/v2/sync/maindata':
+            rid = int(parse_qs(url.query).get('rid', ['0'])[0])
+            return self.send(200, self.server.maindata(rid))
+        self.send(404, 'Not found')
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        url = urlparse(self.path)
+        self.server.requests.append(url.path)
+        form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+        if url.path == '/api/v2/auth/login':
+            if form.get('password') != ['secret']:
+                return self.send(200, 'Fails.')
+            self.server.logins += 1
+            sid = f'sid{self.server.logins}'
+            self.server.sessions.add(sid)
+            return self.send(200, 'Ok.', [('Set-Cookie', f'SID={sid}; path=/')])
+        if not self.authenticated():
+            return self.send(403, 'Forbidden')
+        if url.path == '/api/v2/torrents/add':
+            return self.send(200, 'Ok.')
+        self.send(404, 'Not found')
+
+
+def start_stub():
+    server = StubQBittorrent()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_client_reuses_its_session():
+    server = start_stub()
+    try:
+        client = get_qbittorrent_client(server.url, 'admin', 'secret')
+        assert get_qbittorrent_client(server.url + '/', 'admin', 'secret') is client
+
+        magnet = 'magnet:?xt=urn:btih:' + 'a' * 40
+        for _ in range(3):
+            assert client.add_torrent(magnet, category='switch')[0]
+        assert server.logins == 1
+        assert len(server.connections) == 1
+
+        # expired session, logs in again once
+        server.sessions.clear()
+        assert client.add_torrent(magnet)[0]
+        assert client.add_torrent(magnet)[0]
+        assert server.logins == 2
+
+        # a changed configuration gets a new client
+        assert get_qbittorrent_client(server.url, 'admin', 'other') is not client
+        success, message, _ = get_qbittorrent_client(server.url, 'admin', 'other').add_torrent(magnet)
+        assert not success and 'authenticate' in message
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_sync_applies_deltas():
+    server = start_stub()
+    try:
+        client = get_qbittorrent_client(server.url, 'admin', 'secret')
+        server.torrents = {
+            'a': {'name': 'Game A', 'category': 'switch', 'progress': 0.1, 'dlspeed': 100},
+            'b': {'name': 'Game B', 'category': 'switch', 'progress': 0.5, 'dlspeed': 200},
+            'c': {'name': 'Movie', 'category': 'other', 'progress': 0.2, 'dlspeed': 300},
+        }
+        success, torrents = client.sync_torrents(category='switch')
+        assert success and sorted(t['hash'] for t in torrents) == ['a', 'b']
+
+        server.torrents['a']['progress'] = 0.3
+        del server.torrents['b']
+        server.torrents['d'] = {'name': 'Game D', 'category': 'switch', 'progress': 0, 'dlspeed': 0}
+        success, torrents = client.sync_torrents(category='switch')
+        by_hash = {t['hash']: t for t in torrents}
+        assert sorted(by_hash) == ['a', 'd']
+        # unchanged fields are kept from the previous updates
+        assert by_hash['a'] == {'hash': 'a', 'name': 'Game A', 'category': 'switch', 'progress': 0.3, 'dlspeed': 100}
+        assert server.requests.count('/api/v2/sync/maindata') == 2
+
+        # qBittorrent restarted, the old rid is unknown and a full update is sent
+        server.snapshots.clear()
+        server.sessions.clear()
+        success, torrents = client.sync_torrents()
+        assert success and sorted(t['hash'] for t in torrents) == ['a', 'c', 'd']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    test_client_reuses_its_session()
+    test_sync_applies_deltas()
+    print('qBittorrent sessions are reused and torrents are synced incrementally.')
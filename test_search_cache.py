@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Test the cache of Jackett search results"""
+
+import os
+import sys
+import threading
+import time
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from automation import SearchCache
+
+
+class SlowSearch:
+    """Search function counting its calls"""
+
+    def __init__(self, delay=0.0, success=True):
+        self.delay = delay
+        self.success = success
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if not self.success:
+            return False, 'Search failed: 500'
+        return True, [{'title': f'Result {self.calls}', 'seeders': 1}]
+
+
+def test_fresh_and_stale_results():
+    cache = SearchCache(ttl=0.2, stale_ttl=0.5)
+    search = SlowSearch()
+    assert cache.get(('zelda',), search) == (True, [{'title': 'Result 1', 'seeders': 1}])
+
+    # results are copies, callers can score them
+    success, results = cache.get(('zelda',), search)
+    results[0]['relevance'] = 2.0
+    assert cache.get(('zelda',), search)[1] == [{'title': 'Result 1', 'seeders': 1}]
+    assert search.calls == 1
+
+    # stale results are returned right away and refreshed in the background
+    time.sleep(0.25)
+    assert cache.get(('zelda',), search)[1][0]['title'] == 'Result 1'
+    time.sleep(0.1)
+    assert search.calls == 2
+    assert cache.get(('zelda',), search)[1][0]['title'] == 'Result 2'
+
+    # expired results are searched again
+    time.sleep(0.8)
+    assert cache.get(('zelda',), search)[1][0]['title'] == 'Result 3'
+
+    # failures are not cached
+    failing = SlowSearch(success=False)
+    assert cache.get(('mario',), failing) == (False, 'Search failed: 500')
+    assert cache.get(('mario',), failing) == (False, 'Search failed: 500')
+    assert failing.calls == 2
+
+
+def test_identical_searches_are_sent_once():
+    cache = SearchCache(ttl=60, stale_ttl=60)
+    search = SlowSearch(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(('metroid',), search))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert search.calls == 1
+    assert results == [(True, [{'title': 'Result 1', 'seeders': 1}])] * 8
+
+
+if __name__ == '__main__':
+    test_fresh_and_stale_results()
+    test_identical_searches_are_sent_once()
+    print('Search results are cached and identical searches are sent once.')
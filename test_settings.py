@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Test the in-memory settings store and its reload on file changes"""
+
+import os
+import sys
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+import yaml
+
+import settings
+from settings import load_settings, load_settings_copy, save_settings, set_titles_settings
+
+
+def fake_load_keys():
+    # valid when the keys file holds a key
+    try:
+        with open(settings.KEYS_FILE) as keys_file:
+            return bool(keys_file.read().strip())
+    except OSError:
+        return False
+
+
+def edit_file(path, content):
+    stat = os.stat(path) if os.path.exists(path) else None
+    with open(path, 'w') as f:
+        f.write(content)
+    if stat is not None:
+        # a newer mtime even on filesystems with a coarse resolution
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_settings_store():
+    config_file, keys_file, load_keys = settings.CONFIG_FILE, settings.KEYS_FILE, settings.load_keys
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings.CONFIG_FILE = os.path.join(tmpdir, 'settings.yaml')
+        settings.KEYS_FILE = os.path.join(tmpdir, 'keys.txt')
+        settings.load_keys = fake_load_keys
+        settings.settings_store.invalidate()
+        try:
+            # defaults are written on first load, then served from memory
+            current = load_settings()
+            assert os.path.isfile(settings.CONFIG_FILE)
+            assert current['titles']['valid_keys'] is False
+            assert load_settings() is current
+
+            # edits of settings.yaml on disk are picked up
+            with open(settings.CONFIG_FILE) as yaml_file:
+                on_disk = yaml.safe_load(yaml_file)
+            on_disk['shop']['motd'] = 'Edited on disk'
+            edit_file(settings.CONFIG_FILE, yaml.dump(on_disk))
+            current = load_settings()
+            assert current['shop']['motd'] == 'Edited on disk'
+            assert load_settings() is current
+
+            # so are new keys
+            edit_file(settings.KEYS_FILE, 'header_key = 00\n')
+            current = load_settings()
+            assert current['titles']['valid_keys'] is True
+            assert load_settings() is current
+
+            # saving invalidates the store, even when size and mtime look unchanged
+            edited = load_settings_copy()
+            edited['shop']['motd'] = 'Saved on disk!'
+            stat = os.stat(settings.CONFIG_FILE)
+            signature = settings.get_settings_signature()
+            save_settings(edited)
+            os.utime(settings.CONFIG_FILE, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            assert settings.get_settings_signature() == signature
+            assert load_settings()['shop']['motd'] == 'Saved on disk!'
+
+            set_titles_settings('JP', 'ja')
+            assert load_settings()['titles']['region'] == 'JP'
+            assert load_settings()['titles']['language'] == 'ja'
+
+            # copies can be modified without changing the shared settings
+            current = load_settings()
+            copy = load_settings_copy()
+            assert copy == current and copy is not current
+            copy['shop']['motd'] = 'Not saved'
+            copy['library']['paths'].append('/not/saved')
+            assert load_settings() is current
+            assert current['shop']['motd'] == 'Saved on disk!'
+            assert '/not/saved' not in current['library']['paths']
+            assert load_settings_copy()['shop'] is not copy['shop']
+        finally:
+            settings.CONFIG_FILE, settings.KEYS_FILE, settings.load_keys = config_file, keys_file, load_keys
+            settings.settings_store.invalidate()
+
+
+if __name__ == '__main__':
+    test_settings_store()
+    print('Settings are reloaded only when their files change or are saved.')
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Test the cached shop payload and its ETag"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from flask import Flask, Response, request
+
+import shop as shop_module
+from db import db, Files
+from shop import get_shop_payload
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def add_file(n):
+    title_id = f'01000000000{n:02d}000'
+    db.session.add(Files(
+        filepath=f'/games/Game {n} [{title_id}][v0].nsp',
+        library='/games',
+        folder='/games',
+        filename=f'Game {n} [{title_id}][v0].nsp',
+        title_id=title_id,
+        app_id=title_id,
+        version='0',
+        extension='nsp',
+        size=1024 * (n + 1),
+    ))
+    db.session.commit()
+
+
+def reset_shop_cache():
+    shop_module.shop_cache.clear()
+    shop_module.shop_files_cache = (None, None)
+
+
+def test_shop_payload_cache():
+    reset_shop_cache()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        with app.app_context():
+            add_file(0)
+            shop = {'success': 'Welcome'}
+
+            payload, etag = get_shop_payload(db, 1, shop, False)
+            assert len(json.loads(payload)['files']) == 1
+            assert etag == hashlib.sha256(payload).hexdigest()
+
+            # encryption is randomized, identical bytes come from the cache
+            encrypted, encrypted_etag = get_shop_payload(db, 1, shop, True)
+            assert encrypted.startswith(b'TINFOIL')
+            assert encrypted_etag == etag + '-encrypted'
+            assert get_shop_payload(db, 1, shop, True) == (encrypted, encrypted_etag)
+            assert get_shop_payload(db, 1, shop, False) == (payload, etag)
+
+            # a new file is only served once the library generation changes
+            add_file(1)
+            assert get_shop_payload(db, 1, shop, False) == (payload, etag)
+            new_payload, new_etag = get_shop_payload(db, 2, shop, False)
+            assert len(json.loads(new_payload)['files']) == 2
+            assert new_etag != etag
+            new_encrypted, new_encrypted_etag = get_shop_payload(db, 2, shop, True)
+            assert new_encrypted != encrypted
+            assert new_encrypted_etag == new_etag + '-encrypted'
+
+            # changed shop settings give a new payload
+            motd_payload, motd_etag = get_shop_payload(db, 2, {'success': 'Hello'}, False)
+            assert json.loads(motd_payload)['success'] == 'Hello'
+            assert motd_etag != new_etag
+            referrer_payload, referrer_etag = get_shop_payload(db, 2, dict(shop, referrer='https://shop.example'), False)
+            assert json.loads(referrer_payload)['referrer'] == 'https://shop.example'
+            assert referrer_etag not in (new_etag, motd_etag)
+            assert get_shop_payload(db, 2, shop, False) == (new_payload, new_etag)
+
+
+def test_shop_not_modified():
+    reset_shop_cache()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = make_app(os.path.join(tmpdir, 'test.db'))
+        state = {'generation': 1, 'encrypt': False}
+
+        # same response as the Tinfoil shop endpoint
+        @app.route('/')
+        def index():
+            encrypt = state['encrypt']
+            payload, etag = get_shop_payload(db, state['generation'], {'success': 'Welcome'}, encrypt)
+            response = Response(payload, mimetype='application/octet-stream' if encrypt else 'application/json')
+            response.set_etag(etag)
+            return response.make_conditional(request)
+
+        with app.app_context():
+            add_file(0)
+        client = app.test_client()
+
+        response = client.get('/')
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        response = client.get('/', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+
+        # the ETag no longer matches after a library change or with encryption enabled
+        with app.app_context():
+            add_file(1)
+        state['generation'] = 2
+        response = client.get('/', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert len(json.loads(response.data)['files']) == 2
+        etag = response.headers['ETag']
+
+        state['encrypt'] = True
+        response = client.get('/', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.data.startswith(b'TINFOIL')
+        response = client.get('/', headers={'If-None-Match': response.headers['ETag']})
+        assert response.status_code == 304
+
+
+if __name__ == '__main__':
+    test_shop_payload_cache()
+    test_shop_not_modified()
+    print('Shop payloads are cached per library generation and settings.')